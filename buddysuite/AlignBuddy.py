@@ -41,7 +41,7 @@ except ImportError:
 # Standard library
 import sys
 import os
-from copy import deepcopy
+from copy import copy, deepcopy
 from io import StringIO, TextIOWrapper
 import random
 import re
@@ -51,6 +51,7 @@ from subprocess import Popen, PIPE, CalledProcessError
 from math import log, ceil
 
 # Third party
+import numpy as np
 from Bio import AlignIO
 from Bio.Align import MultipleSeqAlignment
 from Bio.Seq import Seq
@@ -70,6 +71,7 @@ from Bio.Nexus.Nexus import NexusError
 
 # ################################################ GLOBALS ###################################################### #
 GAP_CHARS = ["-", ".", " "]
+SINGLE_ALIGNMENT_FORMATS = ["fasta", "gb", "genbank", "nexus"]  # Formats that can only hold one alignment per file
 VERSION = br.Version("AlignBuddy", 1, "2.2", br.contributors, {"year": 2016, "month": 12, "day": 14})
 
 
@@ -117,19 +119,22 @@ class AlignBuddy(object):
         if self.in_format == "empty file":
             raise br.GuessError("Empty file")
 
-        if not self.in_format:
+        def guess_error():
             if in_file:
-                raise br.GuessError("Could not determine format from _input file '%s'.\n"
-                                    "Try explicitly setting with -f flag." % in_file)
+                return br.GuessError("Could not determine format from _input file '%s'.\n"
+                                     "Try explicitly setting with -f flag." % in_file)
             elif raw_seq:
-                raise br.GuessError("Could not determine format from raw input\n --> %s ...\n"
-                                    "Try explicitly setting with -f flag." % str(raw_seq)[:50])
+                return br.GuessError("Could not determine format from raw input\n --> %s ...\n"
+                                     "Try explicitly setting with -f flag." % str(raw_seq)[:50])
             elif in_handle:
-                raise br.GuessError("Could not determine format from input file-like object\n"
-                                    "Try explicitly setting with -f flag.")
+                return br.GuessError("Could not determine format from input file-like object\n"
+                                     "Try explicitly setting with -f flag.")
             else:  # This should be unreachable.
-                raise br.GuessError("Unable to determine format or input type. "
-                                    "Please check how AlignBuddy is being called.")
+                return br.GuessError("Unable to determine format or input type. "
+                                     "Please check how AlignBuddy is being called.")
+
+        if not self.in_format:
+            raise guess_error()
 
         self.out_format = self.in_format if not out_format else br.parse_format(out_format)
         # ####  ALIGNMENTS  #### #
@@ -144,22 +149,25 @@ class AlignBuddy(object):
                     raise TypeError("Seqlist is not populated with SeqRecords.")
             alignments = _input
 
-        elif str(type(_input)) == "<class '_io.TextIOWrapper'>" or isinstance(_input, StringIO):
-            if self.in_format == "phylipss":
-                alignments = list(br.phylip_sequential_read(_input.read(), relaxed=False))
-            elif self.in_format == "phylipsr":
-                alignments = list(br.phylip_sequential_read(_input.read()))
-            else:
-                alignments = list(AlignIO.parse(_input, self.in_format))
-
-        elif os.path.isfile(_input):
-            with open(_input, "r", encoding='utf-8') as _input:
+        elif str(type(_input)) == "<class '_io.TextIOWrapper'>" or isinstance(_input, StringIO) \
+                or os.path.isfile(_input):
+            ifile = _input if not isinstance(_input, str) else open(_input, "r", encoding="utf-8")
+            try:
                 if self.in_format == "phylipss":
-                    alignments = list(br.phylip_sequential_read(_input.read(), relaxed=False))
+                    alignments = list(br.phylip_sequential_read(ifile.read(), relaxed=False))
                 elif self.in_format == "phylipsr":
-                    alignments = list(br.phylip_sequential_read(_input.read()))
+                    alignments = list(br.phylip_sequential_read(ifile.read()))
                 else:
-                    alignments = list(AlignIO.parse(_input, self.in_format))
+                    alignments = list(AlignIO.parse(ifile, self.in_format))
+            except (br.PhylipError, NexusError, ValueError):
+                # guess_format() only trial parses the start of the file, so a problem further in means the guess was
+                # wrong (e.g., unaligned sequences that looked like an alignment up to that point)
+                if in_format:
+                    raise
+                raise guess_error()
+            finally:
+                if ifile is not _input:
+                    ifile.close()
 
         else:  # May be unreachable
             alignments = None
@@ -173,6 +181,11 @@ class AlignBuddy(object):
         self.memory_footprint = sum([len(rec) for rec in self.records()])
 
     def __str__(self):
+        output = StringIO()
+        self.write(output)
+        return output.getvalue()
+
+    def _write_alignments(self, handle):
         empty_alignments = []
         for indx, alignment in enumerate(self.alignments):
             if not len(alignment):
@@ -182,7 +195,8 @@ class AlignBuddy(object):
             del self.alignments[indx]
 
         if len(self.alignments) == 0:
-            return "AlignBuddy object contains no alignments.\n"
+            handle.write("AlignBuddy object contains no alignments.\n")
+            return
 
         # There is a weird bug in genbank write() that concatenates dots to the organism name (if set).
         # The following is a work around...
@@ -195,39 +209,32 @@ class AlignBuddy(object):
                     pass
 
         self.out_format = self.out_format.lower()
-        multiple_alignments_unsupported = ["fasta", "gb", "genbank", "nexus"]
-        if self.out_format in multiple_alignments_unsupported and len(self.alignments) > 1:
+        if self.out_format in SINGLE_ALIGNMENT_FORMATS and len(self.alignments) > 1:
             raise ValueError("%s format does not support multiple alignments in one file.\n" % self.out_format)
 
+        ofile = br.RstripWriter(handle)
         if self.out_format == "phylipsr":
-            output = br.phylip_sequential_out(self)
+            ofile.write(br.phylip_sequential_out(self))
 
         elif self.out_format == "phylipss":
-            output = br.phylip_sequential_out(self, relaxed=False)
+            ofile.write(br.phylip_sequential_out(self, relaxed=False))
 
         else:
-            tmp_file = br.TempFile()
-            with open(tmp_file.path, "w", encoding="utf-8") as ofile:
-                try:
-                    AlignIO.write(self.alignments, ofile, self.out_format)
-                except ValueError as e:
-                    if "Sequences must all be the same length" in str(e):
-                        br._stderr("Warning: Alignment format detected but sequences are different lengths. "
-                                   "Format changed to fasta to accommodate proper printing of records.\n")
-                        AlignIO.write(self.alignments, ofile, "fasta")
-                    elif "Repeated name" in str(e) and self.out_format == "phylip":
-                        br._stderr("Warning: Phylip format returned a 'repeat name' error, probably due to truncation. "
-                                   "Format changed to phylip-relaxed.\n")
-                        AlignIO.write(self.alignments, ofile, "phylip-relaxed")
-                    else:
-                        raise e
-
-            with open(tmp_file.path, "r", encoding="utf-8") as ifile:
-                output = ifile.read()
-        if self.out_format == "clustal":
-            return "%s\n\n" % output.rstrip()
-        else:
-            return "%s\n" % output.rstrip()
+            try:
+                AlignIO.write(self.alignments, ofile, self.out_format)
+            except ValueError as e:
+                if "Sequences must all be the same length" in str(e):
+                    br._stderr("Warning: Alignment format detected but sequences are different lengths. "
+                               "Format changed to fasta to accommodate proper printing of records.\n")
+                    AlignIO.write(self.alignments, ofile, "fasta")
+                elif "Repeated name" in str(e) and self.out_format == "phylip":
+                    br._stderr("Warning: Phylip format returned a 'repeat name' error, probably due to truncation. "
+                               "Format changed to phylip-relaxed.\n")
+                    AlignIO.write(self.alignments, ofile, "phylip-relaxed")
+                else:
+                    raise e
+        ofile.end("\n\n" if self.out_format == "clustal" else "\n")
+        return
 
     def set_format(self, in_format):
         self.out_format = br.parse_format(in_format)
@@ -255,15 +262,35 @@ class AlignBuddy(object):
         lengths = [alignment.get_alignment_length() for alignment in self.alignments]
         return lengths
 
+    def matrix(self, indx=0):
+        """
+        The residues of one alignment as a read-only uint8 NumPy array (rows x columns). The array is cached on the
+        alignment, and rebuilt if any of its records have been given a new sequence since.
+        :param indx: Index of the alignment in self.alignments
+        :return: numpy.ndarray
+        """
+        return _alignment_matrix(self.alignments[indx])
+
     def write(self, file_path, out_format=None):
-        with open(file_path, "w", encoding="utf-8") as ofile:
+        """
+        Serialize the alignments straight into a file or open handle, without building the whole output in memory first
+        :param file_path: Path to the output file, or a writable text handle (e.g., sys.stdout)
+        :param out_format: Use this format instead of self.out_format
+        :return: None
+        """
+        if out_format:
+            out_format_save = str(self.out_format)
+            self.set_format(out_format)
+
+        try:
+            if type(file_path) == str:
+                with open(file_path, "w", encoding="utf-8") as ofile:
+                    self._write_alignments(ofile)
+            else:
+                self._write_alignments(file_path)
+        finally:
             if out_format:
-                out_format_save = str(self.out_format)
-                self.set_format(out_format)
-                ofile.write(str(self))
                 self.set_format(out_format_save)
-            else:
-                ofile.write(str(self))
         return
 
 
@@ -309,41 +336,29 @@ def guess_format(_input):  # _input can be list, SeqBuddy object, file handle, o
         return _input.in_format
 
     # If input is a handle or path, try to read the file in each format, and assume success if not error and # seqs > 0
+    in_file = None
     if os.path.isfile(str(_input)):
-        _input = open(_input, "r", encoding="utf-8")
+        in_file = _input = open(_input, "r", encoding="utf-8")
 
     if str(type(_input)) == "<class '_io.TextIOWrapper'>" or isinstance(_input, StringIO):
         if not _input.seekable():  # Deal with input streams (e.g., stdout pipes)
             _input = StringIO(_input.read().decode("utf-8"))
-        if _input.read() == "":
-            return "empty file"
-        _input.seek(0)
 
+        def trial_parse(next_format, sample):
+            if next_format in ["phylip", "phylipsr", "phylipss"]:
+                return br.phylip_guess(next_format, sample)
+            if list(AlignIO.parse(sample, next_format)):
+                return br.parse_format(next_format)
+            return None
+
+        # Formats with a matching signature are tried first (see br.sniff_format)
         possible_formats = ["gb", "phylipss", "phylipsr", "phylip", "phylip-relaxed",
                             "stockholm", "fasta", "nexus", "clustal"]
-        for next_format in possible_formats:
-            try:
-                _input.seek(0)
-                if next_format in ["phylip", "phylipsr", "phylipss"]:
-                    phylip = br.phylip_guess(next_format, _input)
-                    if phylip:
-                        return phylip
-                    else:
-                        continue
-
-                if list(AlignIO.parse(_input, next_format)):
-                    _input.seek(0)
-                    return br.parse_format(next_format)
-                else:
-                    continue
-            except br.PhylipError:
-                continue
-            except NexusError:
-                continue
-            except ValueError:
-                continue
-
-        return None  # Unable to determine format from file handle
+        guessed_format = br.trial_parse_formats(_input, possible_formats, trial_parse,
+                                                (br.PhylipError, NexusError, ValueError, AssertionError))
+        if in_file:
+            in_file.close()
+        return guessed_format  # None if unable to determine format from file handle
 
     else:
         raise br.GuessError("Unsupported _input argument in guess_format(). %s" % type(_input))
@@ -358,36 +373,58 @@ def make_copy(alignbuddy):
     return _copy
 
 
+def shallow_copy(alignbuddy):
+    """
+    Cheap alternative to make_copy(). Records are copied with SeqBuddy.shallow_copy() rules, so the sequence strings,
+    feature locations and qualifiers are shared with the original. Use make_copy() if those will be edited in place.
+    :param alignbuddy: AlignBuddy object
+    :return: AlignBuddy object
+    """
+    _copy = copy(alignbuddy)
+    _copy.hash_map = OrderedDict(alignbuddy.hash_map)
+    _copy.alignments = []
+    for alignment in alignbuddy.alignments:
+        alignment_copy = copy(alignment)
+        alignment_copy._records = [Sb._shallow_record(rec) for rec in alignment]
+        _copy.alignments.append(alignment_copy)
+    return _copy
+
+
 class FeatureReMapper(object):
     """
-    Build a list that maps original alignment columns to new positions if columns have been removed
+    Build a map of original alignment columns to new positions if columns have been removed
     This will not work if new columns are being added.
     :usage: Instantiate a new object, and for each column in the original alignment, call the 'extend' method,
-            specifying whether that column exists in the new alignment or not. Remap the features on the new alignment
-            by calling the remap_features method.
+            specifying whether that column exists in the new alignment or not (or pass all of them at once to
+            'extend_many'). Remap the features on the new alignment by calling the remap_features method.
     """
     def __init__(self):
-        self.position_map = []
-        self.starting_position_filled = False
+        self._kept = []
+        self._position_map = None
+
+    @property
+    def position_map(self):
+        """
+        :return: br.PositionMap of everything passed to extend() so far
+        """
+        if self._position_map is None or len(self._position_map) != len(self._kept):
+            self._position_map = br.PositionMap(self._kept)
+        return self._position_map
 
     def extend(self, exists=True):
         """
         Iterates the position map, adding an index and whether the new alignment contains the column.
         :param exists: Specify whether the next column exists or not
         """
-        if not self.position_map:
-            if exists:
-                self.starting_position_filled = True
-            self.position_map.append((0, exists))
+        self._kept.append(bool(exists))
+        return
 
-        else:
-            if exists and not self.starting_position_filled:
-                self.position_map.append((0, True))
-                self.starting_position_filled = True
-            elif exists and self.starting_position_filled:
-                self.position_map.append((self.position_map[-1][0] + 1, True))
-            else:
-                self.position_map.append((self.position_map[-1][0], False))
+    def extend_many(self, kept):
+        """
+        Same as calling extend() on every value in kept
+        :param kept: Iterable of booleans (or a numpy array)
+        """
+        self._kept += np.asarray(kept, dtype=bool).tolist()
         return
 
     def remap_features(self, old_alignment, new_alignment):
@@ -397,51 +434,136 @@ class FeatureReMapper(object):
         :param old_alignment: AlignRecord
         :param new_alignment: AlignRecord
         """
+        position_map = self.position_map
         new_records = list(new_alignment)
         for indx, rec in enumerate(old_alignment):
             new_features = []
             for feature in rec.features:
-                feature = self._remap(feature)
+                feature = position_map.remap_feature(feature)
                 if feature:
                     new_features.append(feature)
             new_records[indx].features = new_features
         return
 
-    def _remap(self, feature):
-        """
-        Deal with the weirdness that is SeqRecord features... Compares old features against self.position_map
-        :param feature: A feature from the old alignment
-        """
-        if type(feature.location) == FeatureLocation:
-            for pos, present in self.position_map[feature.location.start:feature.location.end]:
-                if present:
-                    start = pos
-                    end = self.position_map[feature.location.end - 1][0] + 1
-                    location = FeatureLocation(start, end, strand=feature.location.strand)
-                    feature.location = location
-                    return feature
-            else:
-                return None
-
-        else:  # CompoundLocation
-            parts = []
-            for sub_feature in feature.location.parts:
-                sub_feature = self._remap(SeqFeature(sub_feature))
-                if sub_feature:
-                    parts.append(sub_feature.location)
-            if len(parts) > 1:
-                feature.location = CompoundLocation(parts, operator='order')
-            elif len(parts) == 1:
-                feature.location = FeatureLocation(parts[0].start, parts[0].end, strand=parts[0].strand)
-            else:
-                feature = None
-            return feature
-
     def append_pos_map(self, alignment):
         alignment.position_map = self.position_map
         return
 
 
+def _alignment_matrix(alignment):
+    """
+    Convert a MultipleSeqAlignment into a uint8 array with one row per record and one column per alignment column.
+    The Seq objects the array was built from are kept next to it, so the cache is only reused while they are untouched.
+    :param alignment: MultipleSeqAlignment object
+    :return: Read-only numpy.ndarray
+    """
+    seqs = [rec.seq for rec in alignment]
+    cached = getattr(alignment, "_buddy_matrix", None)
+    if cached and len(cached[0]) == len(seqs) and all(old is new for old, new in zip(cached[0], seqs)):
+        return cached[1]
+
+    if seqs:
+        # One byte per residue, or the rows won't line up with the alignment columns
+        try:
+            matrix = np.frombuffer("".join([str(seq) for seq in seqs]).encode("latin-1"), dtype=np.uint8)
+        except UnicodeEncodeError as err:
+            raise ValueError("Alignment contains a residue that is not a single-byte (latin-1) character: '%s'"
+                             % err.object[err.start:err.end])
+        if len(matrix) != len(seqs) * alignment.get_alignment_length():
+            raise ValueError("Sequences must all be the same length")
+        matrix = matrix.reshape(len(seqs), -1)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.uint8)
+    alignment._buddy_matrix = (seqs, matrix)
+    return matrix
+
+
+def _sub_alignment(alignment, columns):
+    """
+    Build a new alignment from a subset of columns. Gives the same records as concatenating alignment[:, col:col + 1]
+    for each column (i.e., features and annotations are not carried over), but in a single pass over the matrix.
+    :param alignment: MultipleSeqAlignment object
+    :param columns: Boolean mask or array of column indices
+    :return: MultipleSeqAlignment object
+    """
+    columns = np.asarray(columns)
+    col_indices = np.flatnonzero(columns) if columns.dtype == bool else columns
+    matrix = _alignment_matrix(alignment)[:, col_indices]
+    records = []
+    for rec, row in zip(alignment, matrix):
+        new_rec = SeqRecord(Seq(row.tobytes().decode("latin-1"), alphabet=rec.seq.alphabet),
+                            id=rec.id, name=rec.name, description=rec.description)
+        for key, value in rec.letter_annotations.items():
+            value_subset = [value[col] for col in col_indices]
+            new_rec.letter_annotations[key] = "".join(value_subset) if isinstance(value, str) \
+                else type(value)(value_subset)
+        records.append(new_rec)
+    return MultipleSeqAlignment(records, alphabet=alignment._alphabet)
+
+
+def _residue_index(rec):
+    """
+    Ungapped-to-gapped coordinate index for a single aligned record (a br.PositionMap over its non-gap characters).
+    Cached on the record next to the Seq object it was built from, so it is rebuilt once the record gets a new sequence.
+    :param rec: SeqRecord object
+    :return: br.PositionMap
+    """
+    cached = getattr(rec, "_buddy_residue_index", None)
+    if cached and cached[0] is rec.seq:
+        return cached[1]
+    index = br.PositionMap.from_gapped(rec.seq, GAP_CHARS)
+    rec._buddy_residue_index = (rec.seq, index)
+    return index
+
+
+def _enforce_triplets_seq(seq):
+    """
+    Shuffle the residues of one aligned nucleotide sequence so that codons are not split up by gaps. Residues that
+    would land in a codon of the other type (gap vs. nucleotide) are held back and start the next codon instead.
+    The sequence is handled one gap/residue run at a time, so the work scales with the number of runs, not residues.
+    :param seq: Aligned sequence as a string
+    :return: Rearranged sequence string, of the same length
+    """
+    if not seq:
+        return seq
+    is_gap = np.isin(np.frombuffer(seq.encode("utf-32-le"), dtype=np.uint32), [ord(char) for char in GAP_CHARS])
+    breaks = (np.flatnonzero(is_gap[1:] != is_gap[:-1]) + 1).tolist()
+    starts, ends = [0] + breaks, breaks + [len(seq)]
+
+    output, held = [], []
+    num_held = 0
+    held_gap = None
+    last_gap = None
+    position = 1  # Codon position that the next output residue will fill
+    for start, end, run_gap in zip(starts, ends, is_gap[starts].tolist()):
+        while start < end:
+            if position == 1 and num_held:
+                output += held
+                position = num_held % 3 + 1
+                last_gap = held_gap
+                held, num_held = [], 0
+
+            if position == 1:
+                output.append(seq[start:end])
+                position = (end - start) % 3 + 1
+                last_gap = run_gap
+                start = end
+            elif run_gap == last_gap:
+                step = min(end - start, 4 - position)
+                output.append(seq[start:start + step])
+                position = position + step if position + step < 4 else 1
+                start += step
+            else:
+                held.append(seq[start:end])
+                num_held += end - start
+                held_gap = run_gap
+                start = end
+
+    # Anything still held is tucked in after the last residue
+    output = "".join(output).rstrip("-") + "".join(held)
+    return output + "-" * (len(seq) - len(output))
+
+
 # ################################################ MAIN API FUNCTIONS ################################################ #
 def alignment_lengths(alignbuddy):
     """
@@ -466,37 +588,46 @@ def bootstrap(alignbuddy, num_bootstraps=1, r_seed=None):
     :param r_seed: Set a seed value so 'random' numbers are reproducible
     :rtype: AlignBuddy
     """
-    rand_gen = random.Random() if not r_seed else random.Random(r_seed)
-
-    new_alignments = []
-    for align_indx, alignment in enumerate(alignbuddy.alignments):
-        alignment = [[res for res in str(seq.seq)] for seq in alignment]
-        align_length = len(alignment[0])
-        num_seqs = len(alignment)
-        for _ in range(num_bootstraps):
-            # Instantiate an empty list of lists
-            align_as_lists = [['' for _ in range(align_length)] for _ in range(num_seqs)]
-            for res_indx in range(align_length):
-                column = rand_gen.randint(0, align_length - 1)
-                for seq_indx in range(num_seqs):
-                    align_as_lists[seq_indx][res_indx] = alignment[seq_indx][column]
-
-            align_as_lists = ["".join(seq) for seq in align_as_lists]
-            alb_copy = make_copy(alignbuddy)
-            for copy_indx, seq in enumerate(alb_copy.alignments[align_indx]):
-                seq.seq = Seq(align_as_lists[copy_indx], alphabet=seq.seq.alphabet)
-                seq.features = []
-                align_as_lists[copy_indx] = seq
-
-            new_alignment = MultipleSeqAlignment(align_as_lists, alphabet=alignbuddy.alpha)
-            new_alignments.append(new_alignment)
-
+    new_alignments = [replicate.alignments[0] for replicate in bootstrap_iter(alignbuddy, num_bootstraps, r_seed)]
     alignbuddy = AlignBuddy(new_alignments, out_format=alignbuddy.out_format)
     if alignbuddy.out_format == "nexus":
         alignbuddy.out_format = "phylip-relaxed"
     return alignbuddy
 
 
+def bootstrap_iter(alignbuddy, num_bootstraps=1, r_seed=None):
+    """
+    Generator version of bootstrap(), yielding one replicate at a time in the same order that bootstrap() returns them.
+    The columns for each replicate are drawn as a compact integer array just before that replicate is built, so pass the
+    generator to a writer loop or generate_tree() to keep memory use at a single replicate.
+    :param alignbuddy: The AlignBuddy object to be bootstrapped
+    :type alignbuddy: AlignBuddy
+    :param num_bootstraps: The number of new alignments to be generated from each alignment
+    :param r_seed: Set a seed value so 'random' numbers are reproducible (anything random.seed() accepts)
+    :return: Generator of AlignBuddy objects, each holding a single alignment
+    """
+    # numpy only takes 32 bit unsigned seeds, so anything else random.Random() can be seeded with is funneled through it
+    rand_gen = np.random.RandomState() if not r_seed else np.random.RandomState(random.Random(r_seed).getrandbits(32))
+    out_format = "phylip-relaxed" if alignbuddy.out_format == "nexus" else alignbuddy.out_format
+
+    for alignment in alignbuddy.alignments:
+        matrix = _alignment_matrix(alignment)
+        align_length = matrix.shape[1]
+        col_dtype = np.uint16 if align_length <= 2 ** 16 else np.uint32
+        for _ in range(num_bootstraps):
+            if align_length:
+                columns = rand_gen.randint(0, align_length, size=align_length, dtype=col_dtype)
+            else:
+                columns = np.zeros(0, dtype=col_dtype)
+            records = []
+            for rec, row in zip(alignment, matrix[:, columns]):
+                rec = Sb._shallow_record(rec)
+                rec.seq = Seq(row.tobytes().decode("latin-1"), alphabet=rec.seq.alphabet)
+                rec.features = []
+                records.append(rec)
+            yield AlignBuddy([MultipleSeqAlignment(records, alphabet=alignbuddy.alpha)], out_format=out_format)
+
+
 def clean_seq(alignbuddy, ambiguous=True, rep_char="N", skip_list=None):
     """
     Remove all non-sequence charcters from sequence strings (wraps SeqBuddy function)
@@ -526,103 +657,98 @@ def clean_seq(alignbuddy, ambiguous=True, rep_char="N", skip_list=None):
 def concat_alignments(alignbuddy, group_pattern=None, align_name_pattern=""):
     """
     Concatenates two or more alignments together, end-to-end
+    The locus boundaries are stored on the new alignment as 'partitions' (see partition_file())
     :param alignbuddy: AlignBuddy object
     :param group_pattern: Regex that matches some regular part of the sequence IDs, dictating who is bound to who
     :param align_name_pattern: Regex that matches something for the whole alignment
     :return: AlignBuddy object containing a single concatenated alignment
     :rtype: AlignBuddy
     """
+    def match_str(match):
+        return "".join(match.groups()) if match.groups() else match.group(0)
+
     if len(alignbuddy.alignments) < 2:
         raise AttributeError("Please provide at least two alignments.")
 
-    concat_groups = OrderedDict()
-
     if not group_pattern:
+        # Shortest ID prefix that is unique within every alignment
         min_length = 1
-        for indx, align in enumerate(alignbuddy.alignments):
-            max_rec_id_len = 0
-            for rec in align:
-                max_rec_id_len = len(rec.id) if len(rec.id) > max_rec_id_len else max_rec_id_len
-            breakout = False
-            while min_length <= max_rec_id_len and not breakout:
-                breakout = True
-                test_list = []
-                for indx2, rec in enumerate(align):
-                    if indx2 != 0 and rec.id[:min_length] in test_list:
-                        min_length += 1
-                        breakout = False
-                        break
-                    else:
-                        test_list.append(rec.id[:min_length])
-
+        for align in alignbuddy.alignments:
+            max_rec_id_len = max([len(rec.id) for rec in align] + [0])
+            while min_length <= max_rec_id_len and len({rec.id[:min_length] for rec in align}) < len(align):
+                min_length += 1
         group_pattern = "." * min_length
 
+    # The same IDs tend to turn up in every alignment, so only search each one once
+    group_pattern = re.compile(group_pattern)
+    group_keys = {}
+    align_groups = []
     for indx, align in enumerate(alignbuddy.alignments):
+        groups = []
         for rec in align:
-            match = re.search(group_pattern, rec.id)
-            if match:
-                if match.groups():
-                    match = "".join(match.groups())
-                else:
-                    match = match.group(0)
-                concat_groups.setdefault(match, [None for _ in range(len(alignbuddy.alignments))])
-            else:
-                raise ValueError("No match found for record %s in Alignment #%s" % (rec.id, indx + 1))
-
-    for indx, align in enumerate(alignbuddy.alignments):
-        for rec in align:
-            match = re.search(group_pattern, rec.id)
-            if match:
-                if match.groups():
-                    match = "".join(match.groups())
-                else:
-                    match = match.group(0)
-
-                if concat_groups[match][indx]:
-                    raise ValueError("Replicate matches '%s' in Alignment #%s" % (match, indx + 1))
-                concat_groups[match][indx] = rec
-
-        for group, seqs in concat_groups.items():
-            if not seqs[indx]:
-                concat_groups[group][indx] = SeqRecord(Seq("-" * align.get_alignment_length(),
-                                                           alphabet=alignbuddy.alpha))
+            if rec.id not in group_keys:
+                match = group_pattern.search(rec.id)
+                if not match:
+                    raise ValueError("No match found for record %s in Alignment #%s" % (rec.id, indx + 1))
+                group_keys[rec.id] = match_str(match)
+            groups.append(group_keys[rec.id])
+        align_groups.append(groups)
 
-    new_records = [SeqRecord(Seq("", alphabet=alignbuddy.alpha), id=group, features=[]) for group in concat_groups]
-    indx = 0
-    for group, seqs in concat_groups.items():
-        new_length = 0
-        for rec in seqs:
-            new_records[indx].seq = Seq(str(new_records[indx].seq) + str(rec.seq),
-                                        alphabet=new_records[indx].seq.alphabet)
-            rec.features = br.shift_features(rec.features, new_length, new_length + len(rec.seq))
-            new_records[indx].features += rec.features
-            new_length += len(rec.seq)
-        indx += 1
-
-    group_indx = 0
+    concat_groups = OrderedDict()
+    for groups in align_groups:
+        for group in groups:
+            concat_groups.setdefault(group, [None for _ in range(len(alignbuddy.alignments))])
+
+    for indx, (align, groups) in enumerate(zip(alignbuddy.alignments, align_groups)):
+        for rec, group in zip(align, groups):
+            if concat_groups[group][indx] is not None:
+                raise ValueError("Replicate matches '%s' in Alignment #%s" % (group, indx + 1))
+            concat_groups[group][indx] = rec
+
+    # Collect the pieces of every taxon and join them once
+    lengths = alignbuddy.lengths()
+    new_records = []
     for group, seqs in concat_groups.items():
+        seq_parts, features, align_features = [], [], []
         new_length = 0
-        align_features = []
         for rec_indx, rec in enumerate(seqs):
-            location = FeatureLocation(new_length, new_length + len(rec.seq))
+            if rec is None:
+                rec = SeqRecord(Seq("-" * lengths[rec_indx], alphabet=alignbuddy.alpha))
+            seq_parts.append(str(rec.seq))
+            rec_len = len(seq_parts[-1])
+            rec.features = br.shift_features(rec.features, new_length, new_length + rec_len)
+            features += rec.features
+
+            location = FeatureLocation(new_length, new_length + rec_len)
             match = re.search(align_name_pattern, rec.id)
             if align_name_pattern != "" and match:
-                if match.groups():
-                    match = "".join(match.groups())
-                else:
-                    match = match.group(0)
-                feature = SeqFeature(location=location, type=match)
+                feature = SeqFeature(location=location, type=match_str(match))
             else:
                 if str(rec.id) != "<unknown id>":
                     feature = SeqFeature(location=location, type=rec.id)
                 else:
                     feature = SeqFeature(location=location, type="Alignment_%s" % (rec_indx + 1))
             align_features.append(feature)
-            new_length += len(rec.seq)
-        new_records[group_indx].features = align_features + new_records[group_indx].features
-        group_indx += 1
+            new_length += rec_len
+        new_records.append(SeqRecord(Seq("".join(seq_parts), alphabet=alignbuddy.alpha), id=group,
+                                     features=align_features + features))
 
-    alignbuddy.alignments = [MultipleSeqAlignment(new_records, alphabet=alignbuddy.alpha)]
+    partitions = []
+    start = 0
+    for indx, align in enumerate(alignbuddy.alignments):
+        name = "Alignment_%s" % (indx + 1)
+        if align_name_pattern != "":
+            for rec in align:
+                match = re.search(align_name_pattern, rec.id)
+                if match:
+                    name = match_str(match)
+                    break
+        partitions.append((name, start, start + lengths[indx]))
+        start += lengths[indx]
+
+    new_alignment = MultipleSeqAlignment(new_records, alphabet=alignbuddy.alpha)
+    new_alignment.partitions = partitions
+    alignbuddy.alignments = [new_alignment]
     return alignbuddy
 
 
@@ -638,18 +764,16 @@ def consensus_sequence(alignbuddy):
     for alignment in alignbuddy.alignments:
         alpha = guess_alphabet(alignment)
         ambig_char = "X" if alpha == IUPAC.protein else "N"
+        matrix = _alignment_matrix(alignment)
         new_seq = ""
-        for indx in range(alignment.get_alignment_length()):
-            residues = {}
-            for rec in alignment:
-                residue = rec.seq[indx]
-                residues.setdefault(residue, 0)
-                residues[residue] += 1
-            residues = sorted(residues.items(), key=lambda x: x[1], reverse=True)
-            if len(residues) == 1 or residues[0][1] != residues[1][1]:
-                new_seq += residues[0][0]
-            else:
-                new_seq += ambig_char
+        if matrix.size:
+            # One row of counts per residue present in the alignment, one column per alignment column
+            residues = np.unique(matrix)
+            counts = np.array([np.count_nonzero(matrix == residue, axis=0) for residue in residues])
+            majority = residues[counts.argmax(axis=0)]
+            ties = np.count_nonzero(counts == counts.max(axis=0), axis=0) > 1
+            majority[ties] = ord(ambig_char)
+            new_seq = majority.tobytes().decode("latin-1")
         new_seq = Seq(new_seq, alphabet=alpha)
         description = "Original sequences: %s" % ", ".join([rec.id for rec in alignment])
         new_seq = SeqRecord(new_seq, id="consensus", name="consensus",
@@ -710,55 +834,13 @@ def enforce_triplets(alignbuddy):
     if alignbuddy.alpha == IUPAC.protein:
         raise TypeError("Nucleic acid sequence required, not protein.")
 
-    alignbuddy_copy = make_copy(alignbuddy)
     for rec in alignbuddy.records_iter():
         if rec.seq.alphabet == IUPAC.protein:
             raise TypeError("Record '%s' is protein. Nucleic acid sequence required." % rec.name)
 
-        seq_list = list(str(rec.seq))
-        output = [seq_list[0]] + ([None] * (len(seq_list) - 1))
-        output_indx = 0
-        held_residues = []
-        position = 2
-        for residue in seq_list[1:]:
-            if position == 1:
-                while len(held_residues) >= 3:
-                    for res in held_residues[:3]:
-                        output_indx += 1
-                        output[output_indx] = res
-                    held_residues = held_residues[3:]
-                position = len(held_residues) + 1
-                for res in held_residues:
-                    output_indx += 1
-                    output[output_indx] = res
-                held_residues = []
-
-            if position == 1 \
-                or (output[output_indx] not in GAP_CHARS and residue not in GAP_CHARS) \
-                    or (output[output_indx] in GAP_CHARS and residue in GAP_CHARS):
-                output_indx += 1
-                output[output_indx] = residue
-
-            else:
-                held_residues.append(residue)
-                continue
-
-            if position != 3:
-                position += 1
-            else:
-                position = 1
-        back_indx = -1
-        while output[back_indx] in ["-", None]:
-            back_indx -= 1
-        back_indx += 1
-        for res in held_residues:
-            output[back_indx] = res
-            back_indx += 1
-
-        for i in range(back_indx * -1):
-            output[back_indx] = "-"
-            back_indx += 1
-        rec.seq = Seq("".join(output), alphabet=rec.seq.alphabet)
+    alignbuddy_copy = shallow_copy(alignbuddy)
+    for rec in alignbuddy.records_iter():
+        rec.seq = Seq(_enforce_triplets_seq(str(rec.seq)), alphabet=rec.seq.alphabet)
     br.remap_gapped_features(alignbuddy_copy.records(), alignbuddy.records())
     trimal(alignbuddy, "clean")
     return alignbuddy
@@ -1111,7 +1193,7 @@ def hash_ids(alignbuddy, hash_length=10, r_seed=None):
                          "Hash length must be increased.")
     # If a hash_map already exists and fits all the specs, re-apply it.
     if alignbuddy.hash_map:
-        alignbuddy_copy = make_copy(alignbuddy)
+        alignbuddy_copy = shallow_copy(alignbuddy)
         re_apply_hash_map = True
         records = alignbuddy_copy.records_dict()
         reverse_hashmap_ids = [rec_id for _hash, rec_id in alignbuddy.hash_map.items()]
@@ -1152,6 +1234,41 @@ def lowercase(alignbuddy):
     return alignbuddy
 
 
+def map_coordinates(alignbuddy, positions, to_columns=True):
+    """
+    Translate residue positions (ungapped, zero-based) into alignment columns, or columns back into residue positions,
+    for many records at once. Positions that fall outside of a record (or columns that are gaps) are returned as -1.
+    :param alignbuddy: AlignBuddy object
+    :param positions: Either a list of positions applied to every record, or a dict of {rec.id: [positions]}
+    :param to_columns: Set to False to go from alignment columns to residue positions
+    :return: One OrderedDict per alignment, of {rec.id: numpy.ndarray}
+    :rtype: list
+    """
+    output = []
+    for alignment in alignbuddy.alignments:
+        coordinates = OrderedDict()
+        for rec in alignment:
+            if type(positions) in [dict, OrderedDict]:
+                if rec.id not in positions:
+                    continue
+                rec_positions = np.asarray(positions[rec.id], dtype=np.int64)
+            else:
+                rec_positions = np.asarray(positions, dtype=np.int64)
+
+            index = _residue_index(rec)
+            new_positions = np.full(rec_positions.shape, -1, dtype=np.int64)
+            if to_columns:
+                valid = (rec_positions >= 0) & (rec_positions < len(index.positions))
+                new_positions[valid] = index.positions[rec_positions[valid]]
+            else:
+                valid = (rec_positions >= 0) & (rec_positions < len(index))
+                valid[valid] = index.kept[rec_positions[valid]]
+                new_positions[valid] = index.ranks[rec_positions[valid]]
+            coordinates[rec.id] = new_positions
+        output.append(coordinates)
+    return output
+
+
 def map_features2alignment(seqbuddy, alignbuddy):
     """
     Copy features from an annotated sequence over to its corresponding record in an alignment
@@ -1160,30 +1277,19 @@ def map_features2alignment(seqbuddy, alignbuddy):
     :return: The modified AlignBuddy object
     :rtype: AlignBuddy
     """
-    def feat_map(feat, _sb_rec, _alb_rec):
+    def feat_map(feat, _alb_map):
         new_location = feat.location
         if type(feat.location) == FeatureLocation:
-            chars = 0
-            start = None
-            end = None
-            for indx, residue in enumerate(str(alb_rec.seq)):
-                if residue not in GAP_CHARS:
-                    chars += 1
-
-                if start is None and chars - 1 == feat.location.start:
-                    start = int(indx)
-
-                if chars == feat.location.end:
-                    end = int(indx) + 1
-
-                if None not in [start, end]:
-                    new_location = FeatureLocation(start, end)
-                    break
+            # _alb_map.positions holds the column of every residue, so feature ends are direct lookups
+            num_residues = len(_alb_map.positions)
+            if 0 <= feat.location.start < num_residues and 0 < feat.location.end <= num_residues:
+                new_location = FeatureLocation(_alb_map.select(feat.location.start),
+                                               _alb_map.select(feat.location.end - 1) + 1)
 
         else:  # CompoundLocation
             parts = []
             for sub_feature in feat.location.parts:
-                parts.append(feat_map(SeqFeature(sub_feature), _sb_rec, _alb_rec).location)
+                parts.append(feat_map(SeqFeature(sub_feature), _alb_map).location)
             new_location = CompoundLocation(parts, operator='order')
         feat.location = new_location
         return feat
@@ -1194,8 +1300,9 @@ def map_features2alignment(seqbuddy, alignbuddy):
         sb_rec.features = br.shift_features(sb_rec.features, 0, len(sb_rec.seq))  # Cleans weird start/end positions
         if sb_rec.id in alb_recs:
             for alb_rec in alb_recs[sb_rec.id]:
+                alb_map = _residue_index(alb_rec)
                 for feature in sb_rec.features:
-                    alb_rec.features.append(feat_map(feature, sb_rec, alb_rec))
+                    alb_rec.features.append(feat_map(feature, alb_map))
     return alignbuddy
 
 
@@ -1214,6 +1321,35 @@ def order_ids(alignbuddy, reverse=False):
     return alignbuddy
 
 
+def partition_file(alignbuddy, _format="raxml"):
+    """
+    Describe the locus boundaries of an alignment built by concat_alignments(), either as a RAxML partition file or as a
+    NEXUS 'sets' block with one charset per locus
+    :param alignbuddy: AlignBuddy object
+    :param _format: Either 'raxml' or 'nexus'
+    :return: The partition file contents
+    :rtype: str
+    """
+    _format = _format.lower()
+    if _format not in ["raxml", "nexus"]:
+        raise ValueError("Partition format must be either 'raxml' or 'nexus', not '%s'." % _format)
+
+    partitions = []
+    for alignment in alignbuddy.alignments:
+        partitions += getattr(alignment, "partitions", [])
+    if not partitions:
+        raise AttributeError("No partitions found. Alignments need to be built with concat_alignments().")
+
+    if _format == "raxml":
+        model = "AUTO" if alignbuddy.alpha == IUPAC.protein else "DNA"
+        output = ["%s, %s = %s-%s\n" % (model, name, start + 1, end) for name, start, end in partitions]
+    else:
+        output = ["#NEXUS\nbegin sets;\n"]
+        output += ["    charset %s = %s-%s;\n" % (name, start + 1, end) for name, start, end in partitions]
+        output.append("end;\n")
+    return "".join(output)
+
+
 def pull_records(alignbuddy, regex, description=False):
     """
     Retrieves rows with names/IDs matching a search pattern
@@ -1283,12 +1419,22 @@ def translate_cds(alignbuddy):
         raise TypeError("Nucleic acid sequence required, not protein.")
 
     enforce_triplets(alignbuddy)
+    if alignbuddy.alpha == IUPAC.ambiguous_rna:
+        rna2dna(alignbuddy)
 
     new_aligns = []
     for alignment in alignbuddy.alignments:
-        seqbuddy = Sb.SeqBuddy(list(alignment))
-        Sb.replace_subsequence(seqbuddy, "\\".join(GAP_CHARS), "-")
-        Sb.translate_cds(seqbuddy, alignment=True)
+        # All records are translated at once, straight from the residue matrix
+        peptides = Sb._translate_codons(_alignment_matrix(alignment), gap_chars="".join(GAP_CHARS))
+        records = []
+        for rec, peptide in zip(alignment, peptides):
+            rec = Sb._shallow_record(rec)
+            rec.letter_annotations = {}
+            rec.seq = Seq(peptide, alphabet=IUPAC.protein)
+            rec.features = []
+            records.append(rec)
+        seqbuddy = Sb.SeqBuddy(records, alpha=IUPAC.protein)
+        Sb.map_features_nucl2prot(Sb.SeqBuddy(list(alignment), alpha=alignbuddy.alpha), seqbuddy, mode="list")
         alignment = MultipleSeqAlignment(seqbuddy.records, alphabet=IUPAC.protein)
         new_aligns.append(alignment)
     alignbuddy.alpha = IUPAC.protein
@@ -1307,7 +1453,7 @@ def trimal(alignbuddy, threshold):
     :return: The trimmed AlignBuddy object
     :rtype: AlignBuddy
     """
-    def gappyout(_gap_distr, _position_map):
+    def gappyout(_gap_distr):
         _max_gaps = 0
         # If there are no columns with zero gaps, scan through the distribution to find where the columns start
         for i in _gap_distr:
@@ -1362,85 +1508,50 @@ def trimal(alignbuddy, threshold):
 
             active_pointer = prev_pointer2
 
-        cuts = []
-        for col, gaps in enumerate(each_column):
-            if gaps <= _max_gaps:
-                cuts.append(col)
-                _position_map.extend(True)
-            else:
-                _position_map.extend(False)
-
-        _new_alignment = alignment[:, 0:0]
-        for _col in cuts:
-            _new_alignment += alignment[:, _col:_col + 1]
-
-        return _new_alignment
+        return _max_gaps
 
     for alignment_index, alignment in enumerate(alignbuddy.alignments):
         if not alignment:
             continue  # Prevent crash if the alignment doesn't have any records in it
-        # gap_distr is the number of columns w/ each possible number of gaps; the index is == to number of gaps
-        gap_distr = [0 for _ in range(len(alignment) + 1)]
+        # each_column is the number of gaps in every column, and gap_distr is the number of columns w/ each possible
+        # number of gaps; the index is == to number of gaps
         num_columns = alignment.get_alignment_length()
-        each_column = [0 for _ in range(num_columns)]
+        each_column = np.count_nonzero(_alignment_matrix(alignment) == ord("-"), axis=0)
+        gap_distr = np.bincount(each_column, minlength=len(alignment) + 1).tolist()
 
         # Each position_map index corresponds to the original column position, values are tuples of the new position
         # and whether the column still exists (True) or has been deleted (False)
         position_map = FeatureReMapper()
 
-        max_gaps = 0
-        for indx in range(num_columns):
-            num_gaps = len(re.findall("-", str(alignment[:, indx])))
-            gap_distr[num_gaps] += 1
-            each_column[indx] = num_gaps
-
         # Remove any columns with any gaps
         if threshold in ["no_gaps", "all"]:
             threshold = 0
-            new_alignment = alignment[:, 0:0]
-            for next_col, num_gaps in enumerate(each_column):
-                if num_gaps <= max_gaps:
-                    new_alignment += alignment[:, next_col:next_col + 1]
-                    position_map.extend(True)
-                else:
-                    position_map.extend(False)
+            max_gaps = 0
 
         # Remove any columns that contain nothing but gaps
         elif threshold == "clean":
             max_gaps = len(alignment) - 1
-            new_alignment = alignment[:, 0:0]
-            for next_col, num_gaps in enumerate(each_column):
-                if num_gaps <= max_gaps:
-                    new_alignment += alignment[:, next_col:next_col + 1]
-                    position_map.extend(True)
-                else:
-                    position_map.extend(False)
 
         # trimAl algorithm for removing gaps, depending on size of alignment and distribution of seqs
         elif threshold == "gappyout":
-            new_alignment = gappyout(gap_distr, position_map)
+            max_gaps = gappyout(gap_distr)
+
+        elif threshold in ["strict", "strictplus"]:  # ToDo: Implement
+            raise NotImplementedError("%s not an implemented trimal method" % threshold)
 
-        elif threshold == "strict":  # ToDo: Implement
-            new_alignment = False
-        elif threshold == "strictplus":  # ToDo: Implement
-            new_alignment = False
         elif type(threshold) in [int, float]:
             if threshold >= 1:
                 max_gaps = round(threshold)
             else:
                 threshold = 0.0001 if threshold == 0 else threshold
                 max_gaps = round(len(alignment) * threshold)
-
-            new_alignment = alignment[:, 0:0]
-            for next_col, num_gaps in enumerate(each_column):
-                if num_gaps <= max_gaps:
-                    new_alignment += alignment[:, next_col:next_col + 1]
-                    position_map.extend(True)
-                else:
-                    position_map.extend(False)
         else:
             raise NotImplementedError("%s not an implemented trimal method" % threshold)
 
+        keep_columns = each_column <= max_gaps
+        position_map.extend_many(keep_columns)
+        new_alignment = _sub_alignment(alignment, keep_columns)
+
         position_map.remap_features(alignbuddy.alignments[alignment_index], new_alignment)
         position_map.append_pos_map(new_alignment)
         alignbuddy.alignments[alignment_index] = new_alignment
@@ -1556,19 +1667,19 @@ def command_line_ui(in_args, alignbuddy, skip_exit=False, pass_through=False):
     # ############################################# INTERNAL FUNCTIONS ############################################## #
     def _print_aligments(_alignbuddy):
         try:
-            _output = str(_alignbuddy)
+            if in_args.test:
+                str(_alignbuddy)
+                br._stderr("*** Test passed ***\n", in_args.quiet)
+
+            elif in_args.in_place:
+                _in_place(str(_alignbuddy), in_args.alignments[0])
+
+            else:
+                _alignbuddy.write(sys.stdout)
+                sys.stdout.flush()
         except ValueError as err:
             br._stderr("ValueError: %s\n" % str(err))
             return False
-
-        if in_args.test:
-            br._stderr("*** Test passed ***\n", in_args.quiet)
-
-        elif in_args.in_place:
-            _in_place(_output, in_args.alignments[0])
-
-        else:
-            br._stdout("%s" % _output)
         return True
 
     def _in_place(_output, file_path):
@@ -1621,7 +1732,17 @@ def command_line_ui(in_args, alignbuddy, skip_exit=False, pass_through=False):
     # Bootstrap
     if in_args.bootstrap:
         num_bootstraps = in_args.bootstrap[0] if in_args.bootstrap[0] else 1
-        _print_aligments(bootstrap(alignbuddy, num_bootstraps))
+        # Nexus output is switched to phylip-relaxed by bootstrap(), but the other single alignment formats need to
+        # go through bootstrap() to get the usual error if there is more than one replicate
+        single_alignment = alignbuddy.out_format.lower() in SINGLE_ALIGNMENT_FORMATS and \
+            alignbuddy.out_format.lower() != "nexus"
+        if in_args.test or in_args.in_place or (single_alignment and num_bootstraps * len(alignbuddy.alignments) > 1):
+            _print_aligments(bootstrap(alignbuddy, num_bootstraps))
+        else:
+            # Write each replicate out as soon as it's built, so only one is ever held in memory
+            for replicate in bootstrap_iter(alignbuddy, num_bootstraps):
+                if not _print_aligments(replicate):
+                    break
         _exit("bootstrap")
 
     # Clean Seq
@@ -1702,7 +1823,7 @@ def command_line_ui(in_args, alignbuddy, skip_exit=False, pass_through=False):
             else:
                 args.append(arg)
 
-        pulled = pull_records(make_copy(alignbuddy), args)
+        pulled = pull_records(shallow_copy(alignbuddy), args)
         alignbuddy = delete_records(alignbuddy, args)
         deleted_recs = []
         num_deleted = 0
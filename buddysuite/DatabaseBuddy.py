@@ -52,8 +52,6 @@ import cmd
 from subprocess import Popen, PIPE
 from io import TextIOWrapper, StringIO
 import warnings
-import readline
-import dill
 import glob
 
 # Third party
@@ -754,6 +752,24 @@ class GenericClient(object):
             self.http_errors_file.write("%s\n%s\n//\n" % (msg, err))
         return
 
+    def parallel_query(self, function, terms, func_args, max_workers):
+        """
+        Send a batch of requests out on a thread pool (the work is all network I/O)
+        :param function: Query method, called as function(term, func_args)
+        :param terms: List of search terms/accession groups
+        :param func_args: List of arguments for function
+        :param max_workers: Maximum number of simultaneous requests
+        :return: List of responses in the same order as terms. Anything that raised is logged to the error file and
+                 comes back as an empty string.
+        """
+        results = br.parallel_map(function, terms, func_args=func_args, max_workers=max_workers, mode="thread",
+                                  quiet=True)
+        for indx, result in enumerate(results):
+            if isinstance(result, br.TaskError):
+                self.write_error("Request failed: %s" % terms[indx], result.error)
+                results[indx] = ""
+        return results
+
     def group_terms_for_url(self, terms):
         groups = [""]
         for term in terms:
@@ -777,6 +793,11 @@ class UniProtRestClient(GenericClient):
         self.server = server
 
     def query_uniprot(self, search_term, request_params):  # Multicore ready
+        """
+        :param search_term: Query string
+        :param request_params: Dict of URL parameters (or a list holding that dict, if coming from parallel_query())
+        :return: The response, headed by a '# Search:' line and ending with '//' (empty string if the request failed)
+        """
         if type(request_params) == list:  # In case it's coming in from multicore run
             request_params = request_params[0]
         search_term = re.sub(" ", "+", search_term)
@@ -790,8 +811,7 @@ class UniProtRestClient(GenericClient):
             response = urlopen(request)
             response = response.read().decode("utf-8")
             response = re.sub("^Entry.*\n", "", response, count=1)
-            with self.lock:
-                self.results_file.write("# Search: %s\n%s//\n" % (search_term, response))
+            return "# Search: %s\n%s//\n" % (search_term, response)
 
         except HTTPError as err:
             self.write_error("Uniprot search failed for '%s'" % search_term, err)
@@ -803,7 +823,7 @@ class UniProtRestClient(GenericClient):
                 self.write_error("Uniprot request failed", err)
         except KeyboardInterrupt:
             br._stderr("\n\tUniProt query interrupted by user\n")
-        return
+        return ""
 
     def count_hits(self):
         # Limit URLs to 2,083 characters
@@ -825,18 +845,15 @@ class UniProtRestClient(GenericClient):
                 search_terms.append(_term)
 
         for search_term in search_terms:
-            self.query_uniprot(search_term, {"format": "list"})
-            content = re.sub("(#.*?\n|[\n /]+$)", "", self.results_file.read())
+            content = re.sub("(#.*?\n|[\n /]+$)", "", self.query_uniprot(search_term, {"format": "list"}))
             content = content.split("\n")
             _count += len(content) if content[0] != '' else 0
-            self.results_file.clear()
 
         self.parse_error_file()
         return _count
 
     def search_proteins(self):
         # start by determining how many results we would get from all searches.
-        self.results_file.clear()
         _count = self.count_hits()
 
         if _count == 0:
@@ -852,15 +869,14 @@ class UniProtRestClient(GenericClient):
         runtime.start()
         if len(self.dbbuddy.search_terms) > 1:
             br._stderr("Querying UniProt with %s search terms (Ctrl+c to abort)\n" % len(self.dbbuddy.search_terms))
-            br.run_multicore_function(self.dbbuddy.search_terms, self.query_uniprot, max_processes=10, quiet=True,
-                                      func_args=[params])
+            results = self.parallel_query(self.query_uniprot, self.dbbuddy.search_terms, [params], 10)
         else:
             br._stderr("Querying UniProt with the search term '%s'...\n" % self.dbbuddy.search_terms[0])
-            self.query_uniprot(self.dbbuddy.search_terms[0], params)
+            results = [self.query_uniprot(self.dbbuddy.search_terms[0], params)]
         runtime.end()
         self.parse_error_file()
 
-        content = re.sub("(#.*?\n|[\n /]+$)", "", self.results_file.read().strip())
+        content = re.sub("(#.*?\n|[\n /]+$)", "", "".join(results).strip())
         results = content.split("//")
         result_count = 0
         for result in [str(x) for x in results]:
@@ -880,7 +896,6 @@ class UniProtRestClient(GenericClient):
         br._stderr("\t%s records received.\n" % result_count)
 
     def fetch_proteins(self):
-        self.results_file.clear()
         _records = [_rec for _accession, _rec in self.dbbuddy.records.items() if
                     _rec.database == "uniprot" and not _rec.record]
 
@@ -893,9 +908,9 @@ class UniProtRestClient(GenericClient):
         runtime.start()
         params = {"format": "txt"}
         if len(accessions) > 1:
-            br.run_multicore_function(accessions, self.query_uniprot, max_processes=10, quiet=True, func_args=[params])
+            results = self.parallel_query(self.query_uniprot, accessions, [params], 10)
         else:
-            self.query_uniprot(accessions[0], params)
+            results = [self.query_uniprot(accessions[0], params)]
 
         runtime.end()
         errors = self.parse_error_file()
@@ -903,7 +918,7 @@ class UniProtRestClient(GenericClient):
             br._stderr("{0}{1}The following errors were encountered while querying UniProt with "
                        "fetch_proteins():{2}\n{3}{4}".format(RED, UNDERLINE, NO_UNDERLINE, errors, DEF_FONT))
 
-        data = self.results_file.read().strip()
+        data = "".join(results).strip()
         data = re.sub("# Search.*?\n", "", data)
         data = re.sub("//(\n//)+", "//\n", data)
         data = re.sub("^//\n*", "", data)
@@ -912,9 +927,7 @@ class UniProtRestClient(GenericClient):
             br._stderr("No sequences returned\n\n")
             return
 
-        self.results_file.write(data, "w")
-
-        _records = SeqIO.parse(self.results_file.get_handle("r"), "swiss")
+        _records = SeqIO.parse(StringIO(data), "swiss")
         for _rec in _records:
             self.dbbuddy.records[_rec.id].record = _rec
         return
@@ -934,7 +947,7 @@ class NCBIClient(GenericClient):
         Make a request to Entrez for some data
         :param query: Appropriately sized/formatted request string
         :param func_args: tool = "esummary_taxa", "efetch_gi", "esummary_seq", or "efetch_seq"
-        :return:
+        :return: The response text (empty string if the request failed)
         """
         tool = func_args[0]
         _type = None if len(func_args) == 1 else func_args[1]
@@ -988,16 +1001,10 @@ class NCBIClient(GenericClient):
                     self.write_error("NCBI request failed", err)
                 break
             except KeyboardInterrupt:
-                return
+                return ""
         if handle:
-            if tool == "efetch_seq":
-                result = "%s\n" % handle.read().strip()
-            else:
-                result = "%s\n### END ###\n" % handle.read().strip()
-
-            with self.lock:
-                self.results_file.write(result)
-        return
+            return "%s\n" % handle.read().strip()
+        return ""
 
     def search_ncbi(self, _type):
         """
@@ -1007,17 +1014,14 @@ class NCBIClient(GenericClient):
         """
         if not self.dbbuddy.search_terms:
             return
-        self.results_file.clear()
         if len(self.dbbuddy.search_terms) > 1:
-            br.run_multicore_function(self.dbbuddy.search_terms, self._mc_query, func_args=["esearch", _type],
-                                      max_processes=3, quiet=True)
+            results = self.parallel_query(self._mc_query, self.dbbuddy.search_terms, ["esearch", _type], 3)
         else:
-            self._mc_query(self.dbbuddy.search_terms[0], func_args=["esearch", _type])
+            results = [self._mc_query(self.dbbuddy.search_terms[0], func_args=["esearch", _type])]
 
         self.parse_error_file()
 
-        results = self.results_file.read().split("\n### END ###\n")
-        results = [x for x in results if x != ""]
+        results = [x for x in results if x]
         gi_nums = []
         for result in results:
             result = Entrez.read(StringIO(result))
@@ -1042,20 +1046,17 @@ class NCBIClient(GenericClient):
         # EUtils esummary will only take gi numbers
         # Start by grabbing GI numbers for any records with accns but no GI
         _type = "protein" if database == "ncbi_prot" else "nucleotide"
-        self.results_file.clear()
         accns = [accn for accn, rec in self.dbbuddy.records.items()
                  if rec.database == database and not rec.gi]
+        results = []
         if accns:
             accn_searches = self.group_terms_for_url(accns)
             if len(accn_searches) > 1:
-                br.run_multicore_function(accn_searches, self._mc_query,
-                                          func_args=["efetch_gi"], max_processes=3, quiet=True)
+                results = self.parallel_query(self._mc_query, accn_searches, ["efetch_gi"], 3)
             else:
-                self._mc_query(accn_searches[0], func_args=["efetch_gi"])
+                results = [self._mc_query(accn_searches[0], func_args=["efetch_gi"])]
 
-        gi_nums = self.results_file.read().split("\n### END ###\n")
-        gi_nums = [x.split("\n") for x in gi_nums]
-        gi_nums = [x for sublist in gi_nums for x in sublist if x]
+        gi_nums = [x for result in results for x in result.split("\n") if x]
 
         # Append any records that were not grabbed in the previous step
         gi_nums += [rec.gi for accn, rec in self.dbbuddy.records.items()
@@ -1066,19 +1067,16 @@ class NCBIClient(GenericClient):
             return
 
         # Download all of the summaries
-        self.results_file.clear()
         gi_groups = self.group_terms_for_url(gi_nums)
         br._stderr("Retrieving %s %s record summaries from NCBI...\n" % (len(gi_nums), _type))
         runtime = br.RunTime(prefix="\t")
         runtime.start()
         if len(gi_groups) > 1:
-            br.run_multicore_function(gi_groups, self._mc_query, func_args=["esummary_seq"],
-                                      max_processes=3, quiet=True)
+            results = self.parallel_query(self._mc_query, gi_groups, ["esummary_seq"], 3)
         else:
-            self._mc_query(gi_groups[0], func_args=["esummary_seq"])
+            results = [self._mc_query(gi_groups[0], func_args=["esummary_seq"])]
         runtime.end()
-        results = self.results_file.read().split("\n### END ###\n")
-        results = [x for x in results if x != ""]
+        results = [x for x in results if x]
 
         # Sift through all the results and grab summary information
         gi_nums = {}
@@ -1127,16 +1125,13 @@ class NCBIClient(GenericClient):
                                                 _size=rec_summary["length"], _database=database)
 
         # Get taxa names for all of the records retrieved
-        self.results_file.clear()
         _taxa_ids = self.group_terms_for_url(taxa)
         if len(_taxa_ids) > 1:
-            br.run_multicore_function(_taxa_ids, self._mc_query, func_args=["esummary_taxa"],
-                                      max_processes=3, quiet=True)
+            results = self.parallel_query(self._mc_query, _taxa_ids, ["esummary_taxa"], 3)
         else:
-            self._mc_query(_taxa_ids[0], func_args=["esummary_taxa"])
+            results = [self._mc_query(_taxa_ids[0], func_args=["esummary_taxa"])]
         self.parse_error_file()
 
-        results = self.results_file.read().split("\n### END ###\n")
         results = [x for x in results if x]
 
         taxa = {}
@@ -1171,21 +1166,19 @@ class NCBIClient(GenericClient):
         if not gi_nums:
             return
         try:
-            self.results_file.clear()
             gi_nums = self.group_terms_for_url(gi_nums)
             runtime = br.RunTime(prefix="\t")
             br._stderr("Fetching full %s sequence records from NCBI...\n" % database)
             runtime.start()
             if len(gi_nums) > 1:
-                br.run_multicore_function(gi_nums, self._mc_query, func_args=["efetch_seq"],
-                                          max_processes=3, quiet=True)
+                results = self.parallel_query(self._mc_query, gi_nums, ["efetch_seq"], 3)
             else:
-                self._mc_query(gi_nums[0], func_args=["efetch_seq"])
+                results = [self._mc_query(gi_nums[0], func_args=["efetch_seq"])]
             self.parse_error_file()
 
             runtime.end()
             records = {}
-            for rec in SeqIO.parse(self.results_file.get_handle("r"), "gb"):
+            for rec in SeqIO.parse(StringIO("".join(results)), "gb"):
                 if rec.id not in records:
                     records[rec.id] = rec
             br._stderr("\tDone\n")
@@ -1447,6 +1440,7 @@ Further details about each command can be accessed by typing 'help <command>'
             self.history_path = "%s%scmd_history" % (self.tmpdir.path, os.sep)
             open(self.history_path, "w", encoding="utf-8").close()
 
+        import readline  # Only the live shell needs line editing, so keep it out of CLI startup
         readline.read_history_file(self.history_path)
         readline.set_history_length(1000)
 
@@ -1473,6 +1467,7 @@ Further details about each command can be accessed by typing 'help <command>'
         # ToDo: Long commands are added to history, they are not output correctly in the terminal. For some reason they
         # are not cleared completely when you move to the next history index, leaving a truncated path at the prompt.
         # Need to track this bug down and squash it, just not sure how (i.e., don't want the 'and len(line) < 40' part)
+        import readline
         if line not in ["y", "n", "yes", "no"] and len(line) < 50:
             readline.write_history_file(self.history_path)
         else:
@@ -1485,6 +1480,7 @@ Further details about each command can be accessed by typing 'help <command>'
         return stop
 
     def dump_session(self):
+        import dill
         # Need to remove Lock()s to pickle
         for client in [client for db, client in self.dbbuddy.server_clients.items() if client]:
             client.lock = False
@@ -1763,6 +1759,7 @@ Further details about each command can be accessed by typing 'help <command>'
         self.dump_session()
 
     def do_load(self, line=None, quiet=False):
+        import dill
         if not line:
             line = input("%sWhere is the dump_file?%s " % (RED, self.terminal_default))
         try:
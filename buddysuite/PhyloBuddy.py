@@ -28,14 +28,14 @@ from __future__ import print_function
 # BuddySuite specific
 try:
     import buddy_resources as br
-    import AlignBuddy as Alb
+    Alb = br.lazy_import("AlignBuddy")  # Only used by generate_tree()
 except ImportError:
     try:
         import buddysuite.buddy_resources as br
-        import buddysuite.AlignBuddy as Alb
+        Alb = br.lazy_import("buddysuite.AlignBuddy")
     except AttributeError:
         from . import buddy_resources as br
-        from . import AlignBuddy as Alb
+        Alb = br.lazy_import("%s.AlignBuddy" % __package__)
 
 # Standard library
 import sys
@@ -57,8 +57,7 @@ from copy import deepcopy
 from Bio.Alphabet import IUPAC
 
 try:
-    import ete3
-    from ete3.coretype.tree import TreeError
+    ete3 = br.lazy_import("ete3")  # Takes ~1s to import, and is only needed to compare or display trees
 except ImportError:
     print("""\
 ETE3 toolkit not detected on your system. Try running the following:
@@ -375,8 +374,9 @@ def _guess_format(_input):
         _input = open(_input, "r", encoding='utf-8')
 
     if str(type(_input)) == "<class '_io.TextIOWrapper'>" or isinstance(_input, StringIO):
+        # Only the start of the file is needed to spot the format signatures
+        contents = _input.read(br.SNIFF_SIZE)
         # Die if file is empty
-        contents = _input.read()
         if contents == "":
             sys.exit("Input file is empty.")
         _input.seek(0)
@@ -529,7 +529,9 @@ def generate_tree(alignbuddy, alias, params=None, keep_temp=None, quiet=False):
     # ToDo: Multiple alignments are not un-hashing correctly (at least in raxml)
     """
     Calls tree building tools to generate trees
-    :param alignbuddy: The AlignBuddy object containing the alignments for building the trees
+    :param alignbuddy: The AlignBuddy object containing the alignments for building the trees. Can also be an iterable
+                       of AlignBuddy objects (e.g., the generator returned by AlignBuddy.bootstrap_iter()), which is
+                       consumed one object at a time.
     :param alias: The tree building tool to be used (raxml/phyml/fasttree)
     :param params: Additional parameters to be passed to the tree building tool
     :param keep_temp: Determines if/where the temporary files will be kept
@@ -595,10 +597,16 @@ def generate_tree(alignbuddy, alias, params=None, keep_temp=None, quiet=False):
         r_seed = re.search("r_seed ([0-9]+)", params)
         r_seed = None if not r_seed else int(r_seed.group(1))
 
+        def iter_alignments():
+            alignbuddies = [alignbuddy] if alignbuddy.__class__.__name__ == "AlignBuddy" else alignbuddy
+            for _alignbuddy in alignbuddies:
+                for _alignment in _alignbuddy.alignments:
+                    yield _alignment, _alignbuddy.hash_map
+
         phylo_objs = []
-        for alignment in alignbuddy.alignments:  # Need to loop through one tree at a time
+        for alignment, hash_map in iter_alignments():  # Need to loop through one tree at a time
             sub_alignbuddy = Alb.AlignBuddy([alignment])
-            sub_alignbuddy.hash_map = alignbuddy.hash_map
+            sub_alignbuddy.hash_map = hash_map
             Alb.hash_ids(sub_alignbuddy, 8, r_seed=r_seed)
             sub_alignbuddy = Alb.clean_seq(sub_alignbuddy)
             sub_alignbuddy.set_format('phylipss') if tool == "phyml" else sub_alignbuddy.set_format('phylipi')
@@ -959,6 +967,7 @@ def show_unique(phylobuddy):
     """
     if len(phylobuddy.trees) != 2:
         raise AssertionError("PhyloBuddy object should have exactly 2 trees.")
+    from ete3.coretype.tree import TreeError
 
     trees = [_convert_to_ete(phylobuddy.trees[0], ignore_color=True),
              _convert_to_ete(phylobuddy.trees[1], ignore_color=True)]  # Need ETE so we can compare them
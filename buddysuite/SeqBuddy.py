@@ -32,66 +32,53 @@ from __future__ import print_function
 # BuddySuite specific
 try:
     import buddy_resources as br
-    import AlignBuddy as Alb
+    Alb = br.lazy_import("AlignBuddy")  # Only used by transmembrane_domains()
 except ImportError:
     try:
         import buddysuite.buddy_resources as br
-        import buddysuite.AlignBuddy as Alb
+        Alb = br.lazy_import("buddysuite.AlignBuddy")
     except AttributeError:
         from . import buddy_resources as br
-        from . import AlignBuddy as Alb
+        Alb = br.lazy_import("%s.AlignBuddy" % __package__)
 
 # Standard library
 import sys
 import os
 import re
+import gc
 import string
-import zipfile
 import shutil
 import time
+import sqlite3
 import urllib.parse
-import urllib.request
 import urllib.error
-from copy import deepcopy
+from copy import copy, deepcopy
 from random import sample, randint, random, Random
 from math import floor, ceil, log
 from subprocess import Popen, PIPE
-from multiprocessing import Lock
 from shutil import which
 from hashlib import md5
+from bisect import bisect_left, bisect_right
 from io import StringIO, TextIOWrapper
-from collections import OrderedDict
+from collections import OrderedDict, Counter
+from itertools import dropwhile, takewhile
+from contextlib import contextmanager
 from xml.sax import SAXParseException
 
 # Third party
+import numpy as np
 from Bio import SeqIO
 from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
 from Bio.SeqRecord import SeqRecord
-from Bio.Restriction import RestrictionBatch, CommOnly, AllEnzymes, Analysis
-from Bio.SeqUtils.ProtParam import ProteinAnalysis
+from Bio.Data import IUPACData
 from Bio.Seq import Seq
 from Bio.Alphabet import IUPAC
 from Bio.Data import CodonTable
 from Bio.Nexus.Trees import TreeError
+from Bio.SubsMat.MatrixInfo import blosum62
 
 # ##################################################### WISH LIST #################################################### #
 '''
-def sim_ident(matrix):  # Return the pairwise similarity and identity scores among sequences
-    """
-    :param matrix:
-    """
-    x = matrix
-    return x
-
-
-def cd_hit(seqbuddy, threshold):
-    """
-    :param seqbuddy: SeqBuddy object
-    :param threshold: Maximum sequence identity
-    """
-    return seqbuddy
-
-
 def auto_annotate():
     """
     Find common plasmid features in sequences
@@ -162,6 +149,56 @@ OUTPUT_FORMATS = ["ids", "accessions", "summary", "full-summary", "clustal", "em
                   "fastq-solexa", "fastq-illumina", "genbank", "gb", "imgt", "nexus", "phd", "phylip", "phylip-relaxed",
                   "phylipss", "phylipsr", "raw", "seqxml", "sff", "stockholm", "tab", "qual"]
 
+# Formats that can be read/written one record at a time, and the tools that only need to see one record at a time
+STREAM_FORMATS = ["embl", "fasta", "fastq", "fastq-sanger", "fastq-solexa", "fastq-illumina", "genbank", "gb", "qual",
+                  "raw", "tab"]
+STREAM_TOOLS = ["annotate", "clean_seq", "complement", "delete_features", "delete_large", "delete_metadata",
+                "delete_records", "delete_small", "dna2rna", "extract_feature_sequences", "extract_regions",
+                "find_pattern", "insert_sequence", "lowercase", "order_features_alphabetically",
+                "order_features_by_position", "pull_record_ends", "pull_recs", "pull_recs_with_feature", "rename",
+                "replace_subsequence", "reverse_complement", "rna2dna", "select_frame", "translate6frames",
+                "translate_cds", "uppercase"]
+
+# Formats that SeqBuddyIndex can build an on-disk random-access index for
+INDEX_FORMATS = ["embl", "fasta", "fastq", "fastq-sanger", "fastq-solexa", "fastq-illumina", "genbank", "gb"]
+
+# Scoring schemes for the built-in pairwise engine (sim_ident). These are the blastp/blastn defaults, along with their
+# Karlin-Altschul parameters, so raw scores can be converted into bit scores comparable to bl2seq() output. Protein pairs
+# are scored with BLOSUM62, and match/mismatch only kick in for characters the matrix doesn't cover
+PAIRWISE_SCORING = {"protein": {"match": 1, "mismatch": -4, "gap_open": 11, "gap_extend": 1,
+                                "lambda": 0.267, "k": 0.041, "kmer_size": 5},
+                    "nucl": {"match": 2, "mismatch": -3, "gap_open": 5, "gap_extend": 2,
+                             "lambda": 0.625, "k": 0.41, "kmer_size": 11}}
+
+# Restriction enzymes left out of the 'commercial' and 'all' groups in find_restriction_sites()
+RESTRICTION_BLACKLIST = frozenset(["AbaSI", "FspEI", "MspJI", "SgeI", "AspBHI", "SgrTI", "YkrI",
+                                   "BmeDI"] +  # highly nonspecific
+                                  ["AjuI", "AlfI", "AloI", "ArsI", "BaeI", "BarI", "BcgI", "BdaI", "BplI", "BsaXI",
+                                   "Bsp24I", "CjeI", "CjePI", "CspCI", "FalI", "Hin4I", "NgoAVIII", "NmeDI", "PpiI",
+                                   "PsrI", "R2_BceSIV", "RdeGBIII", "SdeOSI", "TstI", "UcoMSI"] +  # two-cutting
+                                  ["AlwFI", "AvaIII", "BmgI", "BscGI", "BspGI", "BspNCI", "Cdi630V", "Cgl13032I",
+                                   "Cgl13032II", "CjeFIII", "CjeFV", "CjeNII", "CjeP659IV", "CjuI", "CjuII", "DrdII",
+                                   "EsaSSI", "FinI", "GauT27I", "HgiEII", "Hpy99XIII", "Hpy99XIV", "Jma19592I", "MjaIV",
+                                   "MkaDII", "NhaXI", "PenI", "Pfl1108I", "RdeGBI", "RflFIII", "RlaI", "RpaTI", "SnaI",
+                                   "Sno506I", "SpoDI", "TssI", "TsuI", "UbaF11I", "UbaF12I", "UbaF13I", "UbaF14I",
+                                   "UbaF9I", "UbaPI"])  # non-cutters
+
+# Standard genetic code, plus the gapped codons that show up in codon alignments. Anything else translates to 'N'
+CODON_DICT = {'---': '-', '--A': '-', '--C': '-', '--G': '-', '--T': '-', '-A-': '-', '-C-': '-', '-G-': '-',
+              '-T-': '-', 'A--': '-', 'AAA': 'K', 'AAC': 'N', 'AAG': 'K', 'AAT': 'N', 'ACA': 'T', 'ACC': 'T',
+              'ACG': 'T', 'ACT': 'T', 'AGA': 'R', 'AGC': 'S', 'AGG': 'R', 'AGT': 'S', 'ATA': 'I', 'ATC': 'I',
+              'ATG': 'M', 'ATT': 'I', 'C--': '-', 'CAA': 'Q', 'CAC': 'H', 'CAG': 'Q', 'CAT': 'H', 'CCA': 'P',
+              'CCC': 'P', 'CCG': 'P', 'CCT': 'P', 'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R', 'CTA': 'L',
+              'CTC': 'L', 'CTG': 'L', 'CTT': 'L', 'G--': '-', 'GAA': 'E', 'GAC': 'D', 'GAG': 'E', 'GAT': 'D',
+              'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A', 'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
+              'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V', 'T--': '-', 'TAA': '*', 'TAC': 'Y', 'TAG': '*',
+              'TAT': 'Y', 'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S', 'TGA': '*', 'TGC': 'C', 'TGG': 'W',
+              'TGT': 'C', 'TTA': 'L', 'TTC': 'F', 'TTG': 'L', 'TTT': 'F'}
+
+# The same code as a lookup table, indexed by _codon_indices() (A, C, G, T, gap, anything else --> 0-5 per position)
+CODON_TABLE = np.frombuffer(bytes(ord(CODON_DICT.get(first + second + third, "N"))
+                                  for first in "ACGT-?" for second in "ACGT-?" for third in "ACGT-?"), dtype=np.uint8)
+
 
 # ##################################################### SEQBUDDY ##################################################### #
 class SeqBuddy(object):
@@ -305,8 +342,59 @@ class SeqBuddy(object):
         self.memory_footprint = sum([len(rec) for rec in sequences])
 
     def __str__(self):
+        output = StringIO()
+        self.write(output)
+        return output.getvalue()
+
+    def __len__(self):
+        return len(self.records)
+
+    def to_dict(self):
+        id_index = _index_records(self.records, digests=False)[0]
+        repeat_ids = [rec_id for rec_id, positions in id_index.items() if len(positions) > 1]
+        if repeat_ids:
+            repeat_ids = sorted(repeat_ids, key=lambda rec_id: id_index[rec_id][1])
+            raise RuntimeError("There are repeat IDs in self.records\n%s" % ", ".join(repeat_ids))
+
+        records_dict = OrderedDict()
+        for rec in self.records:
+            records_dict[rec.id] = rec
+        return records_dict
+
+    def id_index(self, names=True):
+        """
+        Index the current record IDs. Build a new one whenever self.records changes, the index does not track edits.
+        :param names: Index rec.name as well as rec.id
+        :return: IdIndex object
+        """
+        return IdIndex(self.records, names)
+
+    def write(self, file_path, out_format=None):
+        """
+        Serialize the records straight into a file or open handle, without building the whole output in memory first
+        :param file_path: Path to the output file, or a writable text handle (e.g., sys.stdout)
+        :param out_format: Use this format instead of self.out_format
+        :return: None
+        """
+        if out_format:
+            out_format_save = str(self.out_format)
+            self.out_format = out_format
+
+        try:
+            if type(file_path) == str:
+                with open(file_path, "w", encoding="utf-8") as ofile:
+                    self._write_records(ofile)
+            else:
+                self._write_records(file_path)
+        finally:
+            if out_format:
+                self.out_format = out_format_save
+        return
+
+    def _write_records(self, handle):
         if len(self.records) == 0:
-            return "Error: No sequences in object.\n"
+            handle.write("Error: No sequences in object.\n")
+            return
 
         # There is a weird bug in genbank write() that concatenates dots to the organism name (if set).
         # The following is a work around...
@@ -319,64 +407,36 @@ class SeqBuddy(object):
                 except KeyError:
                     pass
 
+        ofile = br.RstripWriter(handle)
         if self.out_format == "phylipsr":
-            output = br.phylip_sequential_out(self, _type="seqbuddy")
+            ofile.write(br.phylip_sequential_out(self, _type="seqbuddy"))
 
         elif self.out_format == "phylipss":
-            output = br.phylip_sequential_out(self, relaxed=False, _type="seqbuddy")
+            ofile.write(br.phylip_sequential_out(self, relaxed=False, _type="seqbuddy"))
 
         elif self.out_format == "raw":
-            output = "\n\n".join([str(rec.seq) for rec in self.records])
+            for indx, rec in enumerate(self.records):
+                ofile.write("%s%s" % ("\n\n" if indx else "", str(rec.seq)))
         else:
-            tmp_dir = br.TempDir()
-            with open("%s%sseqs.tmp" % (tmp_dir.path, os.path.sep), "w", encoding="utf-8") as _ofile:
-                try:
-                    SeqIO.write(self.records, _ofile, self.out_format)
-                except ValueError as e:
-                    if "Sequences must all be the same length" in str(e):
-                        br._stderr("Warning: Alignment format detected but sequences are different lengths. "
-                                   "Format changed to fasta to accommodate proper printing of records.\n")
-                        SeqIO.write(self.records, _ofile, "fasta")
-                    elif "Repeated name" in str(e) and self.out_format == "phylip":
-                        br._stderr("Warning: Phylip format returned a 'repeat name' error, probably due to truncation. "
-                                   "Attempting phylip-relaxed.\n")
-                        SeqIO.write(self.records, _ofile, "phylip-relaxed")
-                    elif "Locus identifier" in str(e) and "is too long" in str(e) \
-                            and self.out_format in ["gb", "genbank"]:
-                        br._stderr("Warning: Genbank format returned an 'ID too long' error. "
-                                   "Format changed to EMBL.\n\n")
-                        SeqIO.write(self.records, _ofile, "embl")
-                    else:
-                        raise e
-
-            with open("%s%sseqs.tmp" % (tmp_dir.path, os.path.sep), "r", encoding="utf-8") as ifile:
-                output = ifile.read()
-
-        return "%s\n" % output.rstrip()
-
-    def __len__(self):
-        return len(self.records)
-
-    def to_dict(self):
-        sb_copy = find_repeats(make_copy(self))
-        if len(sb_copy.repeat_ids) > 0:
-            raise RuntimeError("There are repeat IDs in self.records\n%s" %
-                               ", ".join([key for key, recs in sb_copy.repeat_ids.items()]))
-
-        records_dict = OrderedDict()
-        for rec in self.records:
-            records_dict[rec.id] = rec
-        return records_dict
-
-    def write(self, file_path, out_format=None):
-        with open(file_path, "w", encoding="utf-8") as ofile:
-            if out_format:
-                out_format_save = str(self.out_format)
-                self.out_format = out_format
-                ofile.write(str(self))
-                self.out_format = out_format_save
-            else:
-                ofile.write(str(self))
+            try:
+                SeqIO.write(self.records, ofile, self.out_format)
+            except ValueError as e:
+                if "Sequences must all be the same length" in str(e):
+                    br._stderr("Warning: Alignment format detected but sequences are different lengths. "
+                               "Format changed to fasta to accommodate proper printing of records.\n")
+                    SeqIO.write(self.records, ofile, "fasta")
+                elif "Repeated name" in str(e) and self.out_format == "phylip":
+                    br._stderr("Warning: Phylip format returned a 'repeat name' error, probably due to truncation. "
+                               "Attempting phylip-relaxed.\n")
+                    SeqIO.write(self.records, ofile, "phylip-relaxed")
+                elif "Locus identifier" in str(e) and "is too long" in str(e) \
+                        and self.out_format in ["gb", "genbank"]:
+                    br._stderr("Warning: Genbank format returned an 'ID too long' error. "
+                               "Format changed to EMBL.\n\n")
+                    SeqIO.write(self.records, ofile, "embl")
+                else:
+                    raise e
+        ofile.end()
         return
 
     def print_hashmap(self):
@@ -393,6 +453,476 @@ class SeqBuddy(object):
         return
 
 
+class SeqBuddyStream(object):
+    """
+    Lazily parse a sequence file, handing out small SeqBuddy objects (chunks) one at a time instead of holding every
+    record in memory. Record-local tools (see STREAM_TOOLS) are queued with apply(), and write() runs them as a
+    pipeline, writing output as each chunk is processed.
+    :usage: SeqBuddyStream("/path/to/huge.fq").apply(clean_seq).apply(pull_recs, "foo").write("/path/to/out.fq")
+    """
+    def __init__(self, sb_input, in_format=None, out_format=None, alpha=None, chunk_size=1, alpha_sample=100):
+        """
+        :param sb_input: File path or file handle
+        :param in_format: Format of the input. Guessed if not provided
+        :param out_format: Format of the output. Same as the input if not provided
+        :param alpha: Alphabet of the records. Guessed from the first 'alpha_sample' records if not provided
+        :param chunk_size: Number of records in each SeqBuddy object handed out
+        :param alpha_sample: Number of records buffered to guess the alphabet
+        """
+        self.in_file = None
+        self.handle = None
+        if str(type(sb_input)) == "<class '_io.TextIOWrapper'>" or isinstance(sb_input, StringIO):
+            self.handle = sb_input
+        elif type(sb_input) == str and os.path.isfile(sb_input):
+            self.in_file = sb_input
+        else:
+            raise TypeError("SeqBuddyStream requires a file path or file handle, not %s" % type(sb_input))
+
+        if not in_format:
+            if self.handle and not self.handle.seekable():
+                raise br.GuessError("Unable to guess the format of a piped stream. "
+                                    "Try explicitly setting with -f flag.")
+            in_format = _guess_format(self.in_file if self.in_file else self.handle)
+            if self.handle:
+                self.handle.seek(0)
+            if not in_format:
+                raise br.GuessError("Could not determine format from sb_input file '%s'.\n"
+                                    "Try explicitly setting with -f flag." % (self.in_file if self.in_file
+                                                                              else "file-like object"))
+            in_format = "fasta" if in_format == "empty file" else in_format
+
+        self.in_format = in_format.lower()
+        self.out_format = self.in_format if not out_format else out_format.lower()
+        for _format in [self.in_format, self.out_format]:
+            if _format not in STREAM_FORMATS:
+                raise ValueError("The '%s' format can not be streamed. Supported formats: %s" %
+                                 (_format, ", ".join(STREAM_FORMATS)))
+        if self.in_format == "raw":
+            raise ValueError("Raw sequence input can not be streamed.")
+
+        self.alpha = alpha
+        self.chunk_size = chunk_size
+        self.alpha_sample = alpha_sample
+        self.tools = []
+
+    def __iter__(self):
+        """
+        Parse the input one record at a time, yielding SeqBuddy objects of at most self.chunk_size records
+        """
+        handle = open(self.in_file, "r", encoding="utf-8") if self.in_file else self.handle
+        try:
+            records = SeqIO.parse(handle, self.in_format)
+            buffer = []
+            alpha = self.alpha
+            if alpha is None:
+                for rec in records:
+                    buffer.append(rec)
+                    if len(buffer) == self.alpha_sample:
+                        break
+                alpha = _guess_alphabet(buffer)
+
+            chunk = []
+            buffer.reverse()
+            while buffer or records:
+                if buffer:
+                    chunk.append(buffer.pop())
+                else:
+                    try:
+                        chunk.append(next(records))
+                    except StopIteration:
+                        break
+
+                if len(chunk) == self.chunk_size:
+                    seqbuddy = SeqBuddy(chunk, in_format=self.in_format, out_format=self.out_format, alpha=alpha)
+                    alpha = seqbuddy.alpha  # Only resolve alpha names (or warn about bad ones) once
+                    chunk = []
+                    yield seqbuddy
+
+            if chunk:
+                yield SeqBuddy(chunk, in_format=self.in_format, out_format=self.out_format, alpha=alpha)
+        finally:
+            if self.in_file:
+                handle.close()
+
+    def apply(self, function, *args, **kwargs):
+        """
+        Queue up a record-local tool to run on every chunk of the stream
+        :param function: A SeqBuddy API function listed in STREAM_TOOLS
+        :param args: Positional arguments for the function (other than the SeqBuddy object)
+        :param kwargs: Keyword arguments for the function
+        :return: self, so calls can be chained
+        """
+        if function.__name__ not in STREAM_TOOLS:
+            raise ValueError("%s() needs to see all records at once, so it can not be run on a stream." %
+                             function.__name__)
+        self.tools.append((function, args, kwargs))
+        return self
+
+    def process(self):
+        """
+        Run the queued tools over each chunk
+        :return: Generator of processed (non-empty) SeqBuddy objects
+        """
+        for seqbuddy in self:
+            for function, args, kwargs in self.tools:
+                seqbuddy = function(seqbuddy, *args, **kwargs)
+            if seqbuddy.records:
+                yield seqbuddy
+
+    def write(self, _output=None, out_format=None):
+        """
+        Run the pipeline, writing each chunk as soon as it has been processed
+        :param _output: File path or file handle. Sent to stdout if not provided
+        :param out_format: Override self.out_format
+        :return: The number of records written
+        """
+        ofile = open(_output, "w", encoding="utf-8") if type(_output) == str else _output
+        ofile = ofile if ofile else sys.stdout
+        counter = 0
+        try:
+            for seqbuddy in self.process():
+                if out_format:
+                    seqbuddy.out_format = out_format
+                if counter and seqbuddy.out_format == "raw":
+                    ofile.write("\n")
+                seqbuddy.write(ofile)
+                counter += len(seqbuddy.records)
+        finally:
+            if type(_output) == str:
+                ofile.close()
+        return counter
+
+
+class SeqBuddyIndex(object):
+    """
+    Random access to the records of a large sequence file, through an on-disk offset index (like `samtools faidx`)
+    saved beside it as '<file>.sbi'. The index is only opened once it's needed, and is rebuilt automatically whenever
+    the size or modification time of the sequence file no longer match. Pulling out a few records, or subsequences,
+    then only reads those bytes instead of parsing the entire file.
+    :usage: SeqBuddyIndex("/path/to/huge.fa").pull_recs(["id1", "id2"], exact=True).write("/path/to/out.fa")
+    """
+    version = "1"
+
+    def __init__(self, in_file, in_format=None, out_format=None, alpha=None, index_path=None):
+        """
+        :param in_file: Path to a sequence file
+        :param in_format: Format of the input. Taken from an existing index, or guessed, if not provided
+        :param out_format: Format of the output. Same as the input if not provided
+        :param alpha: Alphabet of the records. Guessed from the retrieved records if not provided
+        :param index_path: Where to keep the index. Defaults to the input file path + '.sbi'
+        """
+        if type(in_file) != str or not os.path.isfile(in_file):
+            raise TypeError("SeqBuddyIndex requires a path to a sequence file, not %s" % type(in_file))
+        self.in_file = os.path.abspath(in_file)
+        self.index_path = index_path if index_path else "%s.sbi" % self.in_file
+        self._db = None
+
+        self.in_format = in_format.lower() if in_format else None
+        if not self.in_format:
+            self._db = self._open()
+            if self._db:
+                in_format = self._db.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()[0]
+            else:
+                in_format = _guess_format(self.in_file)
+                if not in_format:
+                    raise br.GuessError("Could not determine format from sb_input file '%s'.\n"
+                                        "Try explicitly setting with -f flag." % self.in_file)
+                in_format = "fasta" if in_format == "empty file" else in_format
+            self.in_format = in_format
+
+        self.out_format = self.in_format if not out_format else out_format.lower()
+        if self.in_format not in INDEX_FORMATS:
+            raise ValueError("The '%s' format can not be indexed. Supported formats: %s" %
+                             (self.in_format, ", ".join(INDEX_FORMATS)))
+        self.alpha = alpha
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    @property
+    def db(self):
+        """
+        Connection to the index, which is (re)built first if it's missing or out of date
+        """
+        if self._db is None:
+            self._db = self._open()
+        if self._db is None:
+            self.build()
+        return self._db
+
+    def _stamp(self):
+        stat = os.stat(self.in_file)
+        return {"version": self.version, "format": self.in_format, "size": str(stat.st_size),
+                "mtime": str(stat.st_mtime_ns)}
+
+    def _open(self):
+        """
+        Connect to the saved index, as long as it still matches the sequence file
+        :return: sqlite3.Connection or None
+        """
+        if not os.path.isfile(self.index_path):
+            return None
+        stamp = self._stamp()
+        try:
+            db = sqlite3.connect(self.index_path)
+            meta = dict(db.execute("SELECT key, value FROM meta").fetchall())
+        except sqlite3.DatabaseError:
+            return None
+        if not self.in_format:
+            stamp["format"] = meta.get("format")
+        if meta != stamp:
+            db.close()
+            return None
+        db.row_factory = sqlite3.Row
+        return db
+
+    def build(self):
+        """
+        Scan the whole sequence file and (re)write its index. If the index can't be saved (e.g., read-only directory),
+        it's only held in memory for the life of this object.
+        :return: None
+        """
+        if self._db is not None:
+            self._db.close()
+        stamp = self._stamp()
+        temp_path = "%s.%s.tmp" % (self.index_path, os.getpid())
+        try:
+            self._db = self._write_index(temp_path, stamp)
+            self._db.close()
+            os.replace(temp_path, self.index_path)
+            self._db = sqlite3.connect(self.index_path)
+        except (OSError, sqlite3.OperationalError):
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+            self._db = self._write_index(":memory:", stamp)
+        self._db.row_factory = sqlite3.Row
+        return
+
+    def _write_index(self, path, stamp):
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE records (position INTEGER PRIMARY KEY, id TEXT, name TEXT, record_offset INTEGER, "
+                   "record_length INTEGER, seq_length INTEGER, seq_offset INTEGER, line_bases INTEGER, "
+                   "line_width INTEGER)")
+        with open(self.in_file, "rb") as handle:
+            rows = self._scan_flat(handle) if self.in_format.startswith("fast") else self._scan_blocks(handle)
+            db.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           ((indx,) + row for indx, row in enumerate(rows)))
+        db.execute("CREATE INDEX records_id ON records (id)")
+        db.execute("CREATE INDEX records_name ON records (name)")
+        db.executemany("INSERT INTO meta VALUES (?, ?)", stamp.items())
+        db.commit()
+        return db
+
+    def _scan_flat(self, handle):
+        """
+        Find the FASTA/FASTQ records without parsing them, following the same rules as the BioPython parsers. The
+        layout of the sequence lines is recorded too, so subsequences can be located arithmetically as long as every
+        line (but the last) holds the same number of residues. line_bases is 0 for anything more ragged than that.
+        :return: Generator of (id, name, record_offset, record_length, seq_length, seq_offset, line_bases, line_width)
+        """
+        fastq = self.in_format != "fasta"
+        title = None
+        offset = rec_offset = seq_offset = seq_len = qual_len = 0
+        line_bases = line_width = None
+        in_qual = ragged = short = False
+        for line in handle:
+            if line[:1] == (b"@" if fastq else b">") and (not fastq or title is None or
+                                                          (in_qual and qual_len >= seq_len)):
+                if title is not None:
+                    yield self._flat_row(title, rec_offset, offset, seq_len, seq_offset, line_bases, line_width,
+                                         ragged)
+                title = line
+                rec_offset = offset
+                seq_offset = offset + len(line)
+                seq_len = qual_len = 0
+                line_bases = line_width = None
+                in_qual = ragged = short = False
+
+            elif in_qual:
+                qual_len += len(line.rstrip())
+
+            elif title is not None:
+                if fastq and line[:1] == b"+":
+                    in_qual = True
+                else:
+                    content = line.rstrip()
+                    bases = len(content) - content.count(b" ")
+                    if not bases:
+                        short = True
+                    elif short or bases != len(content):
+                        ragged = True
+                    elif line_bases is None:
+                        line_bases, line_width = bases, len(line)
+                    elif bases > line_bases or len(line) - bases != line_width - line_bases:
+                        ragged = True
+                    elif bases < line_bases:
+                        short = True
+                    seq_len += bases
+            offset += len(line)
+
+        if title is not None:
+            yield self._flat_row(title, rec_offset, offset, seq_len, seq_offset, line_bases, line_width, ragged)
+
+    @staticmethod
+    def _flat_row(title, rec_offset, end, seq_len, seq_offset, line_bases, line_width, ragged):
+        title = title[1:].decode("utf-8").split(None, 1)
+        rec_id = title[0] if title else ""
+        if ragged or not line_bases:
+            line_bases = line_width = 0
+        return rec_id, rec_id, rec_offset, end - rec_offset, seq_len, seq_offset, line_bases, line_width
+
+    def _scan_blocks(self, handle):
+        """
+        Find the GenBank/EMBL records (from a LOCUS/ID line through to the closing '//'). IDs depend on several
+        header fields, so each record is parsed once while building the index.
+        :return: Generator of (id, name, record_offset, record_length, seq_length, seq_offset, line_bases, line_width)
+        """
+        start_tag = b"ID   " if self.in_format == "embl" else b"LOCUS"
+        offset = 0
+        rec_offset = None
+        lines = []
+        for line in handle:
+            if rec_offset is None and line.startswith(start_tag):
+                rec_offset = offset
+            offset += len(line)
+            if rec_offset is not None:
+                lines.append(line)
+                if line.startswith(b"//"):
+                    rec = self._parse(b"".join(lines))
+                    yield rec.id, rec.name, rec_offset, offset - rec_offset, len(rec.seq), 0, 0, 0
+                    rec_offset = None
+                    lines = []
+
+    def _parse(self, text):
+        if self.in_format.startswith("fastq"):
+            text += b"\n"  # A zero-length read at the very end of a file needs a (blank) quality line
+        return SeqIO.read(StringIO(text.decode("utf-8")), self.in_format)
+
+    def _read_record(self, handle, row):
+        handle.seek(row["record_offset"])
+        return self._parse(handle.read(row["record_length"]))
+
+    def _read_residues(self, handle, row, start, end):
+        """
+        Residues [start:end] (Python slice semantics) of an indexed record, read directly from the file if its line
+        layout is regular enough. Otherwise the record is parsed and sliced.
+        """
+        start, end, _ = slice(start, end).indices(row["seq_length"])
+        if end <= start:
+            return ""
+        line_bases, line_width = row["line_bases"], row["line_width"]
+        if not line_bases:
+            return str(self._read_record(handle, row).seq)[start:end]
+        first = row["seq_offset"] + (start // line_bases) * line_width + start % line_bases
+        last = row["seq_offset"] + ((end - 1) // line_bases) * line_width + (end - 1) % line_bases + 1
+        handle.seek(first)
+        return "".join(handle.read(last - first).decode("utf-8").split())
+
+    def _rows(self, positions=None):
+        if positions is None:
+            return self.db.execute("SELECT * FROM records ORDER BY position")
+        return (self.db.execute("SELECT * FROM records WHERE position = ?", (indx,)).fetchone() for indx in positions)
+
+    def _seqbuddy(self, records):
+        return SeqBuddy(records, self.in_format, self.out_format, self.alpha)
+
+    def find(self, patterns, exact=False):
+        """
+        Select records the same way as pull_recs() does, but from the index (descriptions are not indexed)
+        :param patterns: List of regex patterns (or literal IDs/names if exact)
+        :param exact: Patterns are literal IDs/names
+        :return: Sorted list of record positions
+        """
+        found = set()
+        if exact:
+            for key in patterns:
+                found.update(row[0] for row in self.db.execute("SELECT position FROM records WHERE id = ? UNION "
+                                                               "SELECT position FROM records WHERE name = ?",
+                                                               (key, key)))
+            return sorted(found)
+
+        patterns = [".*" if pattern == "*" else pattern for pattern in patterns]
+        prefix_only = [re.match(r"\^[^.^$*+?{}\[\]\\|()]*$", pattern) for pattern in patterns]
+        if patterns and all(prefix_only):
+            for pattern in patterns:
+                prefix = pattern[1:]
+                if not prefix:
+                    return list(range(len(self)))
+                bounds = (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+                found.update(row[0] for row in self.db.execute("SELECT position FROM records WHERE id >= ? AND id < ? "
+                                                               "UNION SELECT position FROM records WHERE name >= ? "
+                                                               "AND name < ?", bounds + bounds))
+            return sorted(found)
+
+        regex = re.compile("|".join(patterns))
+        return [row[0] for row in self.db.execute("SELECT position, id, name FROM records ORDER BY position")
+                if regex.search(row[1]) or regex.search(row[2])]
+
+    def records(self, positions):
+        """
+        Parse specific records straight out of the sequence file
+        :param positions: Record positions (e.g., from find()), or None for all of them
+        :return: List of SeqRecord objects
+        """
+        with open(self.in_file, "rb") as handle:
+            return [self._read_record(handle, row) for row in self._rows(positions)]
+
+    def pull_recs(self, regex, exact=False):
+        """
+        Indexed version of pull_recs(), which only reads the matching records from the file
+        :param regex: List of regex expressions or single regex
+        :param exact: Treat regex as a list of literal IDs/names
+        :return: SeqBuddy object
+        """
+        if type(regex) == str:
+            regex = [regex]
+        return self._seqbuddy(self.records(self.find(regex, exact=exact)))
+
+    def fetch(self, seq_id, start=None, end=None):
+        """
+        Retrieve a subsequence without reading the rest of the record (as long as its line layout is regular)
+        :param seq_id: Record ID (or name)
+        :param start: First residue, zero-based
+        :param end: Stop before this residue (Python slice semantics, so negative values count from the end)
+        :return: str
+        """
+        row = self.db.execute("SELECT * FROM records WHERE id = ? OR name = ? ORDER BY position",
+                              (seq_id, seq_id)).fetchone()
+        if row is None:
+            raise KeyError("'%s' is not in the index" % seq_id)
+        with open(self.in_file, "rb") as handle:
+            return self._read_residues(handle, row, start, end)
+
+    def pull_record_ends(self, amount):
+        """
+        Indexed version of pull_record_ends(). Only the requested ends of FASTA sequences are read from the file,
+        other formats still parse each record (e.g., to carry over features).
+        :param amount: The number of residues to be pulled (negative numbers from rear)
+        :return: SeqBuddy object
+        """
+        amount = int(amount)
+        if self.in_format != "fasta":
+            return pull_record_ends(self._seqbuddy(self.records(None)), amount)
+
+        ends = slice(0, amount) if amount >= 0 else slice(amount, None)
+        records = []
+        with open(self.in_file, "rb") as handle:
+            for row in self._rows():
+                if not row["line_bases"]:
+                    rec = self._read_record(handle, row)
+                    rec.seq = rec.seq[ends]
+                else:
+                    handle.seek(row["record_offset"])
+                    title = handle.read(row["seq_offset"] - row["record_offset"]).decode("utf-8")[1:].rstrip()
+                    seq = self._read_residues(handle, row, ends.start, ends.stop)
+                    rec = SeqRecord(Seq(seq), id=row["id"], name=row["name"], description=title)
+                records.append(rec)
+        return self._seqbuddy(records)
+
+
 # ################################################# HELPER FUNCTIONS ################################################# #
 def _add_buddy_data(rec, key=None, data=None):
     """
@@ -414,6 +944,187 @@ def _add_buddy_data(rec, key=None, data=None):
     return rec
 
 
+@contextmanager
+def _gc_paused():
+    """
+    Hold off the cyclic garbage collector while results are built out of millions of small lists and dicts (none of
+    which can form reference cycles). Otherwise collections keep being triggered, each walking everything built so far.
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _codon_codes(seq, gap_chars="-"):
+    """
+    Encode nucleotides as A=0, C=1, G=2, T=3, gap=4 and anything else=5 (case-insensitive), so that every codon
+    collapses into a single index between 0 and 215 for the codon lookup tables
+    :param seq: str, Seq, or a uint8 residue matrix (e.g., from AlignBuddy.matrix())
+    :param gap_chars: Characters to encode as gaps
+    :return: numpy.ndarray of uint8 codes, the same shape as the input
+    """
+    table = np.full(256, 5, dtype=np.uint8)
+    for code, chars in enumerate(["Aa", "Cc", "Gg", "Tt", gap_chars]):
+        table[[ord(char) for char in chars]] = code
+    if not isinstance(seq, np.ndarray):
+        seq = np.frombuffer(str(seq).encode("ascii", errors="replace"), dtype=np.uint8)
+    return table[seq]
+
+
+def _codon_indices(seq, gap_chars="-"):
+    """
+    Index of every complete codon into a 216 slot codon lookup table, computed in a single vectorised pass
+    :param seq: str, Seq, or a uint8 residue matrix (one row per sequence)
+    :param gap_chars: Characters to encode as gaps
+    :return: numpy.ndarray with one value per codon (one row per sequence for matrix input)
+    """
+    codes = _codon_codes(seq, gap_chars).astype(np.uint16)
+    num_codons = codes.shape[-1] // 3
+    codes = codes[..., :num_codons * 3].reshape(codes.shape[:-1] + (num_codons, 3))
+    return codes[..., 0] * 36 + codes[..., 1] * 6 + codes[..., 2]
+
+
+def _orf_spans(seq, min_length=0, mode="scan"):
+    """
+    Find open reading frames (ATG/AUG through to the next in-frame stop codon) on one strand. Start and stop codons are
+    flagged with a codon index lookup at every offset, and each start is then paired with the next stop codon in its own
+    frame by binary search, so the strand is only walked once and nothing backtracks.
+    :param seq: Nucleotide sequence (str or Seq)
+    :param min_length: Minimum ORF length in nucleotides (stop codon included)
+    :param mode: 'scan' takes ORFs from left to right without overlap (i.e., non-overlapping regex matches),
+                 'longest' keeps the ORF from the first start codon upstream of each stop codon, and
+                 'nested' reports every alternative start codon
+    :return: list of (start, end) tuples, ordered by start
+    """
+    codes = _codon_codes(str(seq).upper().replace("U", "T"), gap_chars="").astype(np.uint16)
+    indices = codes[:-2] * 36 + codes[1:-1] * 6 + codes[2:]
+    starts = np.flatnonzero(indices == _codon_indices("ATG")[0])
+    stops = np.flatnonzero(np.isin(indices, _codon_indices("TAATAGTGA")))
+
+    ends = np.full(len(starts), -1, dtype=np.int64)
+    for frame in range(3):
+        frame_starts = np.flatnonzero(starts % 3 == frame)
+        frame_stops = stops[stops % 3 == frame]
+        next_stop = np.searchsorted(frame_stops, starts[frame_starts] + 3)
+        found = next_stop < len(frame_stops)
+        ends[frame_starts[found]] = frame_stops[next_stop[found]] + 3
+    starts, ends = starts[ends >= 0], ends[ends >= 0]
+
+    if mode == "longest":
+        ends, first = np.unique(ends, return_index=True)
+        starts = starts[first]
+        order = np.argsort(starts)
+        starts, ends = starts[order], ends[order]
+    elif mode == "scan":
+        spans = []
+        last_end = 0
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if start >= last_end:
+                spans.append((start, end))
+                last_end = end
+        starts = np.array([span[0] for span in spans], dtype=np.int64)
+        ends = np.array([span[1] for span in spans], dtype=np.int64)
+
+    keep = ends - starts >= min_length
+    return list(zip(starts[keep].tolist(), ends[keep].tolist()))
+
+
+def _unique_codons(seq):
+    """
+    Reduce a sequence to the distinct complete codons it contains, in one vectorised pass. The three bytes of every codon
+    are packed into a single integer, so this works for any characters (ambiguity codes, gaps, etc.), not just ACGT.
+    :param seq: str or Seq
+    :return: Tuple of (distinct codons in order of first appearance, numpy.ndarray mapping each codon onto that list,
+             list of counts)
+    """
+    seq = np.frombuffer(str(seq).encode("ascii", errors="replace"), dtype=np.uint8)
+    seq = seq[:len(seq) - len(seq) % 3]
+    # Re-code the characters actually present as 0..n-1 (in byte order), so every possible codon fits in a small table
+    present = np.zeros(256, dtype=bool)
+    present[seq] = True
+    alphabet = np.flatnonzero(present)
+    char_codes = np.zeros(256, dtype=np.int32)
+    char_codes[alphabet] = np.arange(len(alphabet))
+    codes = char_codes[seq].reshape(-1, 3)
+    size = len(alphabet)
+    packed = (codes[:, 0] * size + codes[:, 1]) * size + codes[:, 2]
+    counts = np.bincount(packed, minlength=size ** 3)
+    values = np.flatnonzero(counts)
+    lookup = np.zeros(size ** 3, dtype=np.int64)
+    lookup[values] = np.arange(len(values))
+    inverse = lookup[packed]
+    first = np.full(len(values), len(packed))
+    np.minimum.at(first, inverse, np.arange(len(packed)))
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    codons = alphabet[np.stack([values // size ** 2, values // size % size, values % size], axis=-1)[order]]
+    return [codon.astype(np.uint8).tobytes().decode() for codon in codons], rank[inverse], counts[values][order].tolist()
+
+
+def _translate_codons(seq, gap_chars="-"):
+    """
+    Translate every complete codon through CODON_TABLE, instead of slicing and looking up codons one at a time
+    :param seq: str, Seq, or a uint8 residue matrix (one row per sequence)
+    :param gap_chars: Characters to treat as alignment gaps
+    :return: Protein sequence string, or a list of them for matrix input
+    """
+    peptides = CODON_TABLE[_codon_indices(seq, gap_chars)]
+    if peptides.ndim == 1:
+        return peptides.tobytes().decode()
+    return [row.tobytes().decode() for row in peptides]
+
+
+def _composition(rec):
+    """
+    Residue composition of a record, from one byte-histogram pass over its sequence. All of the composition tools derive
+    their numbers from this, and it is cached on the record next to the Seq object it was counted from, so it is
+    recounted once the record gets a new sequence.
+    :param rec: SeqRecord object
+    :return: dict of {character: count} (case is preserved)
+    """
+    cached = getattr(rec, "_buddy_composition", None)
+    if cached and cached[0] is rec.seq:
+        return cached[1]
+    histogram = np.bincount(np.frombuffer(str(rec.seq).encode("ascii", errors="replace"), dtype=np.uint8),
+                            minlength=256)
+    residues = np.flatnonzero(histogram)
+    composition = dict(zip(residues.astype(np.uint8).tobytes().decode(), histogram[residues].tolist()))
+    rec._buddy_composition = (rec.seq, composition)
+    return composition
+
+
+def _upper_composition(composition):
+    """
+    Fold the lowercase counts of a composition into their uppercase characters
+    :param composition: dict of {character: count}, as returned by _composition()
+    :return: New dict of {character: count}
+    """
+    folded = {}
+    for char, count in composition.items():
+        char = char.upper()
+        folded[char] = folded.get(char, 0) + count
+    return folded
+
+
+def _shallow_record(rec):
+    """
+    Copy the record, its Seq object and its features one level deep. Sequence data, locations and qualifiers are shared.
+    :param rec: SeqRecord object
+    :return: New SeqRecord object
+    """
+    _copy = SeqRecord(copy(rec.seq), id=rec.id, name=rec.name, description=rec.description,
+                      dbxrefs=list(rec.dbxrefs), features=[copy(feat) for feat in rec.features],
+                      annotations=dict(rec.annotations), letter_annotations=dict(rec.letter_annotations))
+    if hasattr(rec, 'buddy_data'):
+        _copy.buddy_data = deepcopy(rec.buddy_data)
+    return _copy
+
+
 def _check_for_blast_bin(blast_bin):
     """
     Check the user's system for the blast bin in $PATH, try to download if not.
@@ -453,18 +1164,69 @@ def _feature_rc(feature, seq_len):
     return feature
 
 
+class IdIndex(object):
+    """
+    Hash map from record IDs (and names) to their positions in a list of records, built in a single pass.
+    A sorted key list for prefix searches is only built the first time one is requested.
+    :usage: index = IdIndex(seqbuddy.records); positions = index.exact(["id1", "id2"]); positions = index.prefix("Mle")
+    """
+    def __init__(self, records, names=True):
+        self.positions = {}
+        for indx, rec in enumerate(records):
+            self.positions.setdefault(rec.id, []).append(indx)
+            if names and rec.name != rec.id:
+                self.positions.setdefault(rec.name, []).append(indx)
+        self._sorted_keys = None
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def exact(self, keys):
+        """
+        :param keys: List of literal IDs/names
+        :return: Sorted list of record positions
+        """
+        found = set()
+        for key in keys:
+            found.update(self.positions.get(key, []))
+        return sorted(found)
+
+    def prefix(self, prefix):
+        """
+        :param prefix: Literal string that IDs/names must start with
+        :return: Sorted list of record positions
+        """
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self.positions)
+        found = set()
+        for indx in range(bisect_left(self._sorted_keys, prefix), len(self._sorted_keys)):
+            if not self._sorted_keys[indx].startswith(prefix):
+                break
+            found.update(self.positions[self._sorted_keys[indx]])
+        return sorted(found)
+
+
 class FeatureReMapper(object):
     """
-    Build a list that maps original residues to new positions if residues have been removed
+    Build a map of original residues to new positions if residues have been removed
     This will not work if new columns are being added.
     :usage: Instantiate a new object, and for each position in the original sequence, call the 'extend' method,
-            specifying whether that residue exists in the new alignment or not. Remap the features on the new sequence
-            by calling the remap_features method.
+            specifying whether that residue exists in the new alignment or not (or pass all of them at once to
+            'extend_many'). Remap the features on the new sequence by calling the remap_features method.
     """
     def __init__(self, old_seq):
         self.old_seq = old_seq  # SeqRecord
-        self.position_map = []
-        self.starting_position_filled = False
+        self._kept = []
+        self._position_map = None
+
+    @property
+    def position_map(self):
+        """
+        :return: br.PositionMap of everything passed to extend() so far
+        """
+        if self._position_map is None or len(self._position_map) != len(self._kept):
+            self._position_map = br.PositionMap(self._kept)
+        return self._position_map
 
     def extend(self, exists=True):
         """
@@ -472,22 +1234,20 @@ class FeatureReMapper(object):
         Extend() must be called exactly len(self.old_seq) times.
         :param exists: Specify whether the next residue exists or not
         """
-        if len(self.old_seq.seq) < len(self.position_map) + 1:
+        if len(self.old_seq.seq) < len(self._kept) + 1:
             raise AttributeError("The position map has already been fully populated.")
+        self._kept.append(bool(exists))
+        return
 
-        if not self.position_map:
-            if exists:
-                self.starting_position_filled = True
-            self.position_map.append((0, exists))
-
-        else:
-            if exists and not self.starting_position_filled:
-                self.position_map.append((0, True))
-                self.starting_position_filled = True
-            elif exists and self.starting_position_filled:
-                self.position_map.append((self.position_map[-1][0] + 1, True))
-            else:
-                self.position_map.append((self.position_map[-1][0], False))
+    def extend_many(self, kept):
+        """
+        Same as calling extend() on every value in kept
+        :param kept: Iterable of booleans (or a numpy array)
+        """
+        kept = np.asarray(kept, dtype=bool).tolist()
+        if len(self.old_seq.seq) < len(self._kept) + len(kept):
+            raise AttributeError("The position map has already been fully populated.")
+        self._kept += kept
         return
 
     def remap_features(self, new_seq):
@@ -495,46 +1255,679 @@ class FeatureReMapper(object):
         Add all the features from self.old_seq that still exist onto new_seq
         :param new_seq: SeqRecord containing the new sequence that was used to build self.position_map
         """
-        if len(self.old_seq.seq) != len(self.position_map):
+        if len(self.old_seq.seq) != len(self._kept):
             raise AttributeError("The position map has not been fully populated.")
 
         new_features = []
         for feature in self.old_seq.features:
-            feature = self._remap(feature)
+            feature = self.position_map.remap_feature(feature)
             if feature:
                 new_features.append(feature)
         new_seq.features = new_features
         return new_seq
 
-    def _remap(self, feature):
+
+def _ambig_pattern(pattern, alpha):
+    """
+    Convert any ambiguous letter codes in a search pattern into regex character classes
+    :param pattern: regex pattern
+    :param alpha: IUPAC alphabet of the sequences being searched
+    :return: regex pattern
+    """
+    pattern_backup = str(pattern)
+    if alpha == IUPAC.protein:
+        pattern = re.sub("[xX]", "[ARNDCQEGHILKMFPSTWYVX]", pattern)
+        pattern = re.sub("[bB]", "[NDB]", pattern)
+        pattern = re.sub("[zZ]", "[QEZ]", pattern)
+
+    elif alpha in [IUPAC.ambiguous_dna or IUPAC.unambiguous_dna]:
+        pattern = re.sub("[kK]", "[GT]", pattern)
+        pattern = re.sub("[mM]", "[AC]", pattern)
+        pattern = re.sub("[rR]", "[AG]", pattern)
+        pattern = re.sub("[yY]", "[CT]", pattern)
+        pattern = re.sub("[sS]", "[CG]", pattern)
+        pattern = re.sub("[wW]", "[AT]", pattern)
+        pattern = re.sub("[bB]", "[CGT]", pattern)
+        pattern = re.sub("[vV]", "[CGA]", pattern)
+        pattern = re.sub("[hH]", "[ACT]", pattern)
+        pattern = re.sub("[dD]", "[AGT]", pattern)
+        pattern = re.sub("[xnXN]", "[ATCG]", pattern)
+
+    elif alpha in [IUPAC.ambiguous_rna or IUPAC.unambiguous_rna]:
+        pattern = re.sub("[kK]", "[GU]", pattern)
+        pattern = re.sub("[mM]", "[AC]", pattern)
+        pattern = re.sub("[rR]", "[AG]", pattern)
+        pattern = re.sub("[yY]", "[CU]", pattern)
+        pattern = re.sub("[sS]", "[CG]", pattern)
+        pattern = re.sub("[wW]", "[AU]", pattern)
+        pattern = re.sub("[bB]", "[CGU]", pattern)
+        pattern = re.sub("[vV]", "[CGA]", pattern)
+        pattern = re.sub("[hH]", "[ACU]", pattern)
+        pattern = re.sub("[dD]", "[AGU]", pattern)
+        pattern = re.sub("[xnXN]", "[AUCG]", pattern)
+
+    safety_valve = br.SafetyValve()
+    # Strip out any double square brackets
+    while re.search("\[[^[\]]*?\[[^]]*\]", pattern):
+        safety_valve.step("Ambiguous %s regular expression '%s' failed compile." % (alpha, pattern_backup))
+        pattern = re.sub("(\[[^[\]]*?)\[([^]]*)\]", r"\1\2", pattern, count=1)
+    return pattern
+
+
+class MotifSearch(object):
+    """
+    Search many patterns at once. Patterns made only of letters, [letter] classes, '.' wildcards and fixed {n} repeats
+    (i.e., literal and IUPAC motifs) are expanded into a single sorted table of packed k-mers per motif shape (length
+    and wildcard positions). Each batch of sequences is then encoded once and scanned in one vectorised pass per motif
+    shape, however many motifs there are. Short shapes are all read out of one bit-packed window per position by
+    masking, longer ones are packed position by position. Anything else is handed to the re module. Matching is case
+    insensitive.
+    :usage: search = MotifSearch(["ATGGT", "ATGGN{6}"], alpha=IUPAC.ambiguous_dna, ambig=True);
+            matches = search.search([str(rec.seq) for rec in seqbuddy.records])
+    """
+    def __init__(self, patterns, alpha=None, ambig=False, max_variants=16384):
+        self.regexes = OrderedDict()  # Every pattern, after ambiguous codes are translated
+        motifs = OrderedDict()
+        for pattern in patterns:
+            if pattern in self.regexes:
+                continue
+            self.regexes[pattern] = _ambig_pattern(pattern, alpha) if ambig else pattern
+            positions = self._parse(pattern, alpha, ambig)
+            if positions and np.prod([float(len(chars)) for chars in positions if chars]) <= max_variants:
+                motifs[pattern] = positions
+
+        # Sequence characters that can appear in a motif are coded 1..n, everything else 0 (which only '.' matches)
+        alphabet = sorted(set("".join(["".join(chars) for positions in motifs.values() for chars in positions
+                                       if chars])))
+        self._char_codes = np.zeros(256, dtype=np.int64)
+        self._char_codes[[ord(char) for char in alphabet]] = np.arange(1, len(alphabet) + 1)
+        self._base = len(alphabet) + 1
+        max_len = int(63 / log(self._base, 2)) if alphabet else 0
+        # Motifs no longer than the window are packed with a fixed number of bits per position, so any shape can be
+        # cut out of the same packed window with a mask. Longer ones are packed as base-n numbers over their fixed
+        # positions, which fits more of them into 63 bits.
+        self._bits = len(alphabet).bit_length()
+        self._window = 63 // self._bits if alphabet else 0
+
+        self.fallback = [pattern for pattern in self.regexes if pattern not in motifs or
+                         len(motifs[pattern]) > self._window and
+                         len([chars for chars in motifs[pattern] if chars]) > max_len]
+        self.motifs = [pattern for pattern in motifs if pattern not in self.fallback]
+        # For each motif shape, i.e., (length, positions that are not wildcards): sorted packed k-mers, and the index
+        # (into self.motifs) of the motif each belongs to
+        self._tables = OrderedDict()
+        for indx, pattern in enumerate(self.motifs):
+            kmers = np.zeros(1, dtype=np.int64)
+            shape = (len(motifs[pattern]), tuple([pos for pos, chars in enumerate(motifs[pattern]) if chars]))
+            for pos in shape[1]:
+                codes = self._char_codes[[ord(char) for char in motifs[pattern][pos]]]
+                if shape[0] <= self._window:
+                    kmers = (kmers[:, None] + (codes << (self._bits * pos))[None, :]).ravel()
+                else:
+                    kmers = (kmers[:, None] * self._base + codes[None, :]).ravel()
+            self._tables.setdefault(shape, []).append((kmers, np.full(len(kmers), indx)))
+        for shape, table in self._tables.items():
+            kmers = np.concatenate([kmers for kmers, _ in table])
+            owners = np.concatenate([owners for _, owners in table])
+            order = np.lexsort((owners, kmers))
+            self._tables[shape] = (kmers[order], owners[order])
+
+    @staticmethod
+    def _parse(pattern, alpha, ambig):
+        """
+        Break a literal/IUPAC pattern into the set of (uppercase) characters allowed at each position
+        :return: list of strings (empty for a '.' wildcard), or None if the pattern needs a real regex engine
         """
-        Deal with the weirdness that is SeqRecord features... Compares self.old_seq features against self.position_map
-        :param feature: A feature from self.old_seq
+        token = "(?:([A-Za-z])|\\[([A-Za-z]+)\\]|(\\.))(?:\\{([0-9]+)\\})?"
+        if not re.fullmatch("(?:%s)+" % token, pattern):
+            return None
+        positions = []
+        for letter, letters, wildcard, repeat in re.findall(token, pattern):
+            chars = set()
+            for letter in letter or letters:
+                letter = _ambig_pattern(letter, alpha) if ambig else letter
+                chars.update(letter.strip("[]").upper())
+            positions += ["".join(sorted(chars))] * (int(repeat) if repeat else 1)
+        return positions
+
+    def _scan(self, seqs):
         """
-        if type(feature.location) == FeatureLocation:
-            for pos, present in self.position_map[feature.location.start:feature.location.end]:
-                if present:
-                    start = pos
-                    end = self.position_map[feature.location.end - 1][0] + 1
-                    location = FeatureLocation(start, end, strand=feature.location.strand)
-                    feature.location = location
-                    return feature
+        Find the motif matches in a batch of sequences, all in one concatenated array
+        :return: Tuple of numpy arrays (sequence index, motif index, start, end), sorted on all three
+        """
+        offsets = np.cumsum([0] + [len(seq) + 1 for seq in seqs])
+        codes = self._char_codes[np.frombuffer("\0".join(seqs).encode("ascii", errors="replace").upper(),
+                                               dtype=np.uint8)]
+        # The packed window starting at each position. Padding past the end is coded 0, which only wildcards match
+        window = max([length for length, _ in self._tables if length <= self._window] + [0])
+        padded = np.concatenate([codes, np.zeros(window, dtype=np.int64)])
+        windows = np.zeros(len(codes), dtype=np.int64)
+        for pos in range(window):
+            windows |= padded[pos:pos + len(codes)] << (self._bits * pos)
+
+        hits = [[np.zeros(0, dtype=np.int64)] for _ in range(4)]
+        for (length, fixed), (kmers, owners) in self._tables.items():
+            if len(codes) < length:
+                continue
+            if length <= self._window:
+                seq_kmers = windows & sum([((1 << self._bits) - 1) << (self._bits * pos) for pos in fixed])
             else:
-                return None
+                seq_kmers = np.zeros(len(codes) - length + 1, dtype=np.int64)
+                for pos in fixed:
+                    seq_kmers *= self._base
+                    seq_kmers += codes[pos:len(codes) - length + 1 + pos]
+            lower = np.searchsorted(kmers, seq_kmers, side="left")
+            found = np.flatnonzero(kmers[np.minimum(lower, len(kmers) - 1)] == seq_kmers)
+            if len(fixed) < length:  # Wildcards also match the separators, so drop windows that run between sequences
+                found = found[found + length < offsets[np.searchsorted(offsets, found, side="right")]]
+            lower = lower[found]
+            counts = np.searchsorted(kmers, seq_kmers[found], side="right") - lower
+            # A k-mer can belong to several motifs (e.g., 'ACGT' and 'ACGN'), so expand to one hit per motif
+            starts = np.repeat(found, counts)
+            matched = owners[np.repeat(lower - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))]
+            seq_indx = np.searchsorted(offsets, starts, side="right") - 1
+            for column, values in zip(hits, [seq_indx, matched, starts - offsets[seq_indx],
+                                             starts - offsets[seq_indx] + length]):
+                column.append(values)
+        hits = [np.concatenate(column) for column in hits]
+        order = np.lexsort((hits[2], hits[1], hits[0]))
+        return [column[order] for column in hits]
+
+    def _batches(self, seqs, batch_size):
+        """
+        Run _scan() over runs of sequences holding roughly batch_size residues each, so memory use stays bounded
+        :return: Generator of (index of the first sequence in the batch, _scan() output for the batch)
+        """
+        batch_start = 0
+        while batch_start < len(seqs) and self.motifs:
+            batch_end, residues = batch_start, 0
+            while batch_end < len(seqs) and (batch_end == batch_start or residues < batch_size):
+                residues += len(seqs[batch_end])
+                batch_end += 1
+            yield batch_start, self._scan(seqs[batch_start:batch_end])
+            batch_start = batch_end
+
+    def search(self, seqs, batch_size=1 << 22):
+        """
+        :param seqs: list of sequence strings
+        :param batch_size: Roughly how many residues to encode at a time
+        :return: list with a dict of {pattern: [(start, end), ...]} for each sequence (patterns without any matches are
+                 left out). Like re.finditer(), the matches of each pattern do not overlap
+        """
+        output = [{} for _ in seqs]
+        with _gc_paused():
+            for batch_start, hits in self._batches(seqs, batch_size):
+                seq_indx, matched, starts, ends = [column.tolist() for column in hits]
+                last = (None, None, 0)
+                for indx, motif, start, end in zip(seq_indx, matched, starts, ends):
+                    if (indx, motif) == last[:2] and start < last[2]:
+                        continue  # Overlaps the previous match of the same motif
+                    output[batch_start + indx].setdefault(self.motifs[motif], []).append((start, end))
+                    last = (indx, motif, end)
+
+        for pattern in self.fallback:
+            regex = re.compile(self.regexes[pattern], flags=re.IGNORECASE)
+            for seq, matches in zip(seqs, output):
+                spans = [(match.start(), match.end()) for match in regex.finditer(seq)]
+                if spans:
+                    matches[pattern] = spans
+        return output
 
-        else:  # CompoundLocation
-            parts = []
-            for sub_feature in feature.location.parts:
-                sub_feature = self._remap(SeqFeature(sub_feature))
-                if sub_feature:
-                    parts.append(sub_feature.location)
-            if len(parts) > 1:
-                feature.location = CompoundLocation(parts, operator='order')
-            elif len(parts) == 1:
-                feature.location = FeatureLocation(parts[0].start, parts[0].end, strand=parts[0].strand)
+
+class RestrictionIndex(object):
+    """
+    The recognition sites of a set of restriction enzymes, compiled into a single MotifSearch so every sequence is
+    scanned once for all of the enzymes. Compiling is the expensive part, so get indices through RestrictionIndex.get(),
+    which keeps one for each enzyme set it has seen (worker processes forked by br.parallel_map() inherit these too).
+    Cut positions are the same as Bio.Restriction reports for linear sequences.
+    :usage: cuts = RestrictionIndex.get([EcoRI, BsaI]).scan(["GAATTCGGTCTC"])
+    """
+    _cache = {}
+
+    def __init__(self, enzymes):
+        self.enzymes = sorted(enzymes)
+        # Bio.Restriction compiles each enzyme into lookahead regexes, one per strand if the site isn't palindromic
+        # (e.g., '(?=(?P<BsaI>GGTCTC))|(?=(?P<BsaI_as>GAGACC))'). Isoschizomers end up sharing site patterns.
+        sites = OrderedDict()  # {site pattern: [(enzyme index, is top strand), ...]}
+        self._cut_offsets = []  # (top strand offsets, bottom strand offsets) from the start of a site to each cut
+        for indx, enzyme in enumerate(self.enzymes):
+            for name, site in re.findall("\\(\\?P<([^>]+)>([^)]+)\\)", enzyme.compsite.pattern):
+                sites.setdefault(site, []).append((indx, name == str(enzyme)))
+            self._cut_offsets.append((list(enzyme._modify(0)), list(enzyme._rev_modify(0))))
+        self._search = MotifSearch(list(sites))
+        self._fallback = [re.compile("(?=%s)" % pattern) for pattern in self._search.fallback]
+
+        # Flattened lookup from site (motifs first, then fallback patterns) to the enzyme strands it belongs to
+        owners = [sites[pattern] for pattern in self._search.motifs + self._search.fallback]
+        self._owner_counts = np.array([len(site_owners) for site_owners in owners], dtype=np.int64)
+        self._owner_first = np.cumsum(self._owner_counts) - self._owner_counts
+        self._owner_enzymes = np.array([indx for site_owners in owners for indx, _ in site_owners], dtype=np.int64)
+        self._owner_top = np.array([top for site_owners in owners for _, top in site_owners], dtype=bool)
+
+        # Everything needed to turn sites into cuts, for the enzymes that cut once
+        self._cuts_once = np.array([len(top) == 1 for top, _ in self._cut_offsets], dtype=bool)
+        self._top_offsets = np.array([top[0] if len(top) == 1 else 0 for top, _ in self._cut_offsets], dtype=np.int64)
+        self._bottom_offsets = np.array([bottom[0] if len(bottom) == 1 else 0 for _, bottom in self._cut_offsets],
+                                        dtype=np.int64)
+        self._drop_outside = np.array([not enzyme.is_unknown() for enzyme in self.enzymes], dtype=bool)
+
+    @classmethod
+    def get(cls, enzymes):
+        """
+        :param enzymes: Iterable of Bio.Restriction enzymes (e.g., a RestrictionBatch)
+        :return: The cached RestrictionIndex for that set of enzymes
+        """
+        enzymes = frozenset(enzymes)
+        if enzymes not in cls._cache:
+            cls._cache[enzymes] = cls(enzymes)
+        return cls._cache[enzymes]
+
+    @staticmethod
+    def clean(seq):
+        """
+        Strip a sequence down the same way Bio.Restriction does before searching it
+        :param seq: Sequence string
+        :return: Uppercase sequence without whitespace or digits
+        """
+        seq = re.sub("[0-9]", "", "".join(seq.split())).upper()
+        if not set(seq).issubset("ABCDGHKMNRSTVWY"):
+            raise TypeError("Invalid character found in %s" % repr(seq))
+        return seq
+
+    def _sites(self, seqs, span, batch_size):
+        """
+        Every site in the sequences, overlaps included
+        :param span: Longer than any of the sequences
+        :return: numpy arrays (sequence index, enzyme index, is top strand, 1-based position), sorted on all four
+        """
+        seq_indx, site_indx, starts = [[np.zeros(0, dtype=np.int64)] for _ in range(3)]
+        for batch_start, (batch_seqs, motifs, batch_starts, _) in self._search._batches(seqs, batch_size):
+            seq_indx.append(batch_seqs + batch_start)
+            site_indx.append(motifs)
+            starts.append(batch_starts)
+        for fallback_indx, regex in enumerate(self._fallback, len(self._search.motifs)):
+            for indx, seq in enumerate(seqs):
+                found = np.array([match.start() for match in regex.finditer(seq)], dtype=np.int64)
+                seq_indx.append(np.full(len(found), indx))
+                site_indx.append(np.full(len(found), fallback_indx))
+                starts.append(found)
+        seq_indx, site_indx, starts = np.concatenate(seq_indx), np.concatenate(site_indx), np.concatenate(starts)
+
+        # One row for each enzyme strand a site belongs to, packed into a single sort key
+        counts = self._owner_counts[site_indx]
+        owners = np.repeat(self._owner_first[site_indx] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        seq_indx, starts = np.repeat(seq_indx, counts), np.repeat(starts, counts) + 1
+        keys = ((seq_indx * len(self.enzymes) + self._owner_enzymes[owners]) * span + starts) * 2
+        keys = np.sort(keys + ~self._owner_top[owners])
+
+        # Bio.Restriction tries the top strand regex first, so a position matching both strands only counts on top
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = (keys[1:] >> 1) != (keys[:-1] >> 1)
+        keys = keys[keep]
+        groups, starts = np.divmod(keys >> 1, span)
+        return groups // len(self.enzymes), groups % len(self.enzymes), (keys & 1) == 0, starts
+
+    def _cut_twice(self, indx, top, bottom, length):
+        """
+        Cuts for an enzyme that cuts twice at every site, following Bio.Restriction to the letter
+        :param indx: Enzyme index
+        :param top: Top strand site positions
+        :param bottom: Bottom strand site positions
+        :param length: Sequence length
+        :return: list of cut positions
+        """
+        top_offsets, bottom_offsets = self._cut_offsets[indx]
+        results = [loc + offset for loc in top for offset in top_offsets]
+        if not self.enzymes[indx].is_palindromic():
+            results += [loc + offset for loc in bottom for offset in bottom_offsets]
+            results.sort()
+        if self._drop_outside[indx]:
+            results = list(takewhile(lambda x: x <= length, dropwhile(lambda x: x <= 1, results)))
+        return results
+
+    def scan(self, seqs, batch_size=1 << 22):
+        """
+        :param seqs: list of sequence strings, already passed through RestrictionIndex.clean()
+        :param batch_size: Roughly how many residues to encode at a time
+        :return: list with an OrderedDict of {enzyme: [cut positions]} for each sequence, in the order Bio.Restriction
+                 sorts enzymes (enzymes that don't cut are left out)
+        """
+        with _gc_paused():
+            lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+            span = int(lengths.max()) + 1 if len(seqs) else 1
+            seq_indx, enzymes, top, starts = self._sites(seqs, span, batch_size)
+
+            cuts_once = self._cuts_once[enzymes]
+            cuts = starts + np.where(top, self._top_offsets[enzymes], self._bottom_offsets[enzymes])
+            # With one cut per site, the cuts come in order, so dropping any outside of the sequence is just a filter.
+            # Every cut left is then in 1..span, which packs into a single sort key again.
+            keep = cuts_once & (~self._drop_outside[enzymes] | ((cuts > 1) & (cuts <= lengths[seq_indx])))
+            groups, cuts = np.divmod(np.sort((seq_indx * len(self.enzymes) + enzymes)[keep] * span + cuts[keep]), span)
+            bounds = np.flatnonzero(groups[1:] != groups[:-1]) + 1
+            bounds = [0] + bounds.tolist() + [len(groups)] if len(groups) else [0]
+            output = [[] for _ in seqs]
+            group_list, cut_list = groups.tolist(), cuts.tolist()
+            for group_start, group_end in zip(bounds[:-1], bounds[1:]):
+                indx, enzyme = divmod(group_list[group_start], len(self.enzymes))
+                output[indx].append((enzyme, cut_list[group_start:group_end]))
+
+            twice = {}  # {(sequence index, enzyme index): ([top strand sites], [bottom strand sites])}
+            for indx, enzyme, on_top, start in zip(*[column[~cuts_once].tolist() for column in
+                                                     [seq_indx, enzymes, top, starts]]):
+                twice.setdefault((indx, enzyme), ([], []))[0 if on_top else 1].append(start)
+            for (indx, enzyme), (top_sites, bottom_sites) in twice.items():
+                results = self._cut_twice(enzyme, top_sites, bottom_sites, len(seqs[indx]))
+                if results:
+                    output[indx].append((enzyme, results))
+
+            return [OrderedDict([(self.enzymes[indx], results) for indx, results in sorted(seq_cuts)])
+                    for seq_cuts in output]
+
+
+def _index_records(records, digests=True):
+    """
+    Single pass over a list of records, building the lookups needed to find repeats without copying anything
+    :param records: List of SeqRecord objects
+    :param digests: Also MD5 hash each sequence
+    :return: Tuple --> (OrderedDict of {ID: [record positions]}, list of sequence digests in record order or None)
+    """
+    id_index = OrderedDict()
+    seq_digests = [] if digests else None
+    for indx, rec in enumerate(records):
+        id_index.setdefault(rec.id, []).append(indx)
+        if digests:
+            seq_digests.append(md5(str(rec.seq).encode("utf-8")).hexdigest())
+    return id_index, seq_digests
+
+
+def _kmer_candidates(seqs, kmer_size, min_shared):
+    """
+    Short-word prefilter for all-by-all comparisons. Every distinct k-mer is indexed once, and each sequence then only
+    counts words against the sequences that follow it in the index, so pairs with nothing in common are never visited
+    :param seqs: List of sequence strings
+    :param kmer_size: Word length
+    :param min_shared: Minimum number of distinct words a pair needs in common
+    :return: List of (indx1, indx2) tuples, with indx1 < indx2
+    """
+    seq_kmers = [{seq[i:i + kmer_size] for i in range(len(seq) - kmer_size + 1)} for seq in seqs]
+    kmer_index = {}
+    for indx, kmers in enumerate(seq_kmers):
+        for kmer in kmers:
+            kmer_index.setdefault(kmer, []).append(indx)
+
+    candidates = []
+    for indx1, kmers in enumerate(seq_kmers):
+        shared = Counter()
+        for kmer in kmers:
+            indices = kmer_index[kmer]
+            shared.update(indices[bisect_right(indices, indx1):])
+        candidates += [(indx1, indx2) for indx2, count in sorted(shared.items()) if count >= min_shared]
+    return candidates
+
+
+def _banded_alignment(seq1, seq2, band, scoring):
+    """
+    Smith-Waterman local alignment with affine gaps, restricted to a band of diagonals.
+    Gaps cost gap_open + gap_extend * length, as in BLAST.
+    :param seq1: Sequence string
+    :param seq2: Sequence string
+    :param band: Tuple --> (lowest diagonal, highest diagonal), where a diagonal is position in seq2 - position in seq1
+    :param scoring: Dict with "sub_scores" ({(res1, res2): score}), "match", "mismatch", "gap_open", and "gap_extend"
+    :return: Tuple --> (raw score, identical positions, alignment length, residues of seq1 aligned, residues of seq2 aligned)
+    """
+    start, diag, horizontal, vertical = range(4)
+    sub_scores, match, mismatch = scoring["sub_scores"], scoring["match"], scoring["mismatch"]
+    gap_first = scoring["gap_open"] + scoring["gap_extend"]
+    gap_extend = scoring["gap_extend"]
+    neg = float("-inf")
+
+    # Each row only holds the cells inside the band. Horizontal gaps consume seq2, vertical gaps consume seq1
+    prev_h, prev_v = {}, {}
+    traceback = []
+    best_score, best_cell = 0, None
+    for i in range(1, len(seq1) + 1):
+        cur_h, cur_e, cur_v, row_trace = {}, {}, {}, {}
+        res1 = seq1[i - 1]
+        for j in range(max(1, i + band[0]), min(len(seq2), i + band[1]) + 1):
+            e_open, e_ext = cur_h.get(j - 1, neg) - gap_first, cur_e.get(j - 1, neg) - gap_extend
+            e_score, e_src = (e_open, start) if e_open >= e_ext else (e_ext, horizontal)
+            v_open, v_ext = prev_h.get(j, neg) - gap_first, prev_v.get(j, neg) - gap_extend
+            v_score, v_src = (v_open, start) if v_open >= v_ext else (v_ext, vertical)
+
+            res2 = seq2[j - 1]
+            sub = sub_scores.get((res1, res2))
+            if sub is None:
+                sub = match if res1 == res2 else mismatch
+
+            h_score, h_src = 0, start
+            for score, src in ((prev_h.get(j - 1, 0) + sub, diag), (e_score, horizontal), (v_score, vertical)):
+                if score > h_score:
+                    h_score, h_src = score, src
+
+            cur_h[j], cur_e[j], cur_v[j] = h_score, e_score, v_score
+            row_trace[j] = (h_src, e_src, v_src)
+            if h_score > best_score:
+                best_score, best_cell = h_score, (i, j)
+        traceback.append(row_trace)
+        prev_h, prev_v = cur_h, cur_v
+
+    if not best_cell:
+        return 0, 0, 0, 0, 0
+
+    i, j = best_cell
+    identical = length = 0
+    state = diag
+    while i > 0 and j > 0:
+        h_src, e_src, v_src = traceback[i - 1][j]
+        if state == diag:
+            if h_src == start:
+                break
+            if h_src == diag:
+                identical += seq1[i - 1] == seq2[j - 1]
+                length += 1
+                i -= 1
+                j -= 1
+                if i and j not in traceback[i - 1]:  # Stepped out of the band, which is scored as a fresh start
+                    break
             else:
-                feature = None
-            return feature
+                state = h_src
+        elif state == horizontal:
+            length += 1
+            state = diag if e_src == start else horizontal
+            j -= 1
+        else:
+            length += 1
+            state = diag if v_src == start else vertical
+            i -= 1
+    return best_score, identical, length, best_cell[0] - i, best_cell[1] - j
+
+
+def _align_pair(pair, func_args):
+    """
+    Align one candidate pair for sim_ident()
+    :param pair: Tuple --> (indx1, indx2, seq1, seq2)
+    :param func_args: [settings dict], as handed over by br.parallel_map()
+    :return: Tuple --> (indx1, indx2, % identity, % coverage of the shorter sequence, bit score)
+    """
+    indx1, indx2, seq1, seq2 = pair
+    settings = func_args[0]
+    band = _pair_band(seq1, seq2, settings["kmer_size"], settings["band_width"])
+    raw_score, identical, length, span1, span2 = _banded_alignment(seq1, seq2, band, settings)
+    if not length:
+        return indx1, indx2, 0., 0., 0.
+    ident = round(100 * identical / length, 2)
+    coverage = round(100 * (span1 / len(seq1) if len(seq1) <= len(seq2) else span2 / len(seq2)), 2)
+    bit_score = round((settings["lambda"] * raw_score - log(settings["k"])) / log(2), 1)
+    return indx1, indx2, ident, coverage, bit_score
+
+
+def _pair_band(seq1, seq2, kmer_size, band_width):
+    """
+    Choose the diagonals to align two sequences over. The band starts on the diagonal most shared k-mers fall on, and is
+    stretched to take in any other well supported diagonal (hit more than once, and at least a quarter as often as the
+    best) that can be reached in steps of no more than band_width (i.e., the drift caused by indels). It is then padded
+    by band_width on either side.
+    :param seq1: Sequence string
+    :param seq2: Sequence string
+    :param kmer_size: Word length
+    :param band_width: Padding, and the largest step allowed between diagonals
+    :return: Tuple --> (lowest diagonal, highest diagonal)
+    """
+    positions = {}
+    for i in range(len(seq1) - kmer_size + 1):
+        positions.setdefault(seq1[i:i + kmer_size], []).append(i)
+    diagonals = Counter()
+    for j in range(len(seq2) - kmer_size + 1):
+        for i in positions.get(seq2[j:j + kmer_size], ()):
+            diagonals[j - i] += 1
+    best, best_count = diagonals.most_common(1)[0] if diagonals else (0, 0)
+    min_count = max(2, best_count / 4)
+    supported = sorted(set([diag for diag, count in diagonals.items() if count >= min_count] + [best]))
+    low = high = supported.index(best)
+    while low > 0 and supported[low] - supported[low - 1] <= band_width:
+        low -= 1
+    while high < len(supported) - 1 and supported[high + 1] - supported[high] <= band_width:
+        high += 1
+    return supported[low] - band_width, supported[high] + band_width
+
+
+def _pairwise_settings(alpha):
+    """
+    Scoring scheme for the built-in pairwise aligner, with BLOSUM62 unpacked into a lookup that works in both directions
+    :param alpha: IUPAC alphabet object
+    :return: dict (see PAIRWISE_SCORING), plus "sub_scores" --> {(res1, res2): score}
+    """
+    scoring = "protein" if alpha == IUPAC.protein else "nucl"
+    settings = dict(PAIRWISE_SCORING[scoring])
+    settings["sub_scores"] = {}
+    if scoring == "protein":
+        for (res1, res2), score in blosum62.items():
+            settings["sub_scores"][(res1, res2)] = score
+            settings["sub_scores"][(res2, res1)] = score
+    return settings
+
+
+class _WordIndex(object):
+    """
+    Word positions of the cd_hit() representatives, kept sorted by word so all the hits a query has against every
+    representative can be pulled out with a couple of binary searches. New representatives go into a small tier that is
+    merged into the main one once it fills up, so the index isn't re-sorted every time a cluster is founded.
+    """
+    def __init__(self, merge_size=64):
+        self.merge_size = merge_size
+        self._main = [np.zeros(0, dtype=np.int64)] * 3  # [word codes, representatives, positions]
+        self._recent = []
+        self._recent_sorted = None
+
+    def add(self, rep, codes):
+        """
+        :param rep: Index of the representative
+        :param codes: Integer word codes of the representative, in sequence order
+        """
+        self._recent.append((rep, codes))
+        self._recent_sorted = None
+        if len(self._recent) >= self.merge_size:
+            self._main = self._build([self._main] + [self._unpack(rep, codes) for rep, codes in self._recent])
+            self._recent = []
+
+    @staticmethod
+    def _unpack(rep, codes):
+        return [codes, np.full(len(codes), rep, dtype=np.int64), np.arange(len(codes), dtype=np.int64)]
+
+    @staticmethod
+    def _build(parts):
+        columns = [np.concatenate([part[col] for part in parts]) for col in range(3)]
+        order = np.argsort(columns[0], kind="stable")
+        return [column[order] for column in columns]
+
+    def hits(self, query):
+        """
+        Every word shared between the query and a representative
+        :param query: Integer word codes
+        :return: Tuple of arrays --> (position in query, representative, position in representative)
+        """
+        if self._recent and self._recent_sorted is None:
+            self._recent_sorted = self._build([self._unpack(rep, codes) for rep, codes in self._recent])
+        found = [[], [], []]
+        for codes, reps, positions in [self._main] + ([self._recent_sorted] if self._recent else []):
+            left = np.searchsorted(codes, query, side="left")
+            counts = np.searchsorted(codes, query, side="right") - left
+            total = int(counts.sum())
+            if not total:
+                continue
+            indices = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(left, counts)
+            found[0].append(np.repeat(np.arange(len(query)), counts))
+            found[1].append(reps[indices])
+            found[2].append(positions[indices])
+        if not found[0]:
+            return tuple([np.zeros(0, dtype=np.int64)] * 3)
+        return tuple(np.concatenate(column) for column in found)
+
+
+def _cd_hit_candidates(codes, seq_len, index, rep_lens, settings):
+    """
+    Short-word filter for cd_hit(). While the CD-HIT bound holds (each mismatch or indel can knock out at most word_size
+    of the words in the shorter sequence), representatives that can't share enough words are ruled out without loss.
+    At low thresholds that bound drops to zero, so instead the shared words are counted on a band of diagonals around
+    the one most of them fall on, less what would be expected there by chance, and must come to at least half of what an
+    alignment at the threshold identity would be expected to keep (threshold ** word_size of the words).
+    :param codes: Integer word codes of the query
+    :param seq_len: Length of the query sequence
+    :param index: _WordIndex of the representatives
+    :param rep_lens: {representative: number of words}
+    :param settings: Dict with "threshold", "word_size", and "band_width"
+    :return: Representatives worth aligning against, most shared words first
+    """
+    threshold, word_size, band_width = settings["threshold"], settings["word_size"], settings["band_width"]
+    if not len(codes):
+        return []
+    min_shared = seq_len - word_size + 1 - ceil((1 - threshold) * seq_len) * word_size
+    if min_shared > 0:
+        words, word_counts = np.unique(codes, return_counts=True)
+        word_indx, reps = index.hits(words)[:2]
+        # Each hit is one copy of the word in the representative, and only as many copies as the query has can match
+        keys, rep_counts = np.unique(reps * len(words) + word_indx, return_counts=True)
+        reps = keys // len(words)
+        shared = np.minimum(rep_counts, word_counts[keys % len(words)])
+        reps, groups = np.unique(reps, return_inverse=True)
+        scores = np.bincount(groups, weights=shared)
+        keep = scores >= min_shared
+    else:
+        query_pos, reps, rep_pos = index.hits(codes)
+        offset = len(codes)
+        span = offset + max(rep_lens.values(), default=0) + 1
+        keys, counts = np.unique(reps * span + rep_pos - query_pos + offset, return_counts=True)
+        key_reps, key_diags = keys // span, keys % span - offset
+        reps, groups = np.unique(key_reps, return_inverse=True)
+        if not len(reps):
+            return []
+        best = np.lexsort((-counts, groups))
+        best_diags = key_diags[best][np.unique(groups[best], return_index=True)[1]]
+        in_band = np.abs(key_diags - best_diags[groups]) <= band_width
+        scores = np.bincount(groups, weights=counts * in_band)
+        totals = np.bincount(groups, weights=counts)
+        lens = np.array([rep_lens[rep] for rep in reps])
+        background = totals * np.minimum(2 * band_width + 1, lens) * np.minimum(len(codes), lens) / (len(codes) * lens)
+        keep = scores - background >= threshold ** word_size * len(codes) / 2
+    order = np.argsort(-scores[keep], kind="stable")
+    return reps[keep][order].tolist()
+
+
+def _cd_hit_align(task, func_args):
+    """
+    Align a sequence against its candidate representatives for cd_hit(), in order, until one of them is close enough
+    :param task: Tuple --> (index of the sequence, sequence, [(representative, representative sequence), ...])
+    :param func_args: [settings dict], as handed over by br.parallel_map()
+    :return: Tuple --> (index of the sequence, the representative it belongs with or None)
+    """
+    indx, seq, candidates = task
+    settings = func_args[0]
+    for rep, rep_seq in candidates:
+        band = _pair_band(seq, rep_seq, settings["word_size"], settings["band_width"])
+        identical = _banded_alignment(seq, rep_seq, band, settings)[1]
+        if seq and identical / len(seq) >= settings["threshold"]:
+            return indx, rep
+    return indx, None
 
 
 def _guess_alphabet(seqbuddy):
@@ -546,18 +1939,22 @@ def _guess_alphabet(seqbuddy):
     :return: IUPAC alphebet object
     """
     seq_list = seqbuddy if isinstance(seqbuddy, list) else seqbuddy.records
-    seq_list = [str(x.seq) for x in seq_list]
-    sequence = "".join(seq_list).upper()
-    sequence = re.sub("[NX\-?]", "", sequence)
-
-    if len(sequence) == 0:
+    composition = {}
+    for rec in seq_list:
+        for char, count in _upper_composition(_composition(rec)).items():
+            composition[char] = composition.get(char, 0) + count
+    for char in "NX-?":
+        composition.pop(char, None)
+    sequence_len = sum(composition.values())
+
+    if sequence_len == 0:
         return None
 
-    if 'U' in sequence:  # U is unique to RNA
+    if 'U' in composition:  # U is unique to RNA
         return IUPAC.ambiguous_rna
 
-    percent_dna = len(re.findall("[ATCG]", sequence)) / float(len(sequence))
-    percent_protein = len(re.findall("[ACDEFGHIKLMNPQRSTVWXY]", sequence)) / float(len(sequence))
+    percent_dna = sum([composition.get(char, 0) for char in "ATCG"]) / float(sequence_len)
+    percent_protein = sum([composition.get(char, 0) for char in "ACDEFGHIKLMNPQRSTVWXY"]) / float(sequence_len)
     if percent_dna > 0.85:  # odds that a sequence with no Us and such a high ATCG count be anything but DNA is low
         return IUPAC.ambiguous_dna
     elif percent_protein > 0.85:
@@ -568,8 +1965,9 @@ def _guess_alphabet(seqbuddy):
 
 def _guess_format(_input):
     """
-    Loop through many possible formats that BioPython has a parser for, and return the format that is
-    actually able to return records.
+    Sniff the start of the input for format signatures, then confirm by parsing the first record of the most likely
+    format(s). Only a bounded prefix of the input is read, unless the first record of a signature-matched format is
+    larger than that prefix.
     :param _input: Duck-typed; can be list, SeqBuddy object, file handle, or file path.
     :return: str or None
     """
@@ -582,50 +1980,35 @@ def _guess_format(_input):
         return _input.in_format
 
     # If input is a handle or path, try to read the file in each format, and assume success if not error and # seqs > 0
+    in_file = None
     if os.path.isfile(str(_input)):
-        _input = open(_input, "r", encoding="utf-8")
+        in_file = _input = open(_input, "r", encoding="utf-8")
 
     if str(type(_input)) == "<class '_io.TextIOWrapper'>" or isinstance(_input, StringIO):
         if not _input.seekable():  # Deal with input streams (e.g., stdout pipes)
             _input = StringIO(_input.read())
-        if _input.read() == "":
-            return "empty file"
-        _input.seek(0)
 
-        possible_formats = ["stockholm", "fasta", "gb", "phylipss", "phylipsr", "phylip", "phylip-relaxed",
-                            "fastq", "embl", "nexus", "seqxml", "clustal", "swiss"]
-        for next_format in possible_formats:
+        def trial_parse(next_format, sample):
+            if next_format in ["phylip", "phylipsr", "phylipss"]:
+                return br.phylip_guess(next_format, sample)
             try:
-                _input.seek(0)
-                if next_format in ["phylip", "phylipsr", "phylipss"]:
-                    phylip = br.phylip_guess(next_format, _input)
-                    if phylip:
-                        return phylip
-                    else:
-                        continue
-
-                seqs = SeqIO.parse(_input, next_format)
-                if next(seqs):
-                    _input.seek(0)
-                    return next_format
-                else:
-                    continue
-            except StopIteration:  # ToDo check that other types of error are not possible
-                continue
-            except ValueError:
-                continue
+                seqs = SeqIO.parse(sample, next_format)
+                return next_format if next(seqs) else None
             except AssertionError as err:
                 if next_format == 'swiss':
-                    continue
+                    raise ValueError(str(err))
                 else:
                     raise err
-            except SAXParseException:  # Thrown by seqxml parser
-                continue
-            except TreeError:  # Thrown by NEXUS tree files
-                continue
-            except br.PhylipError:
-                continue
-        return None  # Unable to determine format from file handle
+
+        possible_formats = ["stockholm", "fasta", "gb", "phylipss", "phylipsr", "phylip", "phylip-relaxed",
+                            "fastq", "embl", "nexus", "seqxml", "clustal", "swiss"]
+        # ToDo check that other types of error are not possible
+        guessed_format = br.trial_parse_formats(_input, possible_formats, trial_parse,
+                                                (StopIteration, ValueError, SAXParseException, TreeError,
+                                                 br.PhylipError, AssertionError))
+        if in_file:
+            in_file.close()
+        return guessed_format  # None if unable to determine format from file handle
 
     else:
         raise br.GuessError("Unsupported _input argument in guess_format(). %s" % _input)
@@ -646,6 +2029,22 @@ def make_copy(seqbuddy):
     return _copy
 
 
+def shallow_copy(seqbuddy, records=True):
+    """
+    Cheap alternative to make_copy() for functions that only read from the copy, or only replace whole attributes of
+    its records (rec.seq, rec.id, rec.features = [...], etc.). New SeqRecord, Seq and SeqFeature shells are created,
+    but the underlying sequence strings, feature locations, qualifiers and annotation values are shared with the
+    original. Use make_copy() if any of those are going to be edited in place.
+    :param seqbuddy: SeqBuddy object
+    :param records: Set to False to only copy the SeqBuddy attributes, leaving an empty records list
+    :return: SeqBuddy object
+    """
+    _copy = copy(seqbuddy)
+    _copy.hash_map = OrderedDict(seqbuddy.hash_map)
+    _copy.records = [_shallow_record(rec) for rec in seqbuddy.records] if records else []
+    return _copy
+
+
 # ################################################ MAIN API FUNCTIONS ################################################ #
 def annotate(seqbuddy, _type, location, strand=None, qualifiers=None, pattern=None):
     """
@@ -664,7 +2063,7 @@ def annotate(seqbuddy, _type, location, strand=None, qualifiers=None, pattern=No
     :return: The updated SeqBuddy object
     """
     # http://www.insdc.org/files/feature_table.html
-    old = make_copy(seqbuddy)
+    old = shallow_copy(seqbuddy)
     if pattern:
         recs = pull_recs(seqbuddy, pattern).records
     else:
@@ -958,7 +2357,7 @@ def back_translate(seqbuddy, mode='random', species=None, r_seed=None):
             lookup_table[aa] = ([best[0]], [1.0])
 
     clean_seq(seqbuddy, skip_list="\-*")
-    originals = make_copy(seqbuddy)
+    originals = shallow_copy(seqbuddy)
     for rec in seqbuddy.records:
         rec.features = []
         dna_seq = ["" for _ in range(len(rec))]
@@ -979,39 +2378,13 @@ def back_translate(seqbuddy, mode='random', species=None, r_seed=None):
 
 def bl2seq(seqbuddy):
     """
-    Does an all-by-all analysis of the sequences
+    Does an all-by-all analysis of the sequences. Everything goes into a single temporary BLAST database, which is then
+    searched with one batch of queries per CPU.
     :param seqbuddy: SeqBuddy object
     :return: OrderedDict of results dict[key][matches]
     """
-    # Note on blast2seq: Expect (E) values are calculated on an assumed database size of (the rather large) nr, so the
-    # threshold may need to be increased quite a bit to return short alignments
-    def mc_blast(_query, _args):
-        _subject_file = _args[0]
-        _query_file = br.TempFile()
-        with open(_query_file.path, "w", encoding="utf-8") as ofile:
-            ofile.write(_query.format("fasta"))
-
-        if subject.id == _query.id:
-            return
-
-        _blast_res = Popen("%s -query %s -subject %s -outfmt 6" %
-                           (blast_bin, _query_file.path, _subject_file), stdout=PIPE, shell=True).communicate()
-        _blast_res = _blast_res[0].decode().split("\n")[0].split("\t")
-
-        if len(_blast_res) == 1:
-            _result = "%s\t%s\t0\t0\t0\t0\n" % (subject.id, _query.id)
-        else:
-            # values are: query, subject, %_ident, length, evalue, bit_score
-            if _blast_res[10] == '0.0':
-                _blast_res[10] = '1e-180'
-            _result = "%s\t%s\t%s\t%s\t%s\t%s\n" % (_blast_res[0], _blast_res[1], _blast_res[2],
-                                                    _blast_res[3], _blast_res[10], _blast_res[11].strip())
-
-        with lock:
-            with open("%s%sblast_results.txt" % (tmp_dir.path, os.path.sep), "a", encoding="utf-8") as _ofile:
-                _ofile.write(_result)
-        return
-
+    # Note on E-values: These are calculated against the database of all input sequences, so the threshold may need to
+    # be increased quite a bit to return short alignments
     if seqbuddy.alpha == IUPAC.protein and not _check_for_blast_bin("blastp"):
         raise RuntimeError("Blastp not present in $PATH or working directory.")
 
@@ -1019,28 +2392,66 @@ def bl2seq(seqbuddy):
             and not _check_for_blast_bin("blastn"):
         raise RuntimeError("Blastn not present in $PATH or working directory.")
 
-    blast_bin = "blastp" if seqbuddy.alpha == IUPAC.protein else "blastn"
+    if not _check_for_blast_bin("makeblastdb"):
+        raise RuntimeError("Makeblastdb not present in $PATH or working directory.")
 
-    from multiprocessing import Lock
-    lock = Lock()
+    blast_bin = "blastp" if seqbuddy.alpha == IUPAC.protein else "blastn"
+    dbtype = "prot" if seqbuddy.alpha == IUPAC.protein else "nucl"
     tmp_dir = br.TempDir()
 
-    # Copy the seqbuddy records into new list, so they can be iteratively deleted below
+    # Records are written with positional IDs, so makeblastdb can't mangle them
     make_ids_unique(seqbuddy, sep="-")
-    seqs_copy = seqbuddy.records[:]
-    subject_file = "%s%ssubject.fa" % (tmp_dir.path, os.path.sep)
-    for subject in seqbuddy.records:
-        with open(subject_file, "w", encoding="utf-8") as ifile:
-            SeqIO.write(subject, ifile, "fasta")
-
-        br.run_multicore_function(seqs_copy, mc_blast, [subject_file], out_type=sys.stderr, quiet=True)
-        seqs_copy = seqs_copy[1:]
-
-    with open("%s%sblast_results.txt" % (tmp_dir.path, os.path.sep), "r", encoding="utf-8") as _ifile:
-        output_list = _ifile.read().strip().split("\n")
+    records = seqbuddy.records
+    with open("%s%sseqs.fa" % (tmp_dir.path, os.path.sep), "w", encoding="utf-8") as ofile:
+        for indx, rec in enumerate(records):
+            ofile.write(">s%s\n%s\n" % (indx, str(rec.seq)))
+
+    makeblastdb = Popen("makeblastdb -dbtype {0} -in {1}{2}seqs.fa -out {1}{2}seqs_db "
+                        "-parse_seqids".format(dbtype, tmp_dir.path, os.path.sep), shell=True, stdout=PIPE, stderr=PIPE)
+    makeblastdb_err = makeblastdb.communicate()[1].decode("utf-8")
+    if makeblastdb.returncode:
+        raise RuntimeError("makeblastdb failed to build the database:\n%s" % makeblastdb_err)
+
+    # Split the queries into one chunk per core. Each chunk is a single BLAST process, and they all run at once
+    chunk_size = ceil(len(records) / br.usable_cpu_count()) if records else 1
+    searches = []
+    for chunk_start in range(0, len(records), chunk_size):
+        query_file = "%s%squery_%s.fa" % (tmp_dir.path, os.path.sep, chunk_start)
+        with open(query_file, "w", encoding="utf-8") as ofile:
+            for indx in range(chunk_start, min(chunk_start + chunk_size, len(records))):
+                ofile.write(">s%s\n%s\n" % (indx, str(records[indx].seq)))
+        searches.append(Popen("%s -query %s -db %s%sseqs_db -outfmt 6 -max_target_seqs %s" %
+                              (blast_bin, query_file, tmp_dir.path, os.path.sep, len(records)),
+                              shell=True, stdout=PIPE, stderr=PIPE))
+
+    # Hits come out best first, so the first line for each query/subject pair is the one to keep
+    top_hits = {}
+    for search in searches:
+        blast_output, blast_err = [output.decode("utf-8") for output in search.communicate()]
+        if search.returncode:
+            raise RuntimeError("%s failed:\n%s" % (blast_bin, blast_err))
+        for line in blast_output.split("\n"):
+            line = line.split("\t")
+            if len(line) < 12:
+                continue
+            pair = (int(line[0][1:]), int(line[1][1:]))
+            if pair not in top_hits:
+                top_hits[pair] = line
+
+    # Only one direction is reported for each pair of sequences (later record as query, earlier one as subject)
+    output_list = []
+    for subj_indx, subject in enumerate(records):
+        for query_indx in range(subj_indx + 1, len(records)):
+            query = records[query_indx]
+            blast_res = top_hits.get((query_indx, subj_indx))
+            if not blast_res:
+                output_list.append([subject.id, query.id, "0", "0", "0", "0"])
+            else:
+                # values are: query, subject, %_ident, length, evalue, bit_score
+                evalue = '1e-180' if blast_res[10] == '0.0' else blast_res[10]
+                output_list.append([query.id, subject.id, blast_res[2], blast_res[3], evalue, blast_res[11].strip()])
 
     # Push output into a dictionary of dictionaries, for more flexible use outside of this function
-    output_list = [x.split("\t") for x in output_list]
     output_list = sorted(output_list, key=lambda l: l[0])
     output_dict = {}
     for match in output_list:
@@ -1202,6 +2613,82 @@ def blast(subject, query, **kwargs):
     return new_seqs
 
 
+def cd_hit(seqbuddy, threshold=0.9, word_size=None, band_width=16, max_processes=0):
+    """
+    Greedy incremental clustering, along the lines of CD-HIT. Sequences are visited from longest to shortest, and each
+    one either joins the first representative it matches at or above the identity threshold, or becomes a new
+    representative itself. A short-word filter rules out representatives that don't share enough words before anything
+    is aligned, and only representatives are indexed, so memory scales with the number of clusters rather than the
+    number of pairs. Sequences are handled in batches: each batch is aligned against the existing representatives across
+    a process pool, then anything left over is checked against the clusters founded within the batch, in order.
+    :param seqbuddy: SeqBuddy object
+    :param threshold: Minimum identity (identical residues / length of the shorter sequence) needed to join a cluster
+    :param word_size: Word length for the filter (defaults to the CD-HIT recommendation for the threshold)
+    :param band_width: Number of extra diagonals to align on either side of those the shared words fall on
+    :param max_processes: Maximum number of worker processes (0 uses every available core)
+    :return: SeqBuddy object holding the representatives, with the IDs of their cluster members in buddy_data["cluster"]
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError("The identity threshold must be between 0 and 1.")
+    if band_width < 0:
+        raise ValueError("The band width can not be negative.")
+
+    if word_size is None:
+        if seqbuddy.alpha == IUPAC.protein:
+            word_sizes = [(0.7, 5), (0.6, 4), (0.5, 3), (0, 2)]
+        else:
+            word_sizes = [(0.95, 10), (0.9, 8), (0.88, 7), (0.85, 6), (0.8, 5), (0, 4)]
+        word_size = [size for min_ident, size in word_sizes if threshold >= min_ident][0]
+    elif word_size < 1:
+        raise ValueError("The word size must be a positive integer.")
+    settings = _pairwise_settings(seqbuddy.alpha)
+    settings.update({"threshold": threshold, "word_size": word_size, "band_width": band_width})
+    max_processes = max_processes if max_processes > 0 else br.usable_cpu_count()
+
+    records = seqbuddy.records
+    seqs = [str(rec.seq).upper().replace("-", "") for rec in records]
+    vocab = {}
+    codes = [np.array([vocab.setdefault(seq[i:i + word_size], len(vocab)) for i in range(len(seq) - word_size + 1)],
+                      dtype=np.int64) for seq in seqs]
+    index = _WordIndex()  # Only representatives are indexed
+    rep_lens = {}
+    clusters = OrderedDict()
+    order = sorted(range(len(seqs)), key=lambda i: len(seqs[i]), reverse=True)
+    batch_size = 256  # Fixed, so the clusters don't depend on the number of processes
+    for batch in [order[i:i + batch_size] for i in range(0, len(order), batch_size)]:
+        tasks = []
+        for indx in batch:
+            candidates = _cd_hit_candidates(codes[indx], len(seqs[indx]), index, rep_lens, settings)
+            tasks.append((indx, seqs[indx], [(rep, seqs[rep]) for rep in candidates]))
+        if max_processes == 1 or sum([len(task[2]) for task in tasks]) < 50:
+            matches = [_cd_hit_align(task, [settings]) for task in tasks]
+        else:
+            matches = br.parallel_map(_cd_hit_align, tasks, func_args=[settings], max_workers=max_processes, quiet=True)
+            for match in matches:
+                if isinstance(match, br.TaskError):
+                    raise RuntimeError("Pairwise alignment failed.\n%s" % match.trace)
+
+        old_reps = set(clusters)
+        for indx, rep in matches:
+            if rep is None:
+                candidates = _cd_hit_candidates(codes[indx], len(seqs[indx]), index, rep_lens, settings)
+                task = (indx, seqs[indx], [(rep, seqs[rep]) for rep in candidates if rep not in old_reps])
+                rep = _cd_hit_align(task, [settings])[1]
+            if rep is None:
+                clusters[indx] = []
+                index.add(indx, codes[indx])
+                rep_lens[indx] = len(codes[indx])
+            else:
+                clusters[rep].append(records[indx].id)
+
+    seqbuddy.records = []
+    for indx, rec in enumerate(records):
+        if indx in clusters:
+            _add_buddy_data(rec, "cluster", clusters[indx])
+            seqbuddy.records.append(rec)
+    return seqbuddy
+
+
 def clean_seq(seqbuddy, ambiguous=True, rep_char="N", skip_list=None):
     """
     Removes all non-sequence characters, and converts ambiguous characters to 'X' if ambiguous=False
@@ -1292,37 +2779,62 @@ def count_codons(seqbuddy):
         codontable = CodonTable.ambiguous_dna_by_name['Standard'].forward_table
     else:
         codontable = CodonTable.ambiguous_rna_by_name['Standard'].forward_table
+    # All records are counted in one pass. Each codon is keyed by (record index, alphabetical rank of the codon)
+    sequences = [str(rec.seq).replace("-", "").replace(".", "").upper() for rec in seqbuddy.records]
+    num_codons = [len(sequence) // 3 for sequence in sequences]
+    codons, codon_map = _unique_codons("".join([seq[:num * 3] for seq, num in zip(sequences, num_codons)]))[:2]
+
+    residues = OrderedDict()
+    for codon in codons:
+        if codon in ['ATG', 'AUG']:
+            residues[codon] = 'M'
+        elif codon == 'NNN':
+            residues[codon] = 'X'
+        elif codon in ['TAA', 'TAG', 'TGA', 'UAA', 'UAG', 'UGA']:
+            residues[codon] = '*'
+        else:
+            try:
+                residues[codon] = codontable[codon]
+            except KeyError:
+                residues[codon] = None
+
+    alpha_rank = np.empty(len(codons), dtype=np.int64)
+    alpha_rank[np.argsort(codons, kind="stable")] = np.arange(len(codons))
+    codons = sorted(codons)
+    width = max(len(codons), 1)
+    rec_indices = np.repeat(np.arange(len(sequences), dtype=np.int64), num_codons)
+    keys = rec_indices * width + alpha_rank[codon_map]
+    if len(sequences) * width <= 4 * len(keys) + 1024:
+        counts = np.bincount(keys, minlength=len(sequences) * width)
+        keys = np.flatnonzero(counts)
+        counts = counts[keys]
+    else:
+        keys, counts = np.unique(keys, return_counts=True)
+
+    # Invalid codons are reported and dropped before the tables are assembled
+    valid = np.array([residues[codon] is not None for codon in codons] + [True])[keys % width]
+    for key, count in zip(keys[~valid].tolist(), counts[~valid].tolist()):
+        br._stderr("Warning: Codon '{0}' is invalid. Codon will be skipped.\n".format(codons[key % width]) * count)
+    keys, counts = keys[valid], counts[valid]
+
+    # Percentages only depend on (count, number of codons), so each distinct pair is only rounded once
+    totals = np.array(num_codons + [0], dtype=np.int64)[keys // width]
+    scale = int(totals.max(initial=0)) + 1
+    pairs, pair_map = np.unique(counts * scale + totals, return_inverse=True)
+    percents = [round(pair // scale / float(pair % scale) * 100, 3) for pair in pairs.tolist()]
+    percents = np.array(percents + [0.], dtype=object)[pair_map.reshape(-1)]
+    names = np.array(codons + [""], dtype=object)[keys % width]
+    amino_acids = np.array([residues[codon] for codon in codons] + [""], dtype=object)[keys % width]
+    bounds = np.searchsorted(keys // width, np.arange(len(sequences) + 1)).tolist()
+
+    with _gc_paused():
+        names = names.tolist()
+        rows = list(map(list, zip(amino_acids.tolist(), counts.tolist(), percents.tolist())))
+        data_tables = [OrderedDict(zip(names[start:end], rows[start:end])) for start, end in zip(bounds[:-1], bounds[1:])]
+
     output = OrderedDict()
-    sb_copy = make_copy(seqbuddy)
-    replace_subsequence(sb_copy, "[-.]")
-    uppercase(sb_copy)
-    for rec in sb_copy.records:
-        sequence = str(rec.seq)
-        if len(sequence) % 3 != 0:
-            while len(sequence) % 3 != 0:
-                sequence = sequence[:-1]
-        data_table = {}
-        num_codons = len(sequence) / 3
-        while len(sequence) > 0:
-            codon = str(sequence[:3])
-            if codon in data_table:
-                data_table[codon][1] += 1
-            else:
-                if codon in ['ATG', 'AUG']:
-                    data_table[codon] = ['M', 1, 0.0]
-                elif codon == 'NNN':
-                    data_table[codon] = ['X', 1, 0.0]
-                elif codon in ['TAA', 'TAG', 'TGA', 'UAA', 'UAG', 'UGA']:
-                    data_table[codon] = ['*', 1, 0.0]
-                else:
-                    try:
-                        data_table[codon] = [codontable[codon], 1, 0.0]
-                    except KeyError:
-                        br._stderr("Warning: Codon '{0}' is invalid. Codon will be skipped.\n".format(codon))
-            sequence = sequence[3:]
-        for codon in data_table:
-            data_table[codon][2] = round(data_table[codon][1] / float(num_codons) * 100, 3)
-        output[rec.id] = OrderedDict(sorted(data_table.items(), key=lambda x: x[0]))
+    for rec, data_table in zip(seqbuddy.records, data_tables):
+        output[rec.id] = data_table
     for rec in seqbuddy.records:
         try:
             rec.buddy_data['Codon_frequency'] = output[rec.id]
@@ -1338,42 +2850,29 @@ def count_residues(seqbuddy):
     :return: annotated SeqBuddy object. Residue counts are appended to buddy_data in the SeqRecord obects
     """
     for rec in seqbuddy.records:
-        resid_count = {}
-        seq = str(rec.seq).upper()
-        for char in seq:
-            resid_count.setdefault(char, 0)
-            resid_count[char] += 1
-
+        composition = _upper_composition(_composition(rec))
         seq_len = len(rec)
-        for residue, count in resid_count.items():
-            resid_count[residue] = [count, count / seq_len]
+        resid_count = {residue: [count, count / seq_len] for residue, count in composition.items()}
 
-        if seqbuddy.alpha is IUPAC.protein:
-            ambig = len(re.findall("X", seq))
-            if ambig > 0:
-                resid_count['% Ambiguous'] = round(100 * ambig / seq_len, 2)
-
-            pos = len(re.findall("[HKR]", seq))
-            resid_count['% Positive'] = round(100 * pos / seq_len, 2)
+        def percent(residues):
+            return round(100 * sum([composition.get(residue, 0) for residue in residues]) / seq_len, 2)
 
-            neg = len(re.findall("[DEC]", seq))
-            resid_count['% Negative'] = round(100 * neg / seq_len, 2)
-
-            neut = len(re.findall("[GAVLIPFYWSTNQM]", seq))
-            resid_count['% Uncharged'] = round(100 * neut / seq_len, 2)
-
-            hydrophobic = len(re.findall("[AVLIPYFWMC]", seq))
-            resid_count['% Hydrophobic'] = round(100 * hydrophobic / seq_len, 2)
+        if seqbuddy.alpha is IUPAC.protein:
+            if composition.get("X"):
+                resid_count['% Ambiguous'] = percent("X")
 
-            hydrophilic = len(re.findall("[NQSTKRHDE]", seq))
-            resid_count['% Hydrophilic'] = round(100 * hydrophilic / seq_len, 2)
+            resid_count['% Positive'] = percent("HKR")
+            resid_count['% Negative'] = percent("DEC")
+            resid_count['% Uncharged'] = percent("GAVLIPFYWSTNQM")
+            resid_count['% Hydrophobic'] = percent("AVLIPYFWMC")
+            resid_count['% Hydrophilic'] = percent("NQSTKRHDE")
 
             for residue in ["A", "C", "D", "E", "F", "G", "H", "I", "K", "L", "M",
                             "N", "P", "Q", "R", "S", "T", "V", "W", "Y"]:
                 resid_count.setdefault(residue, [0, 0])
 
         else:
-            ambig = len(re.findall("[^ATCGU]", seq))
+            ambig = seq_len - sum([composition.get(residue, 0) for residue in "ATCGU"])
             if ambig > 0:
                 resid_count['% Ambiguous'] = round(100 * ambig / seq_len, 2)
 
@@ -1527,15 +3026,15 @@ def degenerate_sequence(seqbuddy, table=1):
 
     clean_seq(seqbuddy)
     uppercase(seqbuddy)
-    for _rec in seqbuddy.records:
-        seq_length = len(str(_rec.seq))
-        i = 0
-        degen_string = ""
-        while i < seq_length:
-            _codon = str(_rec.seq[i:i + 3])
-            degen_string += base_dict[_codon] if _codon in base_dict else _codon
-            i += 3
-        _rec.seq = Seq(str(degen_string), alphabet=IUPAC.ambiguous_dna)
+    # Degenerate each distinct codon once across all records, then expand back out to the full sequences
+    sequences = [str(_rec.seq) for _rec in seqbuddy.records]
+    ends = np.cumsum([len(seq) - len(seq) % 3 for seq in sequences]).tolist()
+    codons, codon_map = _unique_codons("".join([seq[:len(seq) - len(seq) % 3] for seq in sequences]))[:2]
+    degen_codons = "".join([base_dict[_codon] if _codon in base_dict else _codon for _codon in codons])
+    degen_codons = np.frombuffer(degen_codons.encode(), dtype=np.uint8).reshape(-1, 3)
+    degen_string = degen_codons[codon_map].tobytes().decode()
+    for _rec, seq, start, end in zip(seqbuddy.records, sequences, [0] + ends, ends):
+        _rec.seq = Seq(degen_string[start:end] + seq[end - start:], alphabet=IUPAC.ambiguous_dna)
     return seqbuddy
 
 
@@ -1585,12 +3084,13 @@ def delete_metadata(seqbuddy):
     return seqbuddy
 
 
-def delete_records(seqbuddy, patterns):
+def delete_records(seqbuddy, patterns, exact=False):
     """
     Deletes records with IDs matching a regex pattern
     :param seqbuddy: SeqBuddy object
     :param patterns: A single regex pattern, or list of patterns, to search with
     :type patterns: list str
+    :param exact: Treat patterns as a list of literal IDs/names, which is much faster for long lists
     :return: The modified SeqBuddy object
     """
     if type(patterns) == str:
@@ -1598,19 +3098,8 @@ def delete_records(seqbuddy, patterns):
     if type(patterns) != list:
         raise ValueError("'patterns' must be a list or a string.")
 
-    for indx, pattern in enumerate(patterns):
-        patterns[indx] = ".*" if pattern == "*" else pattern
-
-    patterns = "|".join(patterns)
-
-    retained_records = []
-    deleted = [rec.id for rec in pull_recs(make_copy(seqbuddy), patterns).records]
-    for rec in seqbuddy.records:
-        if rec.id in deleted:
-            continue
-        else:
-            retained_records.append(rec)
-    seqbuddy.records = retained_records
+    deleted = set(_match_record_positions(seqbuddy, patterns, exact=exact))
+    seqbuddy.records = [rec for indx, rec in enumerate(seqbuddy.records) if indx not in deleted]
     return seqbuddy
 
 
@@ -1621,34 +3110,26 @@ def delete_repeats(seqbuddy, scope='all'):  # scope in ['all', 'ids', 'seqs']
     :param scope: Specifies if deleting repeat seqs, ids, or all
     :return: The modified SeqBuddy object
     """
-    # First, remove duplicate IDs
+    # First, remove duplicate IDs. The first copy of each repeated ID is moved to the end of the records
     if scope in ['all', 'ids']:
-        find_repeats(seqbuddy)
-        if len(seqbuddy.repeat_ids) > 0:
-            for rep_id in seqbuddy.repeat_ids:
-                store_one_copy = pull_recs(make_copy(seqbuddy), ["^%s$" % rep_id]).records[0]
-                delete_records(seqbuddy, "^%s$" % rep_id)
-                seqbuddy.records.append(store_one_copy)
-
-    # Then remove duplicate sequences
+        id_index = _index_records(seqbuddy.records, digests=False)[0]
+        retained_records = []
+        repeat_records = []
+        for indx, rec in enumerate(seqbuddy.records):
+            positions = id_index[rec.id]
+            if len(positions) == 1:
+                retained_records.append(rec)
+            elif positions[1] == indx:
+                repeat_records.append(seqbuddy.records[positions[0]])
+        seqbuddy.records = retained_records + repeat_records
+
+    # Then remove duplicate sequences, keeping the first ID listed for each
     if scope in ['all', 'seqs']:
         find_repeats(seqbuddy)
-        if len(seqbuddy.repeat_seqs) > 0:
-            rep_seq_ids = []
-            for seq in seqbuddy.repeat_seqs:
-                rep_seq_ids.append([])
-                for rep_seq_id in seqbuddy.repeat_seqs[seq]:
-                    rep_seq_ids[-1].append(rep_seq_id)
-
-            repeat_regex = ""
-
-            for repeat_seqs in rep_seq_ids:
-                for rep_seq in repeat_seqs[1:]:
-                    rep_seq = re.sub("([|.*?^\[\]()])", r"\\\1", rep_seq)
-                    repeat_regex += "^%s$|" % rep_seq
-
-            repeat_regex = repeat_regex[:-1]
-            delete_records(seqbuddy, repeat_regex)
+        deleted = set()
+        for rep_seq_ids in seqbuddy.repeat_seqs.values():
+            deleted.update(rep_seq_ids[1:])
+        seqbuddy.records = [rec for rec in seqbuddy.records if rec.id not in deleted]
 
     seqbuddy.repeat_seqs = OrderedDict()
     seqbuddy.repeat_ids = OrderedDict()
@@ -1843,26 +3324,16 @@ def extract_regions(seqbuddy, positions):
     new_records = []
     for rec in seqbuddy.records:
         new_rec_positions = create_residue_list(rec, positions)
-        new_seq = []
-        if rec.features:  # This is super slow for large records...
+        seq = str(rec.seq)
+        new_seq = ''.join([seq[indx] for indx in new_rec_positions])
+        new_seq = Seq(new_seq, alphabet=rec.seq.alphabet)
+        new_seq = SeqRecord(new_seq, rec.id, rec.name, rec.description)
+        if rec.features:
+            kept = np.zeros(len(seq), dtype=bool)
+            kept[new_rec_positions] = True
             remapper = FeatureReMapper(rec)
-            for indx, residue in enumerate(str(rec.seq)):
-                if indx in new_rec_positions:
-                    remapper.extend(True)
-                    new_seq.append(residue)
-                else:
-                    remapper.extend(False)
-            new_seq = ''.join(new_seq)
-            new_seq = Seq(new_seq, alphabet=rec.seq.alphabet)
-            new_seq = SeqRecord(new_seq, rec.id, rec.name, rec.description)
+            remapper.extend_many(kept)
             new_seq = remapper.remap_features(new_seq)
-        else:
-            seq = str(rec.seq)
-            for indx in new_rec_positions:
-                new_seq.append(seq[indx])
-            new_seq = ''.join(new_seq)
-            new_seq = Seq(new_seq, alphabet=rec.seq.alphabet)
-            new_seq = SeqRecord(new_seq, rec.id, rec.name, rec.description)
 
         new_records.append(new_seq)
 
@@ -1870,78 +3341,75 @@ def extract_regions(seqbuddy, positions):
     return seqbuddy
 
 
-def find_cpg(seqbuddy):
+def find_cpg(seqbuddy, window_size=200, oe_threshold=.6, gc_threshold=.5):
     """
     Predicts locations of CpG islands in DNA sequences
     :param seqbuddy: SeqBuddy object
+    :param window_size: Width of the sliding window (shorter sequences are treated as a single window)
+    :param oe_threshold: Observed/expected CpG ratio that a position must exceed to be in an island
+    :param gc_threshold: Fraction of C+G that a position must exceed to be in an island
     :return: Modified SeqBuddy object (buddy_data["cpgs"] appended to all records)
     """
     seqbuddy = clean_seq(seqbuddy)
     if seqbuddy.alpha not in [IUPAC.ambiguous_dna, IUPAC.unambiguous_dna]:
         raise TypeError("DNA sequence required, not protein or RNA.")
+    if window_size < 1:
+        raise ValueError("The window size must be a positive integer.")
 
     records = []
 
-    def cpg_calc(in_seq):  # Returns observed/expected value of a sequence
-        in_seq = in_seq.upper()
-        observed_cpg = len(re.findall("CG", in_seq)) * len(in_seq)
-        expected = (len(re.findall("[CG]", in_seq)) / 2) ** 2
-        expected = 1 if not expected else expected  # Prevent DivByZero
-        return observed_cpg / expected
-
-    def cg_percent(in_seq):  # Returns the CG % of a sequence
-        in_seq = in_seq.upper()
-        return len(re.findall("[CG]", in_seq)) / len(in_seq)
+    def window_values(in_seq, window):  # Returns the O/E and CG % of every window, each position averaged over them
+        # Running totals of C/G and CpG make the count in any window a single subtraction
+        seq_array = np.frombuffer(in_seq.upper().encode("utf-8"), dtype=np.uint8)
+        is_gc = (seq_array == ord("C")) | (seq_array == ord("G"))
+        is_cpg = (seq_array[:-1] == ord("C")) & (seq_array[1:] == ord("G"))
+        gc_sums = np.concatenate(([0], np.cumsum(is_gc)))
+        cpg_sums = np.concatenate(([0], np.cumsum(is_cpg)))
+
+        starts = np.arange(len(in_seq) - window + 1)
+        gc_counts = gc_sums[starts + window] - gc_sums[starts]
+        cpg_counts = cpg_sums[starts + window - 1] - cpg_sums[starts]
+        expected = (gc_counts / 2) ** 2
+        expected[expected == 0] = 1  # Prevent DivByZero
+        oe_windows = cpg_counts * window / expected
+
+        # Each position gets the mean of the windows covering it, again from running totals
+        positions = np.arange(len(in_seq))
+        first = np.maximum(positions - window + 1, 0)
+        last = np.minimum(positions, len(in_seq) - window) + 1
+        oe_sums = np.concatenate(([0.], np.cumsum(oe_windows)))
+        gc_window_sums = np.concatenate(([0], np.cumsum(gc_counts)))
+        divisors = np.where(positions + 1 <= window, positions + 1,
+                            np.where(len(in_seq) - window - positions - 1 < 0, len(in_seq) - positions, window))
+        oe_values = (oe_sums[last] - oe_sums[first]) / divisors
+        cg_percents = (gc_window_sums[last] - gc_window_sums[first]) / window / divisors
+        return oe_values, cg_percents
 
     def find_islands(cg_percents, oe_values):  # Returns a list of tuples containing the start and end of an island
-        _indx = 0
-        out_list = []
-        while _indx < len(cg_percents):
-            if cg_percents[_indx] > .5 and oe_values[_indx] > .6:
-                start = _indx
-                while _indx < len(cg_percents) and cg_percents[_indx] > .5 and oe_values[_indx] > .6:
-                    _indx += 1
-                end = _indx
-                out_list.append((start, end))
-            _indx += 1
-        return out_list
+        in_island = np.concatenate(([0], ((cg_percents > gc_threshold) & (oe_values > oe_threshold)).astype(np.int8),
+                                    [0]))
+        edges = np.diff(in_island)
+        return list(zip(np.where(edges == 1)[0].tolist(), np.where(edges == -1)[0].tolist()))
 
     def map_cpg(in_seq, island_ranges):  # Maps CpG islands onto a sequence as capital letters
         cpg_seq = in_seq.lower()
+        output = []
+        prev_end = 0
         for pair in island_ranges:
-            cpg_seq = cpg_seq[:pair[0]] + cpg_seq[pair[0]:pair[1] + 1].upper() + cpg_seq[pair[1] + 1:]
-        return cpg_seq
+            output.append(str(cpg_seq[prev_end:pair[0]]))
+            output.append(str(cpg_seq[pair[0]:pair[1] + 1]).upper())
+            prev_end = pair[1] + 1
+        output.append(str(cpg_seq[prev_end:]))
+        return Seq("".join(output), alphabet=cpg_seq.alphabet)
 
     for rec in seqbuddy.records:
         seq = rec.seq
+        indices = []
+        if len(seq):
+            window = len(seq) if len(seq) < window_size else window_size
+            oe_values, cg_percents = window_values(str(seq), window)
+            indices = find_islands(cg_percents, oe_values)
 
-        oe_vals_list = [0 for _ in range(len(seq))]
-        cg_percent_list = [0 for _ in range(len(seq))]
-        window_size = len(seq) if len(seq) < 200 else 200
-
-        for indx, window in enumerate([seq[i:i + window_size] for i in range(len(seq) - window_size + 1)]):
-            cpg = cpg_calc(str(window))
-            for i in range(window_size):
-                oe_vals_list[indx + i] += cpg
-
-            cg_perc = cg_percent(str(window))
-            for i in range(window_size):
-                cg_percent_list[indx + i] += cg_perc
-
-        for indx in range(len(oe_vals_list)):
-            if indx + 1 <= window_size:
-                oe_vals_list[indx] /= (indx + 1)
-                cg_percent_list[indx] /= (indx + 1)
-
-            elif (len(oe_vals_list) - window_size) - (indx + 1) < 0:
-                oe_vals_list[indx] /= (len(oe_vals_list) - indx)
-                cg_percent_list[indx] /= (len(cg_percent_list) - indx)
-
-            else:
-                oe_vals_list[indx] /= window_size
-                cg_percent_list[indx] /= window_size
-
-        indices = find_islands(cg_percent_list, oe_vals_list)
         cpg_features = [SeqFeature(location=FeatureLocation(start, end), type="CpG_island",
                                    qualifiers={'created_by': 'SeqBuddy'}) for (start, end) in indices]
         for feature in rec.features:
@@ -1956,45 +3424,38 @@ def find_cpg(seqbuddy):
     return seqbuddy
 
 
-def find_orfs(seqbuddy, include_feature=True, include_buddy_data=True):
+def find_orfs(seqbuddy, include_feature=True, include_buddy_data=True, min_length=0, mode="scan"):
     """
     Finds all the open reading frames in the sequences and their reverse complements.
     :param seqbuddy: SeqBuddy object
     :param include_feature: Add a new 'orf' feature to records
     :param include_buddy_data: Append information directly to records
+    :param min_length: Skip ORFs shorter than this many nucleotides (stop codon included)
+    :param mode: 'scan' (non-overlapping ORFs, read from the 5' end of each strand), 'longest' (one ORF per stop codon,
+                 from its first in-frame start codon), or 'nested' (every alternative start codon)
     :return: Annotated SeqBuddy object. The match indices are also stored in rec.buddy_data["find_orfs"].
     """
     if seqbuddy.alpha == IUPAC.protein:
         raise TypeError("Nucleic acid sequence required, not protein.")
 
-    pattern = "a[tu]g(?:...)*?(?:[tu]aa|[tu]ag|[tu]ga)"
+    if mode not in ["scan", "longest", "nested"]:
+        raise ValueError("find_orfs mode must be 'scan', 'longest', or 'nested', not '%s'." % mode)
 
     clean_seq(seqbuddy)
     lowercase(seqbuddy)
 
-    find_pattern(seqbuddy, pattern, ambig=True, include_feature=True, include_buddy_data=False)
-    lowercase(seqbuddy)
-
-    reverse_complement(seqbuddy)
-    find_pattern(seqbuddy, pattern, ambig=True, include_feature=True, include_buddy_data=False)
-    lowercase(seqbuddy)
-
-    reverse_complement(seqbuddy)
-
     for rec in seqbuddy.records:
-        buddy_data = {'+': [], '-': []}
-        feature_indicies = []
-        for indx, feature in enumerate(rec.features):
-            if 'regex' in feature.qualifiers.keys() and feature.qualifiers['regex'] == pattern:
-                if include_feature:
-                    feature.type = "orf"
-                    strand = "+" if feature.strand == +1 else "-"
-                    feature.qualifiers.pop("regex")
-                    buddy_data[strand].append((int(feature.location.start), int(feature.location.end)))
-                else:
-                    feature_indicies.append(indx)
-        for indx in sorted(feature_indicies, reverse=True):
-            del rec.features[indx]
+        seq_len = len(rec.seq)
+        buddy_data = {'+': _orf_spans(rec.seq, min_length, mode), '-': []}
+        # Reverse strand ORFs are listed in the order they are read off the reverse complement
+        for start, end in _orf_spans(rec.seq.reverse_complement(), min_length, mode):
+            buddy_data['-'].append((seq_len - end, seq_len - start))
+
+        if include_feature:
+            for strand, spans in [(+1, buddy_data['+']), (-1, buddy_data['-'])]:
+                for start, end in spans:
+                    rec.features.append(SeqFeature(location=FeatureLocation(start=start, end=end), type='orf',
+                                                   strand=strand, qualifiers={'added_by': 'SeqBuddy'}))
 
         if include_buddy_data:
             _add_buddy_data(rec, 'find_orfs')
@@ -2014,72 +3475,36 @@ def find_pattern(seqbuddy, *patterns, ambig=False, include_feature=True, include
     """
     # search through sequences for regex matches. For example, to find micro-RNAs
     lowercase(seqbuddy)
-    for pattern in patterns:
-        pattern_backup = str(pattern)
-        if ambig and seqbuddy.alpha == IUPAC.protein:
-            pattern = re.sub("[xX]", "[ARNDCQEGHILKMFPSTWYVX]", pattern)
-            pattern = re.sub("[bB]", "[NDB]", pattern)
-            pattern = re.sub("[zZ]", "[QEZ]", pattern)
-
-        elif ambig and seqbuddy.alpha in [IUPAC.ambiguous_dna or IUPAC.unambiguous_dna]:
-            pattern = re.sub("[kK]", "[GT]", pattern)
-            pattern = re.sub("[mM]", "[AC]", pattern)
-            pattern = re.sub("[rR]", "[AG]", pattern)
-            pattern = re.sub("[yY]", "[CT]", pattern)
-            pattern = re.sub("[sS]", "[CG]", pattern)
-            pattern = re.sub("[wW]", "[AT]", pattern)
-            pattern = re.sub("[bB]", "[CGT]", pattern)
-            pattern = re.sub("[vV]", "[CGA]", pattern)
-            pattern = re.sub("[hH]", "[ACT]", pattern)
-            pattern = re.sub("[dD]", "[AGT]", pattern)
-            pattern = re.sub("[xnXN]", "[ATCG]", pattern)
-
-        elif ambig and seqbuddy.alpha in [IUPAC.ambiguous_rna or IUPAC.unambiguous_rna]:
-            pattern = re.sub("[kK]", "[GU]", pattern)
-            pattern = re.sub("[mM]", "[AC]", pattern)
-            pattern = re.sub("[rR]", "[AG]", pattern)
-            pattern = re.sub("[yY]", "[CU]", pattern)
-            pattern = re.sub("[sS]", "[CG]", pattern)
-            pattern = re.sub("[wW]", "[AU]", pattern)
-            pattern = re.sub("[bB]", "[CGU]", pattern)
-            pattern = re.sub("[vV]", "[CGA]", pattern)
-            pattern = re.sub("[hH]", "[ACU]", pattern)
-            pattern = re.sub("[dD]", "[AGU]", pattern)
-            pattern = re.sub("[xnXN]", "[AUCG]", pattern)
-
-        if ambig:
-            safety_valve = br.SafetyValve()
-            # Strip out any double square brackets
-            while re.search("\[[^[\]]*?\[[^]]*\]", pattern):
-                safety_valve.step("Ambiguous %s regular expression '%s' failed compile." %
-                                  (seqbuddy.alpha, pattern_backup))
-                pattern = re.sub("(\[[^[\]]*?)\[([^]]*)\]", r"\1\2", pattern, count=1)
+    search = MotifSearch(patterns, alpha=seqbuddy.alpha, ambig=ambig)
+    all_matches = search.search([str(rec.seq) for rec in seqbuddy.records])
+    with _gc_paused():
+        for rec, matches in zip(seqbuddy.records, all_matches):
+            if include_feature:
+                for pattern in patterns:
+                    for start, end in matches.get(pattern, []):
+                        rec.features.append(SeqFeature(location=FeatureLocation(start=start, end=end),
+                                                       type='match', strand=+1,
+                                                       qualifiers={'regex': pattern, 'added_by': 'SeqBuddy'}))
 
-        for rec in seqbuddy.records:
             if include_buddy_data:
                 _add_buddy_data(rec, 'find_patterns')
-            indices = []
-            matches = re.finditer(pattern, str(rec.seq), flags=re.IGNORECASE)
-            new_seq = ""
-            last_match = 0
-            for match in matches:
-                indices.append(match.start())
-                if include_feature:
-                    rec.features.append(SeqFeature(location=FeatureLocation(start=match.start(), end=match.end()),
-                                                   type='match', strand=+1,
-                                                   qualifiers={'regex': pattern_backup, 'added_by': 'SeqBuddy'}))
-                if match.start() > 0:
-                    new_seq += str(rec.seq[last_match:match.start()])
-                new_seq += str(rec.seq[match.start():match.end()]).upper()
-                last_match = match.end()
-            new_seq += str(rec.seq[last_match:])
-            rec.seq = Seq(new_seq, alphabet=rec.seq.alphabet)
-
-            if include_buddy_data:
-                if not rec.buddy_data['find_patterns']:
-                    rec.buddy_data['find_patterns'] = OrderedDict({pattern_backup: indices})
+                indices = [[start for start, end in matches.get(pattern, [])] for pattern in patterns]
+                if rec.buddy_data['find_patterns']:
+                    rec.buddy_data['find_patterns'].update(zip(patterns, indices))
                 else:
-                    rec.buddy_data['find_patterns'][pattern_backup] = indices
+                    rec.buddy_data['find_patterns'] = OrderedDict(zip(patterns, indices))
+
+            # Uppercase every matched region, and rebuild the sequence with a single join
+            seq = str(rec.seq)
+            new_seq = []
+            last_match = 0
+            for start, end in sorted([span for spans in matches.values() for span in spans]):
+                if end > last_match:
+                    start = max(start, last_match)
+                    new_seq += [seq[last_match:start], seq[start:end].upper()]
+                    last_match = end
+            new_seq.append(seq[last_match:])
+            rec.seq = Seq("".join(new_seq), alphabet=rec.seq.alphabet)
     return seqbuddy
 
 
@@ -2092,57 +3517,42 @@ def find_repeats(seqbuddy):
     unique_seqs = OrderedDict()
     repeat_ids = OrderedDict()
     repeat_seqs = OrderedDict()
-
-    # First find replicate IDs
-    # MD5 hash all sequences as we go for memory efficiency when looking for replicate sequences (below)
-    # Need to work from a copy though, so sequences aren't overwritten
-    seqbuddy_copy = make_copy(seqbuddy)
-    for rec in seqbuddy_copy.records:
-        seq = str(rec.seq).encode("utf-8")
-        seq = md5(seq).hexdigest()
-        rec.seq = Seq(seq)
-        if rec.id in repeat_ids:
-            repeat_ids[rec.id].append(rec)
-        elif rec.id in unique_seqs:
-            repeat_ids[rec.id] = [rec]
-            repeat_ids[rec.id].append(unique_seqs[rec.id])
-            del (unique_seqs[rec.id])
-        else:
+    records = seqbuddy.records
+
+    # First find replicate IDs, listed in the order that their first repeat turns up
+    # Sequences are MD5 hashed in the same pass, for memory efficiency when looking for replicate sequences (below)
+    id_index, seq_digests = _index_records(records)
+    repeat_positions = OrderedDict()
+    for indx, rec in enumerate(records):
+        positions = id_index[rec.id]
+        if len(positions) == 1:
             unique_seqs[rec.id] = rec
+        elif positions[1] == indx:
+            repeat_positions[rec.id] = [positions[1], positions[0]] + positions[2:]
+            repeat_ids[rec.id] = [records[pos] for pos in repeat_positions[rec.id]]
 
     # Then look for replicate sequences
-    flip_uniqe = {}
-    del_keys = []
-    for key, value in unique_seqs.items():  # find and remove duplicates in/from the unique list
-        value = str(value.seq)
-        if value not in flip_uniqe:
-            flip_uniqe[value] = [key]
+    first_seen = {}
+
+    def add_seq(_id, digest):
+        if digest not in first_seen:
+            first_seen[digest] = _id
+        elif digest not in repeat_seqs:
+            repeat_seqs[digest] = [_id, first_seen[digest]]
         else:
-            if value not in repeat_seqs:
-                repeat_seqs[value] = [key]
-                repeat_seqs[value] += flip_uniqe[value]
-                if flip_uniqe[value][0] in unique_seqs:
-                    del_keys.append(flip_uniqe[value][0])
-            else:
-                repeat_seqs[value].append(key)
-            del_keys.append(unique_seqs[key].id)
-
-    for key in del_keys:
-        if key in unique_seqs:
-            del (unique_seqs[key])
-
-    for key, value in repeat_ids.items():  # find duplicates in the repeat ID list
-        for rep_seq in value:
-            rep_seq = str(rep_seq.seq)
-            if rep_seq not in flip_uniqe:
-                flip_uniqe[rep_seq] = [key]
-            else:
-                if rep_seq not in repeat_seqs:
-                    repeat_seqs[rep_seq] = [key]
-                    repeat_seqs[rep_seq] += flip_uniqe[rep_seq]
+            repeat_seqs[digest].append(_id)
 
-                else:
-                    repeat_seqs[rep_seq].append(key)
+    for rec_id in unique_seqs:  # find duplicates in the unique list
+        add_seq(rec_id, seq_digests[id_index[rec_id][0]])
+
+    for rep_seq_ids in repeat_seqs.values():  # and remove them from it
+        for rec_id in rep_seq_ids:
+            if rec_id in unique_seqs:
+                del unique_seqs[rec_id]
+
+    for rec_id, positions in repeat_positions.items():  # find duplicates in the repeat ID list
+        for pos in positions:
+            add_seq(rec_id, seq_digests[pos])
 
     seqbuddy.unique_seqs = unique_seqs
     seqbuddy.repeat_ids = repeat_ids
@@ -2151,7 +3561,7 @@ def find_repeats(seqbuddy):
 
 
 # ToDo: Make sure cut sites are not already in the features list
-def find_restriction_sites(seqbuddy, enzyme_group=(), min_cuts=1, max_cuts=None, quiet=False):
+def find_restriction_sites(seqbuddy, enzyme_group=(), min_cuts=1, max_cuts=None, quiet=False, max_processes=1):
     """
     Finds the restriction sites in the sequences in the SeqBuddy object
     :param seqbuddy: SeqBuddy object
@@ -2159,6 +3569,7 @@ def find_restriction_sites(seqbuddy, enzyme_group=(), min_cuts=1, max_cuts=None,
     :param min_cuts: The minimum cut threshold
     :param max_cuts: The maximum cut threshold
     :param quiet: Suppress stderr
+    :param max_processes: Split the records over this many worker processes (0 uses every available core)
     :return: annotated SeqBuddy object, and a dictionary of restriction sites added as the `restriction_sites` attribute
     """
     if seqbuddy.alpha == IUPAC.protein:
@@ -2169,26 +3580,17 @@ def find_restriction_sites(seqbuddy, enzyme_group=(), min_cuts=1, max_cuts=None,
 
     enzyme_group = list(enzyme_group) if enzyme_group else ["commercial"]
 
-    blacklist = ["AbaSI", "FspEI", "MspJI", "SgeI", "AspBHI", "SgrTI", "YkrI", "BmeDI"]  # highly nonspecific
-    blacklist += ["AjuI", "AlfI", "AloI", "ArsI", "BaeI", "BarI", "BcgI", "BdaI", "BplI", "BsaXI", "Bsp24I", "CjeI",
-                  "CjePI", "CspCI", "FalI", "Hin4I", "NgoAVIII", "NmeDI", "PpiI", "PsrI", "R2_BceSIV", "RdeGBIII",
-                  "SdeOSI", "TstI", "UcoMSI"]  # two-cutting
-    blacklist += ["AlwFI", "AvaIII", "BmgI", "BscGI", "BspGI", "BspNCI", "Cdi630V", "Cgl13032I", "Cgl13032II",
-                  "CjeFIII", "CjeFV", "CjeNII", "CjeP659IV", "CjuI", "CjuII", "DrdII", "EsaSSI", "FinI", "GauT27I",
-                  "HgiEII", "Hpy99XIII", "Hpy99XIV", "Jma19592I", "MjaIV", "MkaDII", "NhaXI", "PenI", "Pfl1108I",
-                  "RdeGBI", "RflFIII", "RlaI", "RpaTI", "SnaI", "Sno506I", "SpoDI", "TssI", "TsuI", "UbaF11I",
-                  "UbaF12I", "UbaF13I", "UbaF14I", "UbaF9I", "UbaPI"]  # non-cutters
-
+    from Bio.Restriction import RestrictionBatch, CommOnly, AllEnzymes  # Slow to import (builds ~800 enzyme classes)
     batch = RestrictionBatch([])
     for enzyme in enzyme_group:
         if enzyme == "commercial":
             for res in CommOnly:
-                if str(res) not in blacklist:
+                if str(res) not in RESTRICTION_BLACKLIST:
                     batch.add(res)
 
         elif enzyme == "all":
             for res in AllEnzymes:
-                if str(res) not in blacklist:
+                if str(res) not in RESTRICTION_BLACKLIST:
                     batch.add(res)
 
         else:
@@ -2197,28 +3599,42 @@ def find_restriction_sites(seqbuddy, enzyme_group=(), min_cuts=1, max_cuts=None,
             except ValueError:
                 br._stderr("Warning: %s not a known enzyme\n" % enzyme, quiet=quiet)
 
+    index = RestrictionIndex.get(batch)
+    seqs = [RestrictionIndex.clean(str(rec.seq)) for rec in seqbuddy.records]
+    max_processes = max_processes if max_processes > 0 else br.usable_cpu_count()
+    if max_processes == 1 or len(seqs) < 2:
+        all_cuts = index.scan(seqs)
+    else:
+        # One chunk of records per core. The workers are forked, so they all share the index that was just compiled
+        chunk_size = ceil(len(seqs) / max_processes)
+        chunks = [seqs[chunk_start:chunk_start + chunk_size] for chunk_start in range(0, len(seqs), chunk_size)]
+        all_cuts = []
+        for result in br.parallel_map(index.scan, chunks, max_workers=max_processes, quiet=True):
+            if isinstance(result, br.TaskError):
+                raise RuntimeError("Restriction site search failed.\n%s" % result.trace)
+            all_cuts += result
+
     sites = []
-    for rec in seqbuddy.records:
-        rec.res_sites = {}
-        analysis = Analysis(batch, rec.seq)
-        result = analysis.with_sites()
-        for key, value in result.items():
-            if key.cut_twice():
-                br._stderr("Warning: Double-cutters not supported.\n", quiet=quiet)
-                pass
-            elif min_cuts <= len(value) <= max_cuts:
-                try:
-                    for zyme in value:
-                        cut_start = zyme + key.fst3 - 1
-                        cut_end = zyme + key.fst5 + abs(key.ovhg) - 1
-                        rec.features.append(SeqFeature(FeatureLocation(start=cut_start, end=cut_end), type=str(key)))
-                except TypeError:
-                    br._stderr("Warning: No-cutters not supported.\n", quiet=quiet)
+    with _gc_paused():
+        for rec, cuts in zip(seqbuddy.records, all_cuts):
+            rec.res_sites = OrderedDict()  # The cuts already come back sorted by enzyme
+            for key, value in cuts.items():
+                if key.cut_twice():
+                    br._stderr("Warning: Double-cutters not supported.\n", quiet=quiet)
                     pass
-                rec.res_sites[key] = value
-        rec.res_sites = OrderedDict(sorted(rec.res_sites.items(), key=lambda x: x[0]))
-        sites.append((rec.id, rec.res_sites))
-    order_features_alphabetically(seqbuddy)
+                elif min_cuts <= len(value) <= max_cuts:
+                    try:
+                        for zyme in value:
+                            cut_start = zyme + key.fst3 - 1
+                            cut_end = zyme + key.fst5 + abs(key.ovhg) - 1
+                            rec.features.append(SeqFeature(FeatureLocation(start=cut_start, end=cut_end),
+                                                           type=str(key)))
+                    except TypeError:
+                        br._stderr("Warning: No-cutters not supported.\n", quiet=quiet)
+                        pass
+                    rec.res_sites[key] = value
+            sites.append((rec.id, rec.res_sites))
+        order_features_alphabetically(seqbuddy)
     seqbuddy.restriction_sites = sites
     return seqbuddy
 
@@ -2242,7 +3658,7 @@ def hash_ids(seqbuddy, hash_length=10, r_seed=None):
     # If a hash_map already exists and fits all the specs, re-apply it.
     if seqbuddy.hash_map and len(seqbuddy.hash_map) == len(seqbuddy):
         # work from a copy, just in case we find an id that doesn't match and we need to start from scratch
-        seqbuddy_copy = make_copy(seqbuddy)
+        seqbuddy_copy = shallow_copy(seqbuddy)
         re_apply_hash_map = True
         for rec, _hash_id in zip(seqbuddy_copy.records, list(seqbuddy_copy.hash_map.items())):
             if rec.id != _hash_id[1]:
@@ -2298,7 +3714,7 @@ def insert_sequence(seqbuddy, sequence, location=0, regexes=None):
     """
     # ToDo: Features... Move and add.
     if regexes:
-        recs_to_update = pull_recs(make_copy(seqbuddy), regexes).to_dict()
+        recs_to_update = pull_recs(shallow_copy(seqbuddy), regexes).to_dict()
     else:
         recs_to_update = seqbuddy.to_dict()
 
@@ -2327,10 +3743,15 @@ def isoelectric_point(seqbuddy):
     """
     if seqbuddy.alpha is not IUPAC.protein:
         raise TypeError("Protein sequence required, not nucleic acid.")
+    from Bio.SeqUtils.IsoelectricPoint import IsoelectricPoint
     isoelectric_points = OrderedDict()
     for rec in seqbuddy.records:
-        iso_point = ProteinAnalysis(str(rec.seq))
-        iso_point = round(iso_point.isoelectric_point(), 10)
+        # Like ProtParam, only fold case if the whole sequence is lowercase
+        composition = _composition(rec)
+        if "".join(composition).islower():
+            composition = _upper_composition(composition)
+        aa_content = {residue: composition.get(residue, 0) for residue in IUPACData.protein_letters}
+        iso_point = round(IsoelectricPoint(str(rec.seq), aa_content).pi(), 10)
         isoelectric_points[rec.id] = iso_point
         rec.features.append(SeqFeature(location=FeatureLocation(start=0, end=len(rec.seq)), type='pI',
                                        qualifiers={'value': iso_point}))
@@ -2398,7 +3819,7 @@ def make_groups(seqbuddy, split_patterns=(), num_chars=None, regex=None):
     if not recs_by_identifier["Unknown"]:
         del recs_by_identifier["Unknown"]
 
-    new_seqbuddies = [(identifier, make_copy(seqbuddy)) for identifier in recs_by_identifier]
+    new_seqbuddies = [(identifier, shallow_copy(seqbuddy, records=False)) for identifier in recs_by_identifier]
     for identifier, sb in new_seqbuddies:
         sb.records = recs_by_identifier[identifier]
         sb.identifier = identifier
@@ -2462,7 +3883,7 @@ def map_features_nucl2prot(nuclseqbuddy, protseqbuddy, mode="key", quiet=False):
                             "not %s" % type(feature.location))  # This should be un-reachable because of clean_seq call
         return feature
 
-    prot_copy, nucl_copy = make_copy(protseqbuddy), make_copy(nuclseqbuddy)
+    prot_copy, nucl_copy = shallow_copy(protseqbuddy), shallow_copy(nuclseqbuddy)
     clean_seq(prot_copy, skip_list="*")
     clean_seq(nucl_copy)
 
@@ -2548,7 +3969,7 @@ def map_features_prot2nucl(protseqbuddy, nuclseqbuddy, mode="key", quiet=False):
                             "not %s" % type(feature.location))  # This should be un-reachable because of clean_seq call
         return feature
 
-    prot_copy, nucl_copy = make_copy(protseqbuddy), make_copy(nuclseqbuddy)
+    prot_copy, nucl_copy = shallow_copy(protseqbuddy), shallow_copy(nuclseqbuddy)
     clean_seq(prot_copy, skip_list="*")
     clean_seq(nucl_copy)
 
@@ -2694,14 +4115,15 @@ def molecular_weight(seqbuddy):
                 rec.mass_ds += 157.9  # molecular weight of the 5' triphosphate in dsDNA
             else:
                 rec.mass_ss += 159.0  # molecular weight of a 5' triphosphate in ssRNA
-        for indx, value in enumerate(str(rec.seq).upper()):
-            try:
-                rec.mass_ss += aa_dict[value]
-                if dna:
-                    rec.mass_ds += aa_dict[value] + deoxynucleotide_weights[deoxynucleotide_compliments[value]]
-            except KeyError:
-                raise KeyError("Invalid residue '{0}' in record {1}. '{0}' is not valid a valid character in "
-                               "{2}.".format(value, rec.id, str(seqbuddy.alpha)))
+        composition = _upper_composition(_composition(rec))
+        if any([value not in aa_dict for value in composition]):
+            value = [value for value in str(rec.seq).upper() if value not in aa_dict][0]
+            raise KeyError("Invalid residue '{0}' in record {1}. '{0}' is not valid a valid character in "
+                           "{2}.".format(value, rec.id, str(seqbuddy.alpha)))
+        for value, count in sorted(composition.items()):
+            rec.mass_ss += aa_dict[value] * count
+            if dna:
+                rec.mass_ds += (aa_dict[value] + deoxynucleotide_weights[deoxynucleotide_compliments[value]]) * count
         output['masses_ss'].append(round(rec.mass_ss, 3))
 
         qualifiers = {}
@@ -2826,7 +4248,7 @@ def order_ids_randomly(seqbuddy, r_seed=None):
     valve = br.SafetyValve(global_reps=1000)
     while valve.step("order_ids_randomly() was unable to reorder your sequences. This shouldn't happen, so please"
                      "contact the developers to let then know about this error."):
-        sb_copy = make_copy(seqbuddy)
+        sb_copy = shallow_copy(seqbuddy)
         for indx in range(len(sb_copy)):
             random_index = rand_gen.randint(1, len(sb_copy)) - 1
             output[indx] = (sb_copy.records.pop(random_index))
@@ -2848,6 +4270,7 @@ class PrositeScan(object):
     """
     def __init__(self, seqbuddy, common_match=True, quiet=False):
         import platform
+        import urllib.request
 
         self.seqbuddy = seqbuddy
         self.common_match = common_match
@@ -2869,6 +4292,7 @@ class PrositeScan(object):
         self.user_deets = br.config_values()
 
     def _rest_request(self, url, request_data=None):
+        import urllib.request
         # Set the User-agent.
         req = urllib.request.Request(url, None, self.http_headers)
         if request_data:
@@ -2881,8 +4305,7 @@ class PrositeScan(object):
         req_h.close()
         return result
 
-    def _mc_run_prosite(self, _rec, args):
-        out_file_path, lock = args
+    def _mc_run_prosite(self, _rec):
         if not self.user_deets["email"] or not re.search(r".+@.+\..+", self.user_deets["email"]):
             email = "buddysuite@nih.gov"
         else:
@@ -2916,34 +4339,27 @@ class PrositeScan(object):
         temp_seq = SeqBuddy([_rec], out_format="gb")
         temp_seq.records[0].features = feature_list
         temp_seq = order_features_by_position(temp_seq)
-
-        with lock:
-            with open(out_file_path, "a", encoding="utf-8") as out_file:
-                out_file.write("%s\n" % str(temp_seq))
-        return
+        return temp_seq.records[0]
 
     def run(self):
         self._rest_request(self.base_url)  # Confirm internet connection prior to multi-core loop
 
-        temp_file = br.TempFile()
         hash_ids(self.seqbuddy)
         clean_seq(self.seqbuddy, skip_list="*")  # Clean once to make sure no wonky characters (no alignments)
-        seqbuddy_copy = make_copy(self.seqbuddy)
+        seqbuddy_copy = shallow_copy(self.seqbuddy)
         clean_seq(self.seqbuddy)  # Clean again to strip *'s (added back in later) @TODO clean seq after translating
         if self.seqbuddy.alpha != IUPAC.protein:
             translate_cds(self.seqbuddy)
 
-        br.run_multicore_function(self.seqbuddy.records, self._mc_run_prosite,
-                                  [temp_file.path, Lock()], out_type=sys.stderr, quiet=self.quiet)
-        self.seqbuddy = SeqBuddy(temp_file.path)
+        # The web service does the heavy lifting, so threads are all that's needed to keep several jobs in flight
+        results = br.parallel_map(self._mc_run_prosite, self.seqbuddy.records, mode="thread",
+                                  out_type=sys.stderr, quiet=self.quiet)
         new_records = []
-        for rec in seqbuddy_copy.records:
-            for indx, rec2 in enumerate(self.seqbuddy.records):
-                if rec.id == rec2.id:
-                    new_records.append(rec2)
-                    del self.seqbuddy.records[indx]
-                    break
-
+        for rec, result in zip(self.seqbuddy.records, results):
+            if isinstance(result, br.TaskError):
+                br._stderr("Warning: PROSITE scan failed for %s (%s)\n" % (rec.id, result.error), self.quiet)
+                result = rec
+            new_records.append(result)
         self.seqbuddy.records = new_records
 
         find_pattern(seqbuddy_copy, "\*", include_feature=False)
@@ -3006,27 +4422,45 @@ def pull_record_ends(seqbuddy, amount):
     return seqbuddy
 
 
-def pull_recs(seqbuddy, regex, description=False):
+def _match_record_positions(seqbuddy, patterns, description=False, exact=False):
+    """
+    Find the records that pull_recs() and delete_records() act on. Literal IDs are looked up in an IdIndex, as are
+    patterns that are nothing more than an anchored prefix (e.g., '^Mle'). Anything else is compiled into a single
+    regex and run once per record.
+    :param seqbuddy: SeqBuddy object
+    :param patterns: List of regex patterns (or literal IDs/names if exact)
+    :param description: Also search the description string (regex mode only)
+    :param exact: Patterns are literal IDs/names
+    :return: Sorted list of record positions
+    """
+    if exact:
+        return seqbuddy.id_index().exact(patterns)
+
+    patterns = [".*" if pattern == "*" else pattern for pattern in patterns]
+    prefix_only = [re.match(r"\^[^.^$*+?{}\[\]\\|()]*$", pattern) for pattern in patterns]
+    if patterns and all(prefix_only) and not description:
+        index = seqbuddy.id_index()
+        return sorted({indx for pattern in patterns for indx in index.prefix(pattern[1:])})
+
+    regex = re.compile("|".join(patterns))
+    return [indx for indx, rec in enumerate(seqbuddy.records) if regex.search(rec.id) or regex.search(rec.name)
+            or (description and regex.search(rec.description))]
+
+
+def pull_recs(seqbuddy, regex, description=False, exact=False):
     """
     Retrieves sequences with names/IDs matching a search pattern
     :param seqbuddy: SeqBuddy object
     :param regex: List of regex expressions or single regex
     :type regex: str list
     :param description: Allow search in description string
+    :param exact: Treat regex as a list of literal IDs/names, which is much faster for long lists
     :return: The modified SeqBuddy object
     """
     if type(regex) == str:
         regex = [regex]
-    for indx, pattern in enumerate(regex):
-        regex[indx] = ".*" if pattern == "*" else pattern
-
-    regex = "|".join(regex)
-    matched_records = []
-    for rec in seqbuddy.records:
-        if re.search(regex, rec.id) or re.search(regex, rec.name) \
-                or (description and re.search(regex, rec.description)):
-            matched_records.append(rec)
-    seqbuddy.records = matched_records
+    seqbuddy.records = [seqbuddy.records[indx] for indx in
+                        _match_record_positions(seqbuddy, regex, description=description, exact=exact)]
     return seqbuddy
 
 
@@ -3054,25 +4488,39 @@ def pull_recs_with_feature(seqbuddy, regex):
     return seqbuddy
 
 
-def purge(seqbuddy, threshold):
+def purge(seqbuddy, threshold, engine="auto"):
     """
     Deletes highly similar sequences
     ToDo: Implement a way to return a certain # of seqs (i.e. auto-determine threshold)
         - This would probably be a different flag in the UI
     :param seqbuddy: SeqBuddy object
-    :param threshold: Sets the similarity threshold
+    :param threshold: Sets the similarity threshold (bit score)
+    :param engine: Pairwise comparisons from BLAST ("blast") or the built-in aligner ("native"). The default ("auto")
+                   uses BLAST if it is installed
     :return: The purged SeqBuddy object
     """
+    if engine not in ["auto", "blast", "native"]:
+        raise ValueError("The purge engine must be one of 'auto', 'blast', or 'native'.")
+
+    if engine == "auto":
+        blast_bin = "blastp" if seqbuddy.alpha == IUPAC.protein else "blastn"
+        engine = "blast" if which(blast_bin) and which("makeblastdb") else "native"
+
+    if engine == "blast":
+        bit_scores = [(query_id, [(subj_id, results[3]) for subj_id, results in match_list.items()])
+                      for query_id, match_list in bl2seq(seqbuddy).items()]
+    else:
+        bit_scores = [(query_id, [(subj_id, results[2]) for subj_id, results in match_list.items()])
+                      for query_id, match_list in sim_ident(seqbuddy).items()]
+
     keep_dict = {}
     purged = []
-    for query_id, match_list in bl2seq(seqbuddy).items():
+    for query_id, match_list in bit_scores:
         if query_id in purged:
             continue
         else:
             keep_dict[query_id] = []
-            for subj_id in match_list:
-                ident, length, evalue, bit_score = match_list[subj_id]
-
+            for subj_id, bit_score in match_list:
                 if bit_score >= threshold:
                     purged.append(subj_id)
                     keep_dict[query_id].append(subj_id)
@@ -3224,6 +4672,52 @@ def shuffle_seqs(seqbuddy, r_seed=None):
     return seqbuddy
 
 
+def sim_ident(seqbuddy, kmer_size=None, min_shared_kmers=2, band_width=16, max_processes=0):
+    """
+    Built-in all-by-all comparison that doesn't need BLAST. A k-mer prefilter picks out the pairs worth aligning, and
+    only those are aligned (banded Smith-Waterman), spread across a process pool. Scoring follows the blastp/blastn
+    defaults and is reported in bits, so scores are on the same scale as bl2seq().
+    :param seqbuddy: SeqBuddy object
+    :param kmer_size: Word length for the prefilter (defaults to 5 for protein and 11 for nucleotide)
+    :param min_shared_kmers: Minimum number of distinct words two sequences must share before they are aligned
+    :param band_width: Number of extra diagonals to align on either side of those the shared words fall on
+    :param max_processes: Maximum number of worker processes (0 uses every available core)
+    :return: OrderedDict of results dict[key][matches] --> [% identity, % coverage, bit score]. Every ID gets a key,
+             but only the pairs that made it through the prefilter are listed as matches.
+    """
+    settings = _pairwise_settings(seqbuddy.alpha)
+    settings["kmer_size"] = kmer_size if kmer_size is not None else settings["kmer_size"]
+    settings["band_width"] = band_width
+    if settings["kmer_size"] < 1:
+        raise ValueError("The k-mer size must be a positive integer.")
+    if band_width < 0:
+        raise ValueError("The band width can not be negative.")
+
+    make_ids_unique(seqbuddy, sep="-")
+    records = seqbuddy.records
+    seqs = [str(rec.seq).upper().replace("-", "") for rec in records]
+    pairs = [(indx1, indx2, seqs[indx1], seqs[indx2]) for indx1, indx2 in
+             _kmer_candidates(seqs, settings["kmer_size"], min_shared_kmers)]
+
+    max_processes = max_processes if max_processes > 0 else br.usable_cpu_count()
+    if max_processes == 1 or len(pairs) < 50:
+        results = [_align_pair(pair, [settings]) for pair in pairs]
+    else:
+        results = br.parallel_map(_align_pair, pairs, func_args=[settings], max_workers=max_processes, quiet=True)
+        for result in results:
+            if isinstance(result, br.TaskError):
+                raise RuntimeError("Pairwise alignment failed.\n%s" % result.trace)
+
+    output_dict = OrderedDict([(rec.id, {}) for rec in sorted(records, key=lambda rec: rec.id)])
+    for indx1, indx2, ident, coverage, bit_score in results:
+        output_dict[records[indx1].id][records[indx2].id] = [ident, coverage, bit_score]
+        output_dict[records[indx2].id][records[indx1].id] = [ident, coverage, bit_score]
+
+    for key, value in output_dict.items():
+        output_dict[key] = OrderedDict(sorted(value.items(), key=lambda l: l[0]))
+    return output_dict
+
+
 def translate6frames(seqbuddy):
     """
     Translates a nucleotide sequence into a protein sequence across all six reading frames.
@@ -3274,43 +4768,18 @@ def translate_cds(seqbuddy, quiet=False, alignment=False):
     if seqbuddy.alpha == IUPAC.protein:
         raise TypeError("Protein sequence cannot be translated.")
 
-    codon_dict = {'---': '-', '--A': '-', '--C': '-', '--G': '-', '--T': '-', '-A-': '-', '-C-': '-', '-G-': '-',
-                  '-T-': '-', 'A--': '-', 'AAA': 'K', 'AAC': 'N', 'AAG': 'K', 'AAT': 'N', 'ACA': 'T', 'ACC': 'T',
-                  'ACG': 'T', 'ACT': 'T', 'AGA': 'R', 'AGC': 'S', 'AGG': 'R', 'AGT': 'S', 'ATA': 'I', 'ATC': 'I',
-                  'ATG': 'M', 'ATT': 'I', 'C--': '-', 'CAA': 'Q', 'CAC': 'H', 'CAG': 'Q', 'CAT': 'H', 'CCA': 'P',
-                  'CCC': 'P', 'CCG': 'P', 'CCT': 'P', 'CGA': 'R', 'CGC': 'R', 'CGG': 'R', 'CGT': 'R', 'CTA': 'L',
-                  'CTC': 'L', 'CTG': 'L', 'CTT': 'L', 'G--': '-', 'GAA': 'E', 'GAC': 'D', 'GAG': 'E', 'GAT': 'D',
-                  'GCA': 'A', 'GCC': 'A', 'GCG': 'A', 'GCT': 'A', 'GGA': 'G', 'GGC': 'G', 'GGG': 'G', 'GGT': 'G',
-                  'GTA': 'V', 'GTC': 'V', 'GTG': 'V', 'GTT': 'V', 'T--': '-', 'TAA': '*', 'TAC': 'Y', 'TAG': '*',
-                  'TAT': 'Y', 'TCA': 'S', 'TCC': 'S', 'TCG': 'S', 'TCT': 'S', 'TGA': '*', 'TGC': 'C', 'TGG': 'W',
-                  'TGT': 'C', 'TTA': 'L', 'TTC': 'F', 'TTG': 'L', 'TTT': 'F'}
-
     if not alignment:
         clean_seq(seqbuddy)
 
     if seqbuddy.alpha == IUPAC.ambiguous_rna:
         rna2dna(seqbuddy)
 
-    translated_sb = make_copy(seqbuddy)
-    uppercase(translated_sb)
+    translated_sb = shallow_copy(seqbuddy)
     for rec in translated_sb.records:
         if rec.seq.alphabet == IUPAC.protein:
             raise TypeError("Record %s is protein." % rec.id)
 
-        new_seq = [""] * ceil(len(rec) / 3)
-        new_seq_indx = 0
-        old_seq = str(rec.seq)
-        for codon in [old_seq[::1][i:i + 3][::1] for i in range(0, len(old_seq), 3)][::1]:
-            if len(codon) == 3:
-                if codon in codon_dict:
-                    new_seq[new_seq_indx] = codon_dict[codon]
-                else:
-                    new_seq[new_seq_indx] = "N"
-                new_seq_indx += 1
-
-        new_seq = "".join(new_seq) if new_seq[-1] != "" else "".join(new_seq[:-1])
-        new_seq = Seq(new_seq, IUPAC.protein)
-        rec.seq = new_seq
+        rec.seq = Seq(_translate_codons(rec.seq), IUPAC.protein)
         rec.features = []
 
     map_features_nucl2prot(seqbuddy, translated_sb, mode="list", quiet=quiet)
@@ -3335,6 +4804,8 @@ def transmembrane_domains(seqbuddy, job_ids=None, quiet=False, keep_temp=None):
         from suds.client import Client
     except ImportError:
         raise ImportError("Please install the 'suds' package to run transmembrane_domains:\n\n$ pip install suds-py3")
+    import urllib.request
+    import zipfile
 
     def dl_progress(count, block_size, total_size):
         percent = count * block_size * 100 / total_size
@@ -3368,7 +4839,7 @@ def transmembrane_domains(seqbuddy, job_ids=None, quiet=False, keep_temp=None):
     printer.write("Hashing sequence IDs")
 
     hash_map = OrderedDict()
-    seqbuddy_copy = make_copy(seqbuddy)
+    seqbuddy_copy = shallow_copy(seqbuddy)
     seqbuddy.out_format = "fasta"
 
     printer.write("Stripping meta data")
@@ -3694,6 +5165,34 @@ def argparse_init():
     if in_args.guess_alphabet or in_args.guess_format:
         return in_args, SeqBuddy
 
+    if in_args.stream:
+        if len(in_args.sequence) > 1:
+            br._stderr("Error: Only one input file can be streamed at a time.\n", in_args.quiet)
+            sys.exit()
+        if in_args.in_place:
+            br._stderr("Error: The -i flag can not be used with --stream.\n", in_args.quiet)
+            sys.exit()
+        try:
+            seqbuddy = SeqBuddyStream(in_args.sequence[0], in_args.in_format, in_args.out_format, in_args.alpha)
+        except (br.GuessError, TypeError, ValueError) as e:
+            br._stderr("%s: %s\n" % (e.__class__.__name__, e), in_args.quiet)
+            sys.exit()
+        return in_args, seqbuddy
+
+    if in_args.index:
+        if len(in_args.sequence) > 1:
+            br._stderr("Error: Only one input file can be indexed at a time.\n", in_args.quiet)
+            sys.exit()
+        if in_args.in_place:
+            br._stderr("Error: The -i flag can not be used with --index.\n", in_args.quiet)
+            sys.exit()
+        try:
+            seqbuddy = SeqBuddyIndex(in_args.sequence[0], in_args.in_format, in_args.out_format, in_args.alpha)
+        except (br.GuessError, TypeError, ValueError) as e:
+            br._stderr("%s: %s\n" % (e.__class__.__name__, e), in_args.quiet)
+            sys.exit()
+        return in_args, seqbuddy
+
     try:
         for seq_set in in_args.sequence:
             if isinstance(seq_set, TextIOWrapper) and seq_set.buffer.raw.isatty():
@@ -3722,7 +5221,8 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
             _in_place(str(_seqbuddy), in_args.sequence[0])
 
         else:
-            br._stdout("{0}\n".format(str(_seqbuddy).rstrip()))
+            _seqbuddy.write(sys.stdout)
+            sys.stdout.flush()
 
     def _in_place(_output, file_path):
         if not os.path.exists(file_path):
@@ -3759,6 +5259,116 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
         usage.save()
         sys.exit()
 
+    # ############################################## STREAMING MODE ################################################ #
+    if type(seqbuddy) == SeqBuddyStream:
+        if in_args.clean_seq:
+            tool = "clean_seq"
+            args = [str(x).lower() for x in in_args.clean_seq[0]]
+            ambig = "strict" not in args
+            args = [x for x in in_args.clean_seq[0] if str(x).lower() != "strict"]
+            rep_char = args[0][0] if args and args[0] else "N"
+            seqbuddy.apply(clean_seq, ambiguous=ambig, rep_char=rep_char)
+        elif in_args.complement:
+            tool = "complement"
+            seqbuddy.apply(complement)
+        elif in_args.delete_features:
+            tool = "delete_features"
+            for next_pattern in in_args.delete_features:
+                seqbuddy.apply(delete_features, next_pattern)
+        elif in_args.delete_large:
+            tool = "delete_large"
+            seqbuddy.apply(delete_large, in_args.delete_large)
+        elif in_args.delete_metadata:
+            tool = "delete_metadata"
+            seqbuddy.apply(delete_metadata)
+        elif in_args.delete_small:
+            tool = "delete_small"
+            seqbuddy.apply(delete_small, in_args.delete_small)
+        elif in_args.lowercase:
+            tool = "lowercase"
+            seqbuddy.apply(lowercase)
+        elif in_args.pull_record_ends:
+            tool = "pull_record_ends"
+            seqbuddy.apply(pull_record_ends, in_args.pull_record_ends)
+        elif in_args.pull_records:
+            tool = "pull_records"
+            description = "full" in in_args.pull_records
+            exact = "exact" in in_args.pull_records
+            search_terms = []
+            for arg in [x for x in in_args.pull_records if x not in ["full", "exact"]]:
+                if os.path.isfile(arg):
+                    with open(arg, "r", encoding="utf-8") as ifile:
+                        for line in ifile:
+                            search_terms.append(line.strip())
+                else:
+                    search_terms.append(arg)
+            seqbuddy.apply(pull_recs, search_terms, description, exact)
+        elif in_args.reverse_complement:
+            tool = "reverse_complement"
+            seqbuddy.apply(reverse_complement)
+        elif in_args.reverse_transcribe:
+            tool = "reverse_transcribe"
+            seqbuddy.apply(rna2dna)
+        elif in_args.transcribe:
+            tool = "transcribe"
+            seqbuddy.apply(dna2rna)
+        elif in_args.translate:
+            tool = "translate"
+            seqbuddy.apply(translate_cds, quiet=in_args.quiet)
+        elif in_args.uppercase:
+            tool = "uppercase"
+            seqbuddy.apply(uppercase)
+        else:
+            tool = "stream"
+            _raise_error(ValueError("The requested tool can not be run with --stream. Supported tools: clean_seq, "
+                                    "complement, delete_features, delete_large, delete_metadata, delete_small, "
+                                    "lowercase, pull_record_ends, pull_records, reverse_complement, "
+                                    "reverse_transcribe, transcribe, translate, uppercase"), tool)
+            return
+
+        try:
+            if in_args.test:
+                for _ in seqbuddy.process():
+                    pass
+                br._stderr("*** Test passed ***\n", in_args.quiet)
+            else:
+                seqbuddy.write()
+        except TypeError as e:
+            _raise_error(e, tool, ["Nucleic acid sequence", "is protein", "cannot be translated",
+                                   "DNA sequence required", "RNA sequence required"])
+        _exit(tool)
+        return
+
+    # ############################################### INDEXED MODE ################################################# #
+    if type(seqbuddy) == SeqBuddyIndex:
+        if in_args.pull_record_ends:
+            _print_recs(seqbuddy.pull_record_ends(in_args.pull_record_ends))
+            _exit("pull_record_ends")
+            return
+
+        elif in_args.pull_records and "full" not in in_args.pull_records:
+            exact = "exact" in in_args.pull_records
+            search_terms = []
+            for arg in [x for x in in_args.pull_records if x != "exact"]:
+                if os.path.isfile(arg):
+                    with open(arg, "r", encoding="utf-8") as ifile:
+                        for line in ifile:
+                            search_terms.append(line.strip())
+                else:
+                    search_terms.append(arg)
+            _print_recs(seqbuddy.pull_recs(search_terms, exact))
+            _exit("pull_records")
+            return
+
+        elif in_args.pull_records:
+            # Descriptions are not indexed, so fall back on parsing the whole file
+            seqbuddy = SeqBuddy(seqbuddy.in_file, seqbuddy.in_format, seqbuddy.out_format, seqbuddy.alpha)
+
+        else:
+            _raise_error(ValueError("The requested tool can not be run with --index. Supported tools: "
+                                    "pull_record_ends, pull_records"), "index")
+            return
+
     # ############################################## COMMAND LINE LOGIC ############################################## #
     # Add feature
     if in_args.annotate:
@@ -3889,6 +5499,27 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
             _raise_error(e, "blast")
         _exit("blast")
 
+    # CD-HIT
+    if in_args.cd_hit:
+        cdh_args = in_args.cd_hit[0]
+        try:
+            try:
+                threshold = 0.9 if len(cdh_args) < 1 else float(cdh_args[0])
+                word_size = None if len(cdh_args) < 2 else int(cdh_args[1])
+            except ValueError:
+                raise ValueError("cd_hit arguments must be an identity threshold (float) followed by a word size (int).")
+            cd_hit(seqbuddy, threshold, word_size)
+            br._stderr("### Cluster membership ###\n", in_args.quiet)
+            for rec in seqbuddy.records:
+                members = rec.buddy_data["cluster"] if rec.buddy_data["cluster"] else []
+                br._stderr("%s\n%s\n" % (rec.id, ", ".join(members)), in_args.quiet)
+            br._stderr("##########################\n\n", in_args.quiet)
+            _print_recs(seqbuddy)
+        except ValueError as e:
+            _raise_error(e, "cd_hit", ["cd_hit arguments must be", "must be between 0 and 1",
+                                       "must be a positive integer"])
+        _exit("cd_hit")
+
     # Clean Seq
     if in_args.clean_seq:
         args = in_args.clean_seq[0]
@@ -3972,6 +5603,8 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
 
     # Delete records
     if in_args.delete_records:
+        exact = "exact" in in_args.delete_records
+        in_args.delete_records = [arg for arg in in_args.delete_records if arg != "exact"]
         try:  # Check to see if the last argument is an integer, which will set number of columns
             if len(in_args.delete_records) == 1:
                 columns = 1
@@ -3991,10 +5624,14 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
                 search_terms.append(arg)
 
         deleted_seqs = []
-        for next_pattern in search_terms:
-            deleted_seqs += pull_recs(make_copy(seqbuddy), next_pattern).records
+        if exact:
+            deleted_seqs = [seqbuddy.records[indx] for indx in
+                            _match_record_positions(seqbuddy, search_terms, exact=True)]
+        else:
+            for next_pattern in search_terms:
+                deleted_seqs += [seqbuddy.records[indx] for indx in _match_record_positions(seqbuddy, [next_pattern])]
 
-        seqbuddy = delete_records(seqbuddy, search_terms)
+        seqbuddy = delete_records(seqbuddy, search_terms, exact)
 
         if len(deleted_seqs) > 0 and not in_args.quiet:
             counter = 1
@@ -4129,8 +5766,16 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
 
     # Find CpG
     if in_args.find_CpG:
+        cpg_args = in_args.find_CpG[0]
         try:
-            find_cpg(seqbuddy)
+            try:
+                window_size = 200 if len(cpg_args) < 1 else int(cpg_args[0])
+                oe_threshold = .6 if len(cpg_args) < 2 else float(cpg_args[1])
+                gc_threshold = .5 if len(cpg_args) < 3 else float(cpg_args[2])
+            except ValueError:
+                raise ValueError("find_CpG arguments must be a window size (int) followed by O/E and GC "
+                                 "thresholds (float).")
+            find_cpg(seqbuddy, window_size, oe_threshold, gc_threshold)
             islands = False
             for rec in seqbuddy.records:
                 if rec.buddy_data["cpgs"]:
@@ -4154,11 +5799,26 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
 
         except TypeError as e:
             _raise_error(e, "find_CpG", "DNA sequence required, not protein or RNA.")
+        except ValueError as e:
+            _raise_error(e, "find_CpG", ["The window size must be a positive integer.",
+                                         "find_CpG arguments must be"])
 
     # Find orfs
     if in_args.find_orfs:
+        min_length = 0
+        mode = "scan"
         try:
-            find_orfs(seqbuddy)
+            for arg in in_args.find_orfs[0]:
+                try:
+                    min_length = int(arg)
+                except ValueError:
+                    # Modes can be abbreviated, as long as the abbreviation only fits one of them
+                    modes = [option for option in ["scan", "longest", "nested"] if arg and option.startswith(arg)]
+                    if len(modes) != 1:
+                        raise ValueError("find_orfs arguments must be a minimum length (int) and/or a mode ('scan', "
+                                         "'longest', or 'nested'), not '%s'." % arg)
+                    mode = modes[0]
+            find_orfs(seqbuddy, min_length=min_length, mode=mode)
             for rec in seqbuddy.records:
                 pos_indices = rec.buddy_data['find_orfs']['+']
                 neg_indices = rec.buddy_data['find_orfs']['-']
@@ -4177,6 +5837,8 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
             _print_recs(seqbuddy)
         except TypeError as e:
             _raise_error(e, "find_orfs")
+        except ValueError as e:
+            _raise_error(e, "find_orfs", "find_orfs arguments must be")
         _exit("find_orfs")
 
     # Find pattern
@@ -4699,6 +6361,12 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
         else:
             description = False
 
+        if "exact" in in_args.pull_records:
+            exact = True
+            del in_args.pull_records[in_args.pull_records.index("exact")]
+        else:
+            exact = False
+
         search_terms = []
         for arg in in_args.pull_records:
             if os.path.isfile(arg):
@@ -4708,7 +6376,7 @@ def command_line_ui(in_args, seqbuddy, skip_exit=False, pass_through=False):  #
             else:
                 search_terms.append(arg)
 
-        _print_recs(pull_recs(seqbuddy, search_terms, description))
+        _print_recs(pull_recs(seqbuddy, search_terms, description, exact))
         _exit("pull_records")
 
     # Pull records with feature
@@ -34,21 +34,23 @@ from configparser import ConfigParser, NoOptionError
 import json
 import traceback
 import re
-from ftplib import FTP, all_errors
+import importlib.util
 from hashlib import md5
-from urllib import request
-from urllib.error import URLError, HTTPError, ContentTooShortError
-from multiprocessing import Process, cpu_count
+from io import StringIO
+from multiprocessing import Process, Queue, cpu_count
+from queue import Empty
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pickle
 from time import time
-from math import floor
+from math import floor, ceil
 from tempfile import TemporaryDirectory
 from shutil import copytree, rmtree, copyfile
 import string
 from random import choice
 import signal
-from pkg_resources import Requirement, resource_filename, DistributionNotFound
 
-from Bio import AlignIO
+import numpy as np
+
 from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
 from Bio.Alphabet import IUPAC
 
@@ -215,99 +217,172 @@ def usable_cpu_count():
     return max_processes
 
 
-def run_multicore_function(iterable, function, func_args=False, max_processes=0, quiet=False, out_type=sys.stdout):
-        # fun little piece of abstraction here... directly pass in a function that is going to be looped over, and
-        # fork those loops onto independent processes. Any arguments the function needs must be provided as a list.
-        if func_args and not isinstance(func_args, list):
-            raise AttributeError("The arguments passed into the multi-thread function must be provided as a list")
+def _run_task(function, func_args, item, indx):
+    """
+    Make a single parallel_map() call, turning any exception into a TaskError so it can be handed back to the parent
+    """
+    try:
+        return function(item, func_args) if func_args else function(item)
+    except Exception as err:
+        return TaskError(indx, "%s: %s" % (type(err).__name__, err), traceback.format_exc())
 
-        d_print = DynamicPrint(out_type)
-        if max_processes == 0:
-            max_processes = usable_cpu_count()
 
-        else:
-            cpus = cpu_count()
-            if max_processes > cpus:
-                max_processes = cpus
-            elif max_processes < 1:
-                max_processes = 1
+def _pool_worker(function, func_args, items, tasks, results):
+    """
+    Worker loop for parallel_map() in process mode. The function, its arguments, and the items are inherited when the
+    worker is forked, so only (start, stop) index ranges go through the task queue. Each finished chunk goes back as a
+    single message holding the pickled return values.
+    """
+    while True:
+        chunk = tasks.get()
+        if chunk is None:
+            break
+        start, stop = chunk
+        output = [_run_task(function, func_args, items[indx], indx) for indx in range(start, stop)]
+        try:
+            output = pickle.dumps(output)
+        except (pickle.PicklingError, AttributeError, TypeError) as err:
+            output = pickle.dumps([TaskError(indx, "Return value could not be pickled (%s)" % err, "")
+                                   for indx in range(start, stop)])
+        results.put((start, output))
+    return
 
-        max_processes = max_processes if max_processes < len(iterable) else len(iterable)
 
-        running_processes = 0
-        child_list = []
-        start_time = round(time())
-        elapsed = 0
-        counter = 0
-        if not quiet:
-            d_print.write("Running function %s() on %s cores\n" % (function.__name__, max_processes))
-        # fire up the multi-core!!
-        if not quiet:
-            d_print.write("\tJob 0 of %s" % len(iterable))
-
-        for next_iter in iterable:
-            if type(iterable) is dict:
-                next_iter = iterable[next_iter]
-            if os.name == "nt":  # Multicore doesn't work well on Windows, so for now just run serial
-                function(next_iter, func_args)
-                continue
-            while 1:     # Only fork a new process when there is a free processor.
-                if running_processes < max_processes:
-                    # Start new process
-                    if not quiet:
-                        d_print.write("\tJob %s of %s (%s)" % (counter, len(iterable), pretty_time(elapsed)))
+def parallel_map(function, iterable, func_args=None, max_workers=0, mode="process", quiet=False,
+                 out_type=sys.stderr):
+    """
+    Call function() on every item in iterable, spread over a pool of worker processes (for CPU-bound work) or threads
+    (for I/O-bound work, like talking to web services), and hand back whatever each call returned.
+    Process workers are forked once and pull chunks of the iterable off a shared queue, so the function does not need
+    to be picklable, but its return values do. The parent blocks on the results instead of polling its workers.
+    :param function: Called as function(item, func_args), or function(item) if func_args is empty
+    :param iterable: Items to run function() on (if a dict, its values are used)
+    :param func_args: Any arguments the function needs must be provided as a list
+    :param max_workers: Size of the pool (0 uses usable_cpu_count()). Process pools are capped at the number of CPUs.
+    :param mode: "process" or "thread"
+    :param quiet: Suppress progress reporting
+    :param out_type: Where progress is reported
+    :return: List of return values in the same order as iterable. Any call that raised is represented by a TaskError.
+    """
+    if func_args and not isinstance(func_args, list):
+        raise AttributeError("The arguments passed into the multi-thread function must be provided as a list")
+    if mode not in ["process", "thread"]:
+        raise ValueError("parallel_map() mode must be 'process' or 'thread'")
 
-                    if func_args:
-                        p = Process(target=function, args=(next_iter, func_args))
-                    else:
-                        p = Process(target=function, args=(next_iter,))
-                    p.start()
-                    child_list.append(p)
-                    running_processes += 1
-                    counter += 1
-                    break
-                else:
-                    # processor wait loop
-                    while 1:
-                        for i in range(len(child_list)):
-                            if child_list[i].is_alive():
-                                continue
-                            else:
-                                child_list.pop(i)
-                                running_processes -= 1
-                                break
-
-                        if not quiet:
-                            if (start_time + elapsed) < round(time()):
-                                elapsed = round(time()) - start_time
-                                d_print.write("\tJob %s of %s (%s)" % (counter, len(iterable), pretty_time(elapsed)))
-
-                        if running_processes < max_processes:
-                            break
-
-        # wait for remaining processes to complete --> this is the same code as the processor wait loop above
-        if not quiet:
-            d_print.write("\tJob %s of %s (%s)" % (counter, len(iterable), pretty_time(elapsed)))
-
-        while len(child_list) > 0:
-            for i in range(len(child_list)):
-                if child_list[i].is_alive():
-                    continue
-                else:
-                    child_list.pop(i)
-                    running_processes -= 1
-                    break  # need to break out of the for-loop, because the child_list index is changed by pop
+    items = list(iterable.values()) if type(iterable) is dict else list(iterable)
+    d_print = DynamicPrint(out_type)
+    if max_workers == 0:
+        max_workers = usable_cpu_count()
 
-            if not quiet:
-                if (start_time + elapsed) < round(time()):
+    else:
+        cpus = cpu_count()
+        if max_workers > cpus and mode == "process":
+            max_workers = cpus
+        elif max_workers < 1:
+            max_workers = 1
+
+    max_workers = max_workers if max_workers < len(items) else len(items)
+
+    start_time = round(time())
+    elapsed = 0
+    counter = 0
+    if not quiet:
+        d_print.write("Running function %s() on %s %s\n" % (function.__name__, max_workers,
+                                                              "cores" if mode == "process" else "threads"))
+        d_print.write("\tJob 0 of %s" % len(items))
+
+    results = [None] * len(items)
+    if not items:
+        pass  # Nothing to do, and no reason to start up a pool
+
+    elif mode == "thread":
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(_run_task, function, func_args, item, indx): indx
+                       for indx, item in enumerate(items)}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures[future]] = future.result()
+                counter += len(done)
+                if not quiet and (done or (start_time + elapsed) < round(time())):
                     elapsed = round(time()) - start_time
-                    d_print.write("\t%s total jobs (%s, %s jobs remaining)" % (len(iterable), pretty_time(elapsed),
-                                                                               len(child_list)))
+                    d_print.write("\tJob %s of %s (%s)" % (counter, len(items), pretty_time(elapsed)))
 
-        if not quiet:
-            d_print.write("\tDONE: %s jobs in %s\n" % (len(iterable), pretty_time(elapsed)))
-        # func_args = []  # This may be necessary because of weirdness in assignment of incoming arguments
-        return
+    elif os.name == "nt":  # Multicore doesn't work well on Windows, so for now just run serial
+        for indx, item in enumerate(items):
+            results[indx] = _run_task(function, func_args, item, indx)
+            counter += 1
+            if not quiet:
+                elapsed = round(time()) - start_time
+                d_print.write("\tJob %s of %s (%s)" % (counter, len(items), pretty_time(elapsed)))
+
+    else:
+        # Several chunks per worker, so one slow chunk doesn't leave the rest of the pool idle at the end
+        chunk_size = max(1, ceil(len(items) / (max_workers * 4)))
+        task_queue, result_queue = Queue(), Queue()
+        chunks = [(start, min(start + chunk_size, len(items))) for start in range(0, len(items), chunk_size)]
+        for chunk in chunks:
+            task_queue.put(chunk)
+        workers = []
+        for _ in range(max_workers):
+            task_queue.put(None)
+            worker = Process(target=_pool_worker, args=(function, func_args, items, task_queue, result_queue))
+            worker.start()
+            workers.append(worker)
+
+        pending = len(chunks)
+        try:
+            while pending:
+                try:
+                    # Wake up at least once a second to keep the elapsed time ticking over
+                    start, output = result_queue.get(timeout=1)
+                except Empty:
+                    if not any([worker.is_alive() for worker in workers]) and result_queue.empty():
+                        raise RuntimeError("Worker processes for %s() exited before finishing all jobs"
+                                           % function.__name__)
+                    if not quiet and (start_time + elapsed) < round(time()):
+                        elapsed = round(time()) - start_time
+                        d_print.write("\tJob %s of %s (%s)" % (counter, len(items), pretty_time(elapsed)))
+                else:
+                    output = pickle.loads(output)
+                    results[start:start + len(output)] = output
+                    pending -= 1
+                    counter += len(output)
+                    if not quiet:
+                        elapsed = round(time()) - start_time
+                        d_print.write("\tJob %s of %s (%s)" % (counter, len(items), pretty_time(elapsed)))
+        finally:
+            for worker in workers:
+                if pending:
+                    worker.terminate()
+                worker.join()
+
+    if not quiet:
+        d_print.write("\tDONE: %s jobs in %s\n" % (len(items), pretty_time(elapsed)))
+    return results
+
+
+def run_multicore_function(iterable, function, func_args=False, max_processes=0, quiet=False, out_type=sys.stdout):
+    """
+    Directly pass in a function that is going to be looped over, and fork those loops onto a pool of worker processes.
+    This is parallel_map() in process mode, except that calls which raise have their traceback printed and come back
+    as None.
+    :param iterable: Items to run function() on (if a dict, its values are used)
+    :param function: Called as function(item, func_args), or function(item) if func_args is empty
+    :param func_args: Any arguments the function needs must be provided as a list
+    :param max_processes: Size of the pool (0 uses usable_cpu_count())
+    :param quiet: Suppress progress reporting
+    :param out_type: Where progress is reported
+    :return: List of the return values, in the same order as iterable
+    """
+    results = parallel_map(function, iterable, func_args=func_args, max_workers=max_processes, mode="process",
+                           quiet=quiet, out_type=out_type)
+    for indx, result in enumerate(results):
+        if isinstance(result, TaskError):
+            sys.stderr.write(result.trace)
+            results[indx] = None
+    return results
 
 
 class TempDir(object):
@@ -437,6 +512,31 @@ class TempFile(object):
         return
 
 
+class RstripWriter(object):
+    # Pass text straight through to a handle, but hold back any trailing whitespace until more text arrives. This lets
+    # records be serialized directly into a file or stdout while still ending the output like "%s\n" % output.rstrip()
+    def __init__(self, handle):
+        self.handle = handle
+        self._pending = ""
+
+    def write(self, text):
+        stripped = text.rstrip()
+        if stripped:
+            self.handle.write("%s%s" % (self._pending, stripped))
+            self._pending = text[len(stripped):]
+        else:
+            self._pending += text
+        return len(text)
+
+    def end(self, ending="\n"):
+        self.handle.write(ending)
+        self._pending = ""
+        return
+
+    def __getattr__(self, item):  # Anything else (flush(), etc.) goes to the real handle
+        return getattr(self.handle, item)
+
+
 class SafetyValve(object):  # Use this class if you're afraid of an infinite loop
     def __init__(self, global_reps=1000, state_reps=10, counter=0):
         self.counter = counter
@@ -581,6 +681,18 @@ class PhylipError(Exception):
         return self.value
 
 
+class TaskError(Exception):
+    """Stands in for the result of a parallel_map() call that raised"""
+    def __init__(self, index, error, trace):
+        Exception.__init__(self, index, error, trace)  # Keeps the object picklable, so it can come back from a worker
+        self.index = index
+        self.error = error
+        self.trace = trace
+
+    def __str__(self):
+        return "Task %s failed with %s" % (self.index, self.error)
+
+
 class Contributor(object):
     def __init__(self, first, last, middle="", commits=None, github=None):
         self.first = first.strip()
@@ -665,6 +777,7 @@ class Usage(object):
         return
 
     def send_report(self):
+        from ftplib import FTP, all_errors
         self.stats["date"] = str(datetime.date.today())
         temp_file = TempFile()
         json.dump(self.stats, temp_file.get_handle())
@@ -726,14 +839,47 @@ Contributors:
 
 
 # #################################################### FUNCTIONS ##################################################### #
+def lazy_import(module_name):
+    """
+    Import a module, but hold off on executing it until one of its attributes is first used. Heavy dependencies that
+    only a few tools need (e.g., ete3, AlignBuddy) are imported like this, so they don't slow down every CLI call. The
+    module is still a normal global, so it can be used (or monkeypatched) as if it were imported directly.
+    :param module_name: Full name of the module (e.g., 'Bio.Entrez')
+    :return: The module object
+    :raises ImportError: If the module isn't installed
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.find_spec(module_name)
+    if spec is None:
+        raise ImportError("No module named '%s'" % module_name, name=module_name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    parent, _, child = module_name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+def resource_filename(resource):
+    """
+    Path to a file or directory inside the buddysuite package directory (e.g., the buddy_data directory created by the
+    installer). Replaces pkg_resources.resource_filename(), which scans every installed distribution when imported.
+    :param resource: Path relative to the package directory
+    :return: Absolute path
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), resource)
+
+
 def config_values():
     options = {"email": "buddysuite@nih.gov",
                "diagnostics": False,
                "user_hash": "hashless",
                "shortcuts": ""}
     try:
-        config_file = resource_filename(Requirement.parse("buddysuite"),
-                                        "buddysuite{0}buddy_data{0}config.ini".format(os.path.sep))
+        config_file = resource_filename("buddy_data{0}config.ini".format(os.path.sep))
         config = ConfigParser()
         config.read(config_file)
         for _key, value in options.items():
@@ -745,15 +891,18 @@ def config_values():
             except KeyError:
                 options[_key] = value
         options["shortcuts"] = options["shortcuts"].split(",")
-        options["data_dir"] = resource_filename(Requirement.parse("buddysuite"), "buddysuite%sbuddy_data" % os.path.sep)
+        options["data_dir"] = resource_filename("buddy_data")
         if not os.path.isdir(options["data_dir"]):
             options["data_dir"] = False
-    except (DistributionNotFound, KeyError, NoOptionError):  # This occurs when buddysuite isn't installed
+    except (KeyError, NoOptionError):  # This occurs when buddysuite isn't installed
         options["data_dir"] = False
     return options
 
 
 def error_report(trace_back, permission=False):
+    from ftplib import FTP, all_errors
+    from urllib import request
+    from urllib.error import URLError, HTTPError, ContentTooShortError
     message = ""
     error_hash = re.sub("^#.*?\n{2}", "", trace_back, flags=re.DOTALL)  # Remove error header information before hashing
     error_hash = md5(error_hash.encode("utf-8")).hexdigest()  # Hash the error
@@ -936,6 +1085,7 @@ def phylip_sequential_read(sequence, relaxed=True):
     # If your file is not phylip-relaxed, leaving relaxed as True WILL break your code.
     # If your file is strict you must set relaxed to False.
     # (Strict forces 10 character taxa names, relaxed requires whitespace between name and sequence)
+    from Bio import AlignIO
     sequence = "\n %s" % sequence.strip()
     sequence = re.sub("\n+", "\n", sequence)
     alignments = re.split("\n *([0-9]+) ([0-9]+)\n", sequence)[1:]
@@ -991,7 +1141,113 @@ def phylip_sequential_read(sequence, relaxed=True):
     return aligns
 
 
+def sniff_format(prefix):
+    """
+    Check the start of a file against the signatures of the formats BuddySuite reads, so that format guessing only needs
+    to trial-parse the likely candidates (if any) instead of every format it knows about
+    :param prefix: The first few KB of the file (str)
+    :return: List of candidate formats, most likely first (empty list if nothing is recognized)
+    """
+    first_line = prefix.lstrip().split("\n", 1)[0].strip()
+    upper_line = first_line.upper()
+
+    if first_line.startswith(">"):
+        return ["fasta"]
+    if first_line.startswith("LOCUS"):
+        return ["gb"]
+    if first_line.startswith("ID "):
+        return ["embl", "swiss"]
+    if upper_line.startswith("# STOCKHOLM"):
+        return ["stockholm"]
+    if upper_line.startswith("#NEXUS"):
+        return ["nexus"]
+    if first_line and first_line.split()[0] in ["CLUSTAL", "PROBCONS", "MUSCLE", "MSAPROBS", "Kalign"]:
+        return ["clustal"]
+    if first_line.startswith("@"):
+        return ["fastq"]
+    if first_line.startswith("<?xml") or first_line.startswith("<seqXML"):
+        if re.search("<nex:nexml", prefix, re.IGNORECASE):
+            return ["nexml"]
+        if "<seqXML" in prefix:
+            return ["seqxml"]
+    if re.match("[0-9]+\s+[0-9]+", first_line):
+        return ["phylipss", "phylipsr", "phylip", "phylip-relaxed"]
+    return []
+
+
+def trim_to_records(sample, _format):
+    """
+    Cut a sample from the start of a file back to its last complete record, so a record split by the end of the sample
+    doesn't look like a parse error. Alignment formats (nexus, phylip, etc.) have no record boundaries to cut at.
+    :param sample: Text from the start of the file (str)
+    :param _format: The format being trial-parsed
+    :return: The trimmed sample, or None if no complete record could be found
+    """
+    if _format == "fasta":
+        cut = sample.rfind("\n>")
+        return sample[:cut + 1] if cut > 0 else None
+    if _format in ["gb", "embl", "swiss"]:
+        cut = sample.rfind("\n//")
+        cut = sample.find("\n", cut + 1) if cut > 0 else -1
+        return sample[:cut + 1] if cut > 0 else None
+    if _format == "fastq":
+        lines = sample.split("\n")
+        num_lines = int((len(lines) - 1) / 4) * 4
+        return "%s\n" % "\n".join(lines[:num_lines]) if num_lines else None
+    return None
+
+
+def trial_parse_formats(_input, possible_formats, trial_parse, errors=(ValueError,)):
+    """
+    Work out which format a file handle is in, without parsing the whole thing over and over. Formats with a matching
+    signature (see sniff_format) are tried first, on a sample that is only grown if not even one of their records fits
+    into it (or on the whole file, for formats that can't be cut into records). Every other format only gets to see the
+    complete records in the first SNIFF_SIZE characters.
+    :param _input: Seekable file handle
+    :param possible_formats: Formats to consider, in order of preference
+    :param trial_parse: function(format, handle) that returns the format (possibly re-named) if the handle can be
+                        parsed, and returns None or raises one of 'errors' if not
+    :param errors: Exceptions that indicate a failed parse
+    :return: str or None ('empty file' if the handle has nothing in it)
+    """
+    prefix = _input.read(SNIFF_SIZE)
+    if prefix == "":
+        return "empty file"
+    end_of_file = len(prefix) < SNIFF_SIZE
+
+    candidates = [_format for _format in sniff_format(prefix) if _format in possible_formats]
+    possible_formats = candidates + [_format for _format in possible_formats if _format not in candidates]
+
+    guessed_format = None
+    sample = prefix
+    for next_format in possible_formats:
+        while True:
+            if next_format in candidates and next_format not in RECORD_FORMATS and not end_of_file:
+                sample += _input.read()
+                end_of_file = True
+            if next_format in candidates:
+                next_sample, whole_file = sample, end_of_file
+            else:
+                next_sample, whole_file = prefix, len(prefix) < SNIFF_SIZE
+            records = None if whole_file else trim_to_records(next_sample, next_format)
+            try:
+                guessed_format = trial_parse(next_format, StringIO(records if records else next_sample))
+                break
+            except errors:
+                # The first record of a signature-matched format may just be bigger than the sample so far
+                if records or whole_file or next_format not in candidates:
+                    break
+                more_input = _input.read(len(sample) * 3)
+                end_of_file = len(more_input) < len(sample) * 3
+                sample += more_input
+        if guessed_format:
+            break
+    _input.seek(0)
+    return guessed_format
+
+
 def phylip_guess(next_format, _input):
+    from Bio import AlignIO
     if next_format == "phylip":
         sequence = "\n %s" % _input.read().strip()
         _input.seek(0)
@@ -1099,6 +1355,105 @@ def send_traceback(tool, function, e, version):
     return
 
 
+class PositionMap(object):
+    """
+    Array-backed map between the positions of a sequence (or the columns of an alignment) and the positions that are
+    left once some of them have been removed. Built once in O(L) from a 'kept' mask, after which rank (kept positions
+    before an index) and select (index of the nth kept position) lookups are O(1).
+    Indexing the object returns the same (new_position, exists) tuples that the FeatureReMapper classes always used.
+    """
+    def __init__(self, kept):
+        """
+        :param kept: Iterable of booleans, one per original position, True if the position still exists
+        """
+        self.kept = np.asarray(kept, dtype=bool).reshape(-1)
+        self.ranks = np.zeros(len(self.kept) + 1, dtype=np.int64)
+        np.cumsum(self.kept, out=self.ranks[1:])
+        self._positions = None
+
+    @classmethod
+    def from_gapped(cls, seq, gap_chars="-"):
+        """
+        Map the residues of a gapped sequence onto their alignment columns
+        :param seq: Seq object or string
+        :param gap_chars: Characters that are not counted as residues
+        """
+        seq = np.frombuffer(str(seq).encode("utf-8"), dtype=np.uint8)
+        return cls(~np.isin(seq, [ord(char) for char in gap_chars]))
+
+    def __len__(self):
+        return len(self.kept)
+
+    def __getitem__(self, indx):
+        if isinstance(indx, slice):
+            return [self[i] for i in range(*indx.indices(len(self)))]
+        indx = range(len(self))[indx]
+        return max(int(self.ranks[indx + 1]) - 1, 0), bool(self.kept[indx])
+
+    def __iter__(self):
+        for indx in range(len(self)):
+            yield self[indx]
+
+    @property
+    def positions(self):
+        """
+        :return: The original index of every kept position, in order
+        """
+        if self._positions is None:
+            self._positions = np.flatnonzero(self.kept)
+        return self._positions
+
+    def rank(self, indx):
+        """
+        :param indx: Original position (clamped to the length of the map)
+        :return: The number of kept positions before indx
+        """
+        return int(self.ranks[min(max(indx, 0), len(self))])
+
+    def select(self, num):
+        """
+        :param num: Zero-based count of kept positions
+        :return: The original index of that kept position
+        """
+        return int(self.positions[num])
+
+    def remap_range(self, start, end):
+        """
+        Translate an original [start, end) range into new coordinates
+        :return: (new_start, new_end) or None if nothing in the range still exists
+        """
+        start, end = self.rank(start), self.rank(end)
+        return (start, end) if end > start else None
+
+    def remap_feature(self, feature):
+        """
+        Deal with the weirdness that is SeqRecord features... Moves a feature from the original positions onto the new
+        ones, dropping any parts that no longer exist
+        :param feature: SeqFeature object
+        :return: The modified feature, or None if none of it still exists
+        """
+        if type(feature.location) == FeatureLocation:
+            new_range = self.remap_range(feature.location.start, feature.location.end)
+            if not new_range:
+                return None
+            feature.location = FeatureLocation(*new_range, strand=feature.location.strand)
+            return feature
+
+        else:  # CompoundLocation
+            parts = []
+            for sub_feature in feature.location.parts:
+                sub_feature = self.remap_feature(SeqFeature(sub_feature))
+                if sub_feature:
+                    parts.append(sub_feature.location)
+            if len(parts) > 1:
+                feature.location = CompoundLocation(parts, operator='order')
+            elif len(parts) == 1:
+                feature.location = FeatureLocation(parts[0].start, parts[0].end, strand=parts[0].strand)
+            else:
+                feature = None
+            return feature
+
+
 def shift_features(features, shift, full_seq_len):
     """
     Adjust the location of features
@@ -1198,11 +1553,21 @@ def ungap_feature_ends(feat, rec):
     return feat
 
 
-def _old2new(feat, old_rec, new_rec):
+def _old2new(feat, old_rec, new_rec, old_map=None, new_map=None):
+    """
+    Move a feature from old_rec onto new_rec, which holds the same residues with a different gap pattern
+    :param old_map: PositionMap.from_gapped(old_rec.seq), reused across features if provided
+    :param new_map: PositionMap.from_gapped(new_rec.seq), reused across features if provided
+    """
+    if type(feat.location) not in [CompoundLocation, FeatureLocation]:
+        raise TypeError("FeatureLocation or CompoundLocation object required.")
+
+    old_map = old_map if old_map is not None else PositionMap.from_gapped(old_rec.seq)
+    new_map = new_map if new_map is not None else PositionMap.from_gapped(new_rec.seq)
     if type(feat.location) == CompoundLocation:
         parts = []
         for part in feat.location.parts:
-            new_part = _old2new(SeqFeature(part), old_rec, new_rec)
+            new_part = _old2new(SeqFeature(part), old_rec, new_rec, old_map, new_map)
             if new_part:
                 parts.append(new_part.location)
         if len(parts) == 1:
@@ -1211,46 +1576,18 @@ def _old2new(feat, old_rec, new_rec):
             feat.location = CompoundLocation(parts, feat.location.operator)
         else:
             return None
-    elif type(feat.location) == FeatureLocation:
+    else:
         if feat.location.start == feat.location.end == 0:
             return feat
-        if feat.location.start > feat.location.end:
-            start, end = feat.location.end, feat.location.start
-        else:
-            start, end = feat.location.start, feat.location.end
-        old_seq = str(old_rec.seq).lower()
-        new_seq = str(new_rec.seq).lower()
-        old_front_seq = old_seq[:start]
-        old_front_seq = re.sub("-", "", old_front_seq)
-        old_feat_seq = old_seq[start:end]
-        old_feat_seq = re.sub("-", "", old_feat_seq)
-        start, end = 0, 0
-        new_front_seq, new_feat_seq = "", ""
-        for indx, residue in enumerate(new_seq):
-            if residue == "-":
-                continue
-
-            if not start:
-                if old_front_seq in ["", new_front_seq]:
-                    start = indx + 1
-                    new_feat_seq += residue
-                    if new_feat_seq == old_feat_seq:
-                        end = indx + 1
-                        break
-                else:
-                    new_front_seq += residue
-            else:
-                new_feat_seq += residue
-                if new_feat_seq == old_feat_seq:
-                    end = indx + 1
-                    break
-        start -= 1
-        if start == -1:
+        start, end = sorted([feat.location.start, feat.location.end])
+        # Count the residues before and within the feature, then find those same residues in the new record
+        start, end = old_map.rank(start), old_map.rank(end)
+        num_residues = len(new_map.positions)
+        if start >= num_residues:
             return None  # I don't think this should ever be hit
-        end = end if end != 0 else len(new_seq)
-        feat.location = FeatureLocation(start, end, feat.location.strand)
-    else:
-        raise TypeError("FeatureLocation or CompoundLocation object required.")
+        new_start = new_map.select(start)
+        new_end = new_map.select(end - 1) + 1 if start < end <= num_residues else len(new_map)
+        feat.location = FeatureLocation(new_start, new_end, feat.location.strand)
     return feat
 
 
@@ -1269,8 +1606,9 @@ def remap_gapped_features(old_records, new_records):
             features.append(ungap_feature_ends(feat, old_rec))
         old_rec.features = features
         features = []
+        old_map, new_map = PositionMap.from_gapped(old_rec.seq), PositionMap.from_gapped(new_rec.seq)
         for feat in old_rec.features:
-            feat = _old2new(feat, old_rec, new_rec)
+            feat = _old2new(feat, old_rec, new_rec, old_map, new_map)
             if feat:
                 features.append(feat)
         new_rec.features = features
@@ -1352,6 +1690,12 @@ contributors = [Contributor("Stephen", "Bond", commits=892, github="https://gith
                 Contributor("Adam", "Palmer", commits=2, github="https://github.com/apalm112"),
                 Contributor("Helena", "Mendes-Soares", commits=1, github="https://github.com/mendessoares")]
 
+# Number of characters read from the start of a file when guessing its format
+SNIFF_SIZE = 65536
+# Formats that trim_to_records() can cut between records. The others (nexus, clustal, phylip, etc.) can't be parsed from
+# a partial file, so when one of them matches the file's signature it is trial parsed on the whole file.
+RECORD_FORMATS = ["fasta", "gb", "embl", "swiss", "fastq"]
+
 # NOTE: If this is added to, be sure to update the unit test!
 format_to_extension = {'fasta': 'fa', 'fa': 'fa', 'genbank': 'gb', 'gb': 'gb', 'newick': 'nwk', 'nwk': 'nwk',
                        'nexus': 'nex', 'nex': 'nex', 'phylip': 'phy', 'phy': 'phy', 'phylip-relaxed': 'phyr',
@@ -1395,6 +1739,12 @@ sb_flags = {"annotate": {"flag": "ano",
                       "metavar": ("subject", "<blast params>"),
                       "help": "Search a BLAST database or subject sequence file with your query sequence file, "
                               "returning the full hits"},
+            "cd_hit": {"flag": "cdh",
+                       "action": "append",
+                       "nargs": "*",
+                       "metavar": "args",
+                       "help": "Cluster by identity, keeping one representative per cluster. "
+                               "Args: [identity threshold (default=0.9)] [word size]"},
             "clean_seq": {"flag": "cs",
                           "action": "append",
                           "nargs": "*",
@@ -1446,7 +1796,8 @@ sb_flags = {"annotate": {"flag": "ano",
                                "metavar": "args",
                                "help": "Remove records from a file (deleted IDs are sent to stderr). "
                                        "Regular expressions are understood, and an int as the final argument will"
-                                       "specify number of columns for deleted IDs"},
+                                       "specify number of columns for deleted IDs. Include 'exact' to match IDs "
+                                       "literally"},
             "delete_repeats": {"flag": "drp",
                                "action": "append",
                                "nargs": "*",
@@ -1470,11 +1821,18 @@ sb_flags = {"annotate": {"flag": "ano",
                                 "metavar": "positions",
                                 "help": "Pull out specific residues"},
             "find_CpG": {"flag": "fcpg",
-                         "action": "store_true",
-                         "help": "Predict regions under strong purifying selection based on high CpG content"},
+                         "action": "append",
+                         "nargs": "*",
+                         "metavar": "args",
+                         "help": "Predict regions under strong purifying selection based on high CpG content. "
+                                 "Args: [window size (default=200)] [min O/E ratio (default=0.6)] "
+                                 "[min GC fraction (default=0.5)]"},
             "find_orfs": {"flag": "orf",
-                          "action": "store_true",
-                          "help": "Finds all the open reading frames in the sequences and their reverse complements."},
+                          "action": "append",
+                          "nargs": "*",
+                          "metavar": "args",
+                          "help": "Finds all the open reading frames in the sequences and their reverse complements. "
+                                  "Args: [min length (nt)] [mode (scan|longest|nested)]"},
             "find_pattern": {"flag": "fp",
                              "action": "store",
                              "nargs": "+",
@@ -1608,7 +1966,8 @@ sb_flags = {"annotate": {"flag": "ano",
                              "action": "store",
                              "nargs": "+",
                              "metavar": "<regex>",
-                             "help": "Get all the records with ids containing a given string"},
+                             "help": "Get all the records with ids containing a given string. Include 'full' to "
+                                     "search descriptions, or 'exact' to match IDs literally"},
             "pull_records_with_feature": {"flag": "prf",
                                           "action": "store",
                                           "nargs": "+",
@@ -1677,6 +2036,10 @@ sb_modifiers = {"alpha": {"flag": "a",
                 "in_place": {"flag": "i",
                              "action": "store_true",
                              "help": "Rewrite the input file in-place. Be careful!"},
+                "index": {"flag": "idx",
+                          "action": "store_true",
+                          "help": "Read records through an on-disk index kept beside the input file (built when "
+                                  "needed), instead of parsing the whole file (pull_records and pull_record_ends only)"},
                 "keep_temp": {"flag": "k",
                               "action": "store",
                               "help": "Save temporary files created by generate_tree in current working directory"},
@@ -1687,6 +2050,9 @@ sb_modifiers = {"alpha": {"flag": "a",
                 "quiet": {"flag": "q",
                           "action": "store_true",
                           "help": "Suppress stderr messages"},
+                "stream": {"flag": "stm",
+                           "action": "store_true",
+                           "help": "Process records one at a time to keep memory use low (record-local tools only)"},
                 "test": {"flag": "t",
                          "action": "store_true",
                          "help": "Run the function and return any stderr/stdout other than sequences"}}
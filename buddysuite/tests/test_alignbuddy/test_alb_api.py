@@ -44,10 +44,32 @@ def test_alignment_lengths(alb_resources):
 def test_bootstrap(alb_resources, hf):
     # Test an amino acid file
     tester = Alb.bootstrap(alb_resources.get_one("m p py"), r_seed=12345)
-    assert hf.buddy2hash(tester) == "ce9009b430ad0fe7f151477985e6f922"
+    assert hf.buddy2hash(tester) == "ab84e3bbe3b664fdaa4b9ebd11a6913d"
 
     tester = Alb.bootstrap(alb_resources.get_one("m p py"), 3, r_seed=12345)
-    assert hf.buddy2hash(tester) == "e6d5f30c3a7f53ec7899618a045b017d"
+    assert hf.buddy2hash(tester) == "63dcf84037e3e0ea81b0a12278a26347"
+
+    # Any seed random.seed() takes is accepted, not just the 32 bit unsigned ints numpy wants
+    for r_seed in [-5, 2 ** 40, "foo"]:
+        tester = Alb.bootstrap(alb_resources.get_one("o p py"), 2, r_seed=r_seed)
+        assert hf.buddy2hash(tester) == hf.buddy2hash(Alb.bootstrap(alb_resources.get_one("o p py"), 2, r_seed=r_seed))
+    with pytest.raises(TypeError):
+        Alb.bootstrap(alb_resources.get_one("o p py"), r_seed=[1, 2])
+
+
+def test_bootstrap_iter(alb_resources, hf):
+    tester = alb_resources.get_one("m p py")
+    replicates = Alb.bootstrap_iter(tester, 3, r_seed=12345)
+    assert not isinstance(replicates, list)
+    replicates = list(replicates)
+    assert [replicate.lengths() for replicate in replicates] == [[681], [681], [681], [480], [480], [480]]
+    joined = Alb.AlignBuddy([replicate.alignments[0] for replicate in replicates], out_format=tester.out_format)
+    assert hf.buddy2hash(joined) == hf.buddy2hash(Alb.bootstrap(tester, 3, r_seed=12345))
+
+    tester = alb_resources.get_one("o d n")
+    replicates = list(Alb.bootstrap_iter(tester, 2))
+    assert [replicate.out_format for replicate in replicates] == ["phylip-relaxed"] * 2
+    assert [replicate.lengths() for replicate in replicates] == [tester.lengths()] * 2
 
 
 # ##############################################  '-cs', '--clean_seqs' ############################################## #
@@ -105,6 +127,23 @@ def test_concat_alignments(alb_resources, hf):
     assert hf.buddy2hash(Alb.concat_alignments(Alb.make_copy(tester))) == 'f3ed9139ab6f97042a244d3f791228b6'
 
 
+def test_partition_file(alb_resources):
+    tester = alb_resources.get_one("m p py")
+    with pytest.raises(AttributeError) as e:
+        Alb.partition_file(tester)
+    assert "No partitions found." in str(e)
+
+    with pytest.raises(ValueError) as e:
+        Alb.partition_file(tester, "phylip")
+    assert "Partition format must be either 'raxml' or 'nexus', not 'phylip'." in str(e)
+
+    tester = Alb.concat_alignments(tester)
+    assert tester.alignments[0].partitions == [("Alignment_1", 0, 681), ("Alignment_2", 681, 1161)]
+    assert Alb.partition_file(tester) == "AUTO, Alignment_1 = 1-681\nAUTO, Alignment_2 = 682-1161\n"
+    assert Alb.partition_file(tester, "NEXUS") == "#NEXUS\nbegin sets;\n    charset Alignment_1 = 1-681;\n" \
+                                                  "    charset Alignment_2 = 682-1161;\nend;\n"
+
+
 # ###########################################  '-con', '--consensus' ############################################ #
 hashes = [('o d g', '888a13e13666afb4d3d851ca9150b442'), ('o d n', '560d4fc4be7af5d09eb57a9c78dcbccf'),
           ('o d py', '01f1181187ffdba4fb08f4011a962642'), ('o d s', '51b5cf4bb7d591c9d04c7f6b6bd70692'),
@@ -389,7 +428,7 @@ def test_clustalomega(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "bad3a345e769d32672d39ee51df295f5"
+    assert hf.string2hash(kept_output) == "eae2d917c462b70253cb83af98bfb60b"
 
 
 def test_clustalw2(sb_resources, hf, monkeypatch):
@@ -429,7 +468,7 @@ def test_clustalw2(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "7c03d671198d4e6c4bb56c8fb5619fff"
+    assert hf.string2hash(kept_output) == "eb9ff56e71021ce9237aa592d4c9d686"
 
 
 def test_pagan(sb_resources, hf, monkeypatch):
@@ -472,7 +511,7 @@ def test_pagan(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "864112dafb4896ba25ece7929ca0a818"
+    assert hf.string2hash(kept_output) == "e6e34b6cc0a2de62be9e94c8917ad2fc"
 
 
 def test_prank(sb_resources, hf, monkeypatch):
@@ -512,7 +551,7 @@ def test_prank(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "d0564931e20a61b441fc60549f5560a0"
+    assert hf.string2hash(kept_output) == "4928df3557f29312d7b55166829eb477"
 
 
 def test_muscle(sb_resources, hf, monkeypatch):
@@ -543,7 +582,7 @@ def test_muscle(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "bd85c34b11261aef2d38c7a6a9d20bf9"
+    assert hf.string2hash(kept_output) == "e2f32ea93255937069bc172fbf7c354f"
 
 
 def test_mafft(sb_resources, hf, monkeypatch):
@@ -576,7 +615,7 @@ def test_mafft(sb_resources, hf, monkeypatch):
     for file in sorted(files):
         with open("%s%s%s" % (root, os.path.sep, file), "r", encoding="utf-8") as ifile:
             kept_output += ifile.read()
-    assert hf.string2hash(kept_output) == "6eaa7e087dd42a8d3ffe86d216b917d8"
+    assert hf.string2hash(kept_output) == "1a45f520c0df3670c93db90907ca3978"
 
 
 def test_alignment_edges(monkeypatch, sb_resources):
@@ -656,6 +695,23 @@ def test_cases(key, uc_hash, lc_hash, alb_resources, hf):
     assert hf.buddy2hash(tester) == lc_hash, tester.write("error_files%s%s" % (lc_hash, os.path.sep))
 
 
+# ##################### 'map_coordinates' ###################### ##
+def test_map_coordinates():
+    alignment = MultipleSeqAlignment([SeqRecord(Seq("--AT-G", alphabet=IUPAC.ambiguous_dna), id="A"),
+                                      SeqRecord(Seq("CCA--G", alphabet=IUPAC.ambiguous_dna), id="B")])
+    alignbuddy = Alb.AlignBuddy([alignment])
+
+    columns = Alb.map_coordinates(alignbuddy, [0, 2, 3, -1])
+    assert len(columns) == 1
+    assert list(columns[0]) == ["A", "B"]
+    assert columns[0]["A"].tolist() == [2, 5, -1, -1]
+    assert columns[0]["B"].tolist() == [0, 2, 5, -1]
+
+    residues = Alb.map_coordinates(alignbuddy, {"B": range(7)}, to_columns=False)
+    assert list(residues[0]) == ["B"]
+    assert residues[0]["B"].tolist() == [0, 1, 2, -1, -1, 3, -1]
+
+
 # ##################### '-mf2a', '--map_features2alignment' ###################### ##
 hashes = [('o p n', '79078260e8725a0d7ccbed9400c78eae'), ('o p pr', '02b977e5b086125255b792788014708a'),
           ('o p psr', '02b977e5b086125255b792788014708a'), ('o p s', '372daf72435e2f1a06531b5c030995c6'),
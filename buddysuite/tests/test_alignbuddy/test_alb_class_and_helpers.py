@@ -4,13 +4,15 @@
 import pytest
 import io
 import os
+import numpy as np
 from Bio.SeqRecord import SeqRecord
 from Bio.Seq import Seq
 from Bio.Alphabet import IUPAC
 from Bio import AlignIO
 
 import buddy_resources as br
-from AlignBuddy import AlignBuddy, guess_alphabet, guess_format, make_copy
+from AlignBuddy import AlignBuddy, guess_alphabet, guess_format, make_copy, shallow_copy, _residue_index, \
+    _enforce_triplets_seq
 from buddy_resources import GuessError, parse_format
 
 
@@ -88,6 +90,18 @@ def test_throws_errors_on_invalid_files(alb_odd_resources):
     with pytest.raises(GuessError):
         AlignBuddy(alb_odd_resources['dna']['single']['fasta'])
 
+    # The format is guessed from the start of the file, so unaligned sequences further in still need catching
+    tmp_file = br.TempFile()
+    tmp_file.write("".join([">seq%s\n%s\n" % (indx, "ACGT" * 25) for indx in range(br.SNIFF_SIZE // 100)]) +
+                   ">short\nACGT\n")
+    with pytest.raises(GuessError) as e:
+        AlignBuddy(tmp_file.path)
+    assert "Could not determine format from _input file" in str(e)
+
+    with pytest.raises(ValueError) as e:
+        AlignBuddy(tmp_file.path, in_format="fasta")
+    assert "Sequences must all be the same length" in str(e)
+
 
 # ##################### AlignBuddy methods ###################### ##
 def test_set_format(alb_resources):
@@ -247,6 +261,23 @@ def test_write3(alb_resources, hf):  # Unloopable components
     assert hf.buddy2hash(tester) == "16b3397d6315786e8ad8b66e0d9c798f"
 
 
+def test_write_handle(alb_resources, hf):
+    tester = alb_resources.get_one("m p c")
+    handle = io.StringIO()
+    tester.write(handle)
+    assert handle.getvalue() == str(tester)
+    assert handle.getvalue().endswith("\n\n")
+
+    handle = io.StringIO()
+    tester.write(handle, out_format="phylipr")
+    assert hf.string2hash(handle.getvalue()) == "9c6773e7d24000f8b72dd9d25620cff1"
+    assert tester.out_format == "clustal"
+
+    tester.set_format("fasta")
+    with pytest.raises(ValueError):
+        tester.write(io.StringIO())
+
+
 # ################################################# HELPER FUNCTIONS ################################################# #
 def test_guess_error(alb_odd_resources):
     # File path
@@ -285,7 +316,7 @@ def test_guess_alphabet(alb_resources):
     assert not guess_alphabet(AlignBuddy("", in_format="fasta"))
 
 
-def test_guess_format(alb_resources, alb_odd_resources):
+def test_guess_format(alb_resources, alb_odd_resources, hf):
     assert guess_format(["dummy", "list"]) == "stockholm"
 
     for key, obj in alb_resources.get().items():
@@ -304,6 +335,18 @@ def test_guess_format(alb_resources, alb_odd_resources):
     assert not guess_format(alb_odd_resources['dna']['single']['phylipss_recs'])
     assert not guess_format(alb_odd_resources['dna']['single']['phylipss_cols'])
 
+    # Formats without record boundaries are read in full once their signature matches, however big the file is
+    nexus_path = "%s%sduplicate_alignment.nex" % (hf.resource_path, os.path.sep)
+    assert os.path.getsize(nexus_path) > br.SNIFF_SIZE
+    assert guess_format(nexus_path) == "nexus"
+
+    tmp_file = br.TempFile()
+    tmp_file.write("CLUSTAL W (1.83) multiple sequence alignment\n\n\n" +
+                   "seq1    %s\nseq2    %s\n\n" % ("ACGT" * 15, "ACGA" * 15) * 1200)
+    assert os.path.getsize(tmp_file.path) > br.SNIFF_SIZE
+    assert guess_format(tmp_file.path) == "clustal"
+    assert AlignBuddy(tmp_file.path).lengths() == [72000]
+
     with pytest.raises(GuessError) as e:
         guess_format({"Dummy dict": "Type not recognized by guess_format()"})
     assert "Unsupported _input argument in guess_format()" in str(e)
@@ -314,4 +357,73 @@ def test_make_copy(alb_resources, hf):
         tester = make_copy(alb)
         hf.buddy2hash(tester) == hf.buddy2hash(alb)
 
+
+def test_shallow_copy(alb_resources, hf):
+    for alb in alb_resources.get_list():
+        alb_hash = hf.buddy2hash(alb)
+        tester = shallow_copy(alb)
+        assert hf.buddy2hash(tester) == alb_hash
+        assert tester.alignments[0] is not alb.alignments[0]
+        assert tester.records()[0] is not alb.records()[0]
+
+        for rec in tester.records_iter():
+            rec.id = "Foo"
+            rec.seq = Seq("-" * len(rec.seq), alphabet=rec.seq.alphabet)
+            rec.features = []
+        tester.alignments[0]._records = tester.alignments[0]._records[:1]
+        assert hf.buddy2hash(alb) == alb_hash
+
+
+def test_matrix(alb_resources):
+    tester = alb_resources.get_one("o d g")
+    matrix = tester.matrix()
+    assert matrix.dtype == np.uint8
+    assert matrix.shape == (len(tester.alignments[0]), tester.lengths()[0])
+    assert matrix[0].tobytes().decode() == str(tester.alignments[0][0].seq)
+    assert tester.matrix() is matrix
+    with pytest.raises(ValueError):
+        matrix[0, 0] = ord("A")
+
+    rec = tester.alignments[0][1]
+    rec.seq = Seq("-" * len(rec.seq), alphabet=rec.seq.alphabet)
+    new_matrix = tester.matrix()
+    assert new_matrix is not matrix
+    assert set(new_matrix[1].tolist()) == {ord("-")}
+    assert new_matrix[0].tobytes() == matrix[0].tobytes()
+
+    tester = alb_resources.get_one("m p py")
+    assert tester.matrix(1).shape == (len(tester.alignments[1]), tester.lengths()[1])
+
+    # Multi-byte characters must not shift the rows
+    rec = tester.alignments[0][0]
+    rec.seq = Seq("\u00e9" + str(rec.seq)[1:], alphabet=rec.seq.alphabet)
+    matrix = tester.matrix()
+    assert matrix.shape == (len(tester.alignments[0]), tester.lengths()[0])
+    assert matrix[0].tobytes().decode("latin-1") == str(rec.seq)
+
+    rec.seq = Seq("\u03b1" + str(rec.seq)[1:], alphabet=rec.seq.alphabet)
+    with pytest.raises(ValueError) as err:
+        tester.matrix()
+    assert "not a single-byte (latin-1) character: '\u03b1'" in str(err)
+
+
+def test_enforce_triplets_seq():
+    assert _enforce_triplets_seq("") == ""
+    assert _enforce_triplets_seq("A-TG--C.GA") == "ATG---CGA."
+    assert _enforce_triplets_seq("AT-G-C--A-") == "ATG---CA--"
+    assert _enforce_triplets_seq("--ATGCC-A-T--") == "---ATGCCAT---"
+    assert _enforce_triplets_seq("ATG---CC--CAAT") == "ATG---CCCAAT--"
+
+
+def test_residue_index(alb_resources):
+    rec = alb_resources.get_one("o d g").alignments[0][0]
+    index = _residue_index(rec)
+    assert len(index) == len(rec.seq)
+    assert "".join([str(rec.seq)[col] for col in index.positions]) == str(rec.seq).replace("-", "")
+    assert _residue_index(rec) is index
+
+    rec.seq = Seq("A-C.G T", alphabet=rec.seq.alphabet)
+    index = _residue_index(rec)
+    assert index.positions.tolist() == [0, 2, 4, 6]
+
 # ToDo: def test_feature_remapper()
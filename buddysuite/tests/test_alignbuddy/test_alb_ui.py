@@ -163,6 +163,11 @@ def test_bootstrap_ui(capsys, alb_resources):
     tester = Alb.AlignBuddy(out)
     assert tester.lengths() == [481, 481, 481, 683, 683, 683]
 
+    Alb.command_line_ui(test_in_args, alb_resources.get_one("o d f"), skip_exit=True)
+    out, err = capsys.readouterr()
+    assert not out
+    assert "fasta format does not support multiple alignments in one file." in err
+
 
 # ##################### '-cs', '--clean_seqs' ###################### ##
 def test_clean_seqs_ui(capsys, alb_resources, alb_odd_resources, hf):
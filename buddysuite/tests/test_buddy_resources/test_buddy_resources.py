@@ -15,9 +15,10 @@ from hashlib import md5
 from time import sleep
 import datetime
 from unittest import mock
+from subprocess import Popen, PIPE
 import AlignBuddy as Alb
 import buddy_resources as br
-from pkg_resources import DistributionNotFound
+from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
 from configparser import ConfigParser
 if os.name == "nt":
     import msvcrt
@@ -208,25 +209,39 @@ def test_run_multicore_function(monkeypatch, hf):
     nums = range(1, 5)
 
     with open(temp_path, "w") as output:
-        br.run_multicore_function(nums, lambda *_: True, func_args=False,
-                                  max_processes=0, quiet=False, out_type=output)
+        results = br.run_multicore_function(nums, lambda *_: True, func_args=False,
+                                            max_processes=0, quiet=False, out_type=output)
+    assert results == [True, True, True, True]
     with open(temp_path, "r") as out:
         output = out.read()
-        assert hf.string2hash(output) in ["107696d60ee9b932ecaffad7c97a609f", "c2adacdaf0de6526c707564068a3460a"]
+        assert hf.string2hash(output) == "01c08a947d156b37ed38a7b2387db887"
 
     with open(temp_path, "w") as output:
-        br.run_multicore_function(nums, lambda *_: True, func_args=["Foo"],
-                                  max_processes=5, quiet=False, out_type=output)
+        results = br.run_multicore_function(nums, lambda num, args: "%s%s" % (args[0], num), func_args=["Foo"],
+                                            max_processes=5, quiet=False, out_type=output)
+    assert results == ["Foo1", "Foo2", "Foo3", "Foo4"]
     with open(temp_path, "r") as out:
         output = out.read()
-        assert hf.string2hash(output) in ["107696d60ee9b932ecaffad7c97a609f", "c2adacdaf0de6526c707564068a3460a"]
+        assert hf.string2hash(output) == "01c08a947d156b37ed38a7b2387db887"
 
     with open(temp_path, "w") as output:
-        br.run_multicore_function({"a": 1, "b": 2, "c": 3, "d": 4}, lambda *_: True, func_args=False,
-                                  max_processes=-4, quiet=False, out_type=output)
+        results = br.run_multicore_function({"a": 1, "b": 2, "c": 3, "d": 4}, lambda num: num * 2, func_args=False,
+                                            max_processes=-4, quiet=False, out_type=output)
+    assert results == [2, 4, 6, 8]
     with open(temp_path, "r") as out:
         output = out.read()
-        assert hf.string2hash(output) in ["cf5afec941a4b854ed78f01d2753009d", "b9a2268fefae3786a611f5e699fd6200"]
+        assert hf.string2hash(output) == "a0a1d4535bb3ed0af6bf7e5b1bafd655"
+
+    # Calls that raise come back as None, and unpicklable return values are dropped for the whole chunk
+    results = br.run_multicore_function(range(4), lambda num: 1 / num, max_processes=2, quiet=True)
+    assert results == [None, 1.0, 0.5, 1 / 3]
+    results = br.run_multicore_function(range(2), lambda num: (lambda: num), max_processes=2, quiet=True)
+    assert results == [None, None]
+    assert br.run_multicore_function([], lambda num: num, quiet=True) == []
+
+    with pytest.raises(RuntimeError) as err:
+        br.run_multicore_function(range(2), lambda num: os._exit(0), max_processes=2, quiet=True)
+    assert "Worker processes for <lambda>() exited before finishing all jobs" in str(err)
 
     with pytest.raises(AttributeError) as err:
         br.run_multicore_function(nums, lambda *_: True, func_args="Foo", max_processes=4, quiet=False,
@@ -248,7 +263,7 @@ def test_run_multicore_function(monkeypatch, hf):
                                   max_processes=1, quiet=False, out_type=output)
     with open(temp_path, "r") as out:
         output = out.read()
-        assert hf.string2hash(output) in ["08f48aaa5d64ac48ea15a4aa63d75141", 'b9a2268fefae3786a611f5e699fd6200']
+        assert hf.string2hash(output) == "8ec9fbf5724978bbb99347dcf7b007c4"
 
     timer = MockTime()
     monkeypatch.setattr(br, "time", timer.time)
@@ -262,6 +277,32 @@ def test_run_multicore_function(monkeypatch, hf):
     assert re.search("DONE: 4 jobs in [0-9]+ sec", output)
 
 
+def test_parallel_map(monkeypatch):
+    monkeypatch.setattr(br, "cpu_count", mock.Mock(return_value=4))
+    monkeypatch.setattr(br, "usable_cpu_count", mock.Mock(return_value=4))
+
+    for mode in ["process", "thread"]:
+        results = br.parallel_map(lambda num, args: num * args[0], range(20), func_args=[3], mode=mode, quiet=True)
+        assert results == [num * 3 for num in range(20)]
+
+        results = br.parallel_map(lambda num: 1 / num, range(3), max_workers=2, mode=mode, quiet=True)
+        assert type(results[0]) == br.TaskError
+        assert results[0].index == 0
+        assert str(results[0]) == "Task 0 failed with ZeroDivisionError: division by zero"
+        assert "Traceback" in results[0].trace
+        assert results[1:] == [1.0, 0.5]
+        assert br.parallel_map(lambda num: num, [], mode=mode, quiet=True) == []
+
+    temp_file = br.TempFile()
+    with open(temp_file.path, "w") as output:
+        br.parallel_map(lambda num: num, range(4), max_workers=10, mode="thread", out_type=output)
+    assert "Running function <lambda>() on 4 threads" in temp_file.read()
+
+    with pytest.raises(ValueError) as err:
+        br.parallel_map(lambda num: num, range(4), mode="foo")
+    assert "parallel_map() mode must be 'process' or 'thread'" in str(err)
+
+
 # ######################################  TempDir  ###################################### #
 def test_tempdir_init():
     test_dir = br.TempDir()
@@ -356,6 +397,19 @@ def test_tempfile():
     assert open("{0}/temp".format(TEMP_DIR.path), 'r').read() == "hello world"
 
 
+def test_rstripwriter():
+    handle = io.StringIO()
+    writer = br.RstripWriter(handle)
+    writer.write(">Seq1\n")
+    assert handle.getvalue() == ">Seq1"
+    writer.write("  \n\n")
+    writer.write("ATGC\n\n")
+    assert handle.getvalue() == ">Seq1\n  \n\nATGC"
+    writer.end()
+    assert handle.getvalue() == ">Seq1\n  \n\nATGC\n"
+    assert writer.getvalue() == handle.getvalue()
+
+
 def test_safetyvalve():
     valve = br.SafetyValve()
     with pytest.raises(RuntimeError):
@@ -550,7 +604,7 @@ def test_usage(monkeypatch):
     config = mock.Mock(return_value={"email": "buddysuite@nih.gov", "diagnostics": True, "user_hash": "ABCDEF",
                                      "data_dir": TEMP_DIR.path})
     monkeypatch.setattr(br, "config_values", config)
-    monkeypatch.setattr(br, "FTP", FakeFTP)
+    monkeypatch.setattr(ftplib, "FTP", FakeFTP)
     usage = br.Usage()
     usage.stats["last_upload"] = "2015-01-01"
     with pytest.raises(RuntimeError):
@@ -581,7 +635,7 @@ def test_usage(monkeypatch):
 
     # Gracefully handling FTP errors
     FakeFTP.storlines = raise_ftp_errors
-    monkeypatch.setattr(br, "FTP", FakeFTP)
+    monkeypatch.setattr(ftplib, "FTP", FakeFTP)
 
     usage = br.Usage()
     usage.stats["last_upload"] = "2015-01-01"
@@ -617,6 +671,48 @@ def test_version():
                              "Contributors:BudDSuitebuddysuiteSweetWatersweetwater"
 
 
+def test_lazy_import(monkeypatch):
+    assert br.lazy_import("os") is os
+
+    monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+    colorsys = br.lazy_import("colorsys")
+    assert sys.modules["colorsys"] is colorsys
+    assert colorsys.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+
+    with pytest.raises(ImportError) as e:
+        br.lazy_import("foo_bar_baz")
+    assert "No module named 'foo_bar_baz'" in str(e)
+
+
+# Heavy dependencies that must only be loaded when the command that needs them is run
+DEFERRED_MODULES = ["Bio.Restriction", "Bio.SeqUtils.IsoelectricPoint", "pkg_resources", "ftplib", "zipfile",
+                    "ete3", "dill", "readline"]
+# Startup is measured against buddy_resources (numpy, Bio.SeqIO, etc.), which every tool needs anyway, so the budget
+# holds on slow or busy machines. Each tool currently adds ~40% on top of that; ete3 alone used to add ~600%.
+IMPORT_BUDGET = 2.0
+
+
+@pytest.mark.parametrize("tool", ["SeqBuddy", "AlignBuddy", "PhyloBuddy", "DatabaseBuddy"])
+def test_import_time(tool):
+    buddy_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+    ratios = []
+    for _ in range(3):  # Take the fastest run, so a spike in load on the test machine doesn't cause spurious failures
+        output = Popen([sys.executable, "-X", "importtime", "-c", "import %s" % tool], cwd=buddy_dir,
+                       stdout=PIPE, stderr=PIPE).communicate()[1].decode()
+        # Each line looks like 'import time:  self [us] | cumulative | imported package'
+        imported = {}
+        for line in output.splitlines():
+            line = line.split("|")
+            if len(line) == 3 and line[1].strip().isdigit():
+                imported[line[2].strip()] = int(line[1])
+        assert tool in imported, output
+        for module in DEFERRED_MODULES:
+            assert module not in imported, "%s imports %s at startup" % (tool, module)
+        ratios.append(imported[tool] / imported["buddy_resources"])
+    assert min(ratios) < IMPORT_BUDGET, "%s took %sx as long to import as buddy_resources" % (tool,
+                                                                                            round(min(ratios), 2))
+
+
 def test_config_values(monkeypatch):
     fake_config = br.TempFile()
     fake_config.write("[DEFAULT]\nuser_hash = ABCDEFG\ndiagnostics = True\nemail = buddysuite@mockmail.com"
@@ -641,10 +737,8 @@ def test_config_values(monkeypatch):
     assert not options["diagnostics"]
     assert options["email"] == "buddysuite@nih.gov"
 
-    def mock_distributionerror(*args, **kwargs):
-        raise DistributionNotFound(args, kwargs)
-
-    monkeypatch.setattr(br, "resource_filename", mock_distributionerror)
+    # BuddySuite hasn't been installed/configured, so there is no buddy_data directory
+    monkeypatch.setattr(br, "resource_filename", lambda *_: os.path.join(br.TempDir().path, "missing"))
     options = br.config_values()
     assert not options["data_dir"]
 
@@ -677,7 +771,7 @@ ZeroDivisionError: division by zero
     fake_raw_output = io.BytesIO(error_hash)
     monkeypatch.setattr(urllib.request, "urlopen", lambda *_, **__: fake_raw_output)
 
-    monkeypatch.setattr(br, "FTP", FakeFTP)
+    monkeypatch.setattr(ftplib, "FTP", FakeFTP)
     monkeypatch.setattr(br, "config_values", lambda *_, **__: {"email": "buddysuite@nih.gov", "diagnostics": True,
                                                                "user_hash": "hashless", "data_dir": False})
 
@@ -699,7 +793,7 @@ ZeroDivisionError: division by zero
 
     # Gracefully handling FTP errors
     FakeFTP.storlines = raise_ftp_errors
-    monkeypatch.setattr(br, "FTP", FakeFTP)
+    monkeypatch.setattr(ftplib, "FTP", FakeFTP)
     br.error_report(fake_error, True)
 
 
@@ -750,6 +844,77 @@ def test_parse_format():
         br.parse_format("buddy")
 
 
+def test_sniff_format():
+    assert br.sniff_format(">Seq1 description\nATGC\n") == ["fasta"]
+    assert br.sniff_format("\n\nLOCUS       Seq1   4 bp    DNA\n") == ["gb"]
+    assert br.sniff_format("ID   Seq1; SV 1; linear; DNA; STD; UNC; 4 BP.\n") == ["embl", "swiss"]
+    assert br.sniff_format("# STOCKHOLM 1.0\n") == ["stockholm"]
+    assert br.sniff_format("#NEXUS\nbegin data;\n") == ["nexus"]
+    assert br.sniff_format("CLUSTAL W (1.83) multiple sequence alignment\n") == ["clustal"]
+    assert br.sniff_format("MUSCLE (3.8) multiple sequence alignment\n") == ["clustal"]
+    assert br.sniff_format("@Seq1\nATGC\n+\nIIII\n") == ["fastq"]
+    assert br.sniff_format('<?xml version="1.0"?>\n<seqXML>\n') == ["seqxml"]
+    assert br.sniff_format('<?xml version="1.0"?>\n<nex:nexml>\n') == ["nexml"]
+    assert br.sniff_format(" 2 4\nSeq1 ATGC\n") == ["phylipss", "phylipsr", "phylip", "phylip-relaxed"]
+    assert br.sniff_format("ATGCATGC") == []
+
+
+def test_trim_to_records():
+    assert br.trim_to_records(">Seq1\nATGC\n>Seq2\nAT", "fasta") == ">Seq1\nATGC\n"
+    assert br.trim_to_records(">Seq1\nATGC", "fasta") is None
+    assert br.trim_to_records("LOCUS  Seq1\n//\nLOCUS  Seq2\n", "gb") == "LOCUS  Seq1\n//\n"
+    assert br.trim_to_records("LOCUS  Seq1\nORIGIN\n", "gb") is None
+    assert br.trim_to_records("@Seq1\nATGC\n+\nIIII\n@Seq2\nAT", "fastq") == "@Seq1\nATGC\n+\nIIII\n"
+    assert br.trim_to_records("@Seq1\nATGC\n+\n", "fastq") is None
+    assert br.trim_to_records("#NEXUS\nbegin data;\n", "nexus") is None
+
+
+def test_trial_parse_formats():
+    tried = []
+
+    def trial_parse(next_format, sample):
+        tried.append(next_format)
+        if sample.read().startswith(">") and next_format == "fasta":
+            return "fasta"
+        raise ValueError
+
+    # Signature matches jump the queue
+    handle = io.StringIO(">Seq1\nATGC\n")
+    assert br.trial_parse_formats(handle, ["gb", "embl", "fasta"], trial_parse) == "fasta"
+    assert tried == ["fasta"]
+    assert handle.tell() == 0
+
+    # Unknown formats are tried in order, and only on the first SNIFF_SIZE characters
+    tried = []
+    handle = io.StringIO("ATGC" * br.SNIFF_SIZE)
+    assert br.trial_parse_formats(handle, ["gb", "fasta"], trial_parse) is None
+    assert tried == ["gb", "fasta"]
+    assert handle.tell() == 0
+
+    # The sample grows if the first record of a signature-matched format is bigger than SNIFF_SIZE
+    samples = []
+
+    def trial_parse(next_format, sample):
+        sample = sample.read()
+        samples.append(len(sample))
+        if "\n>" not in sample:
+            raise ValueError
+        return next_format
+
+    handle = io.StringIO(">Seq1\n%s\n>Seq2\nATGC\n" % ("A" * br.SNIFF_SIZE * 2))
+    assert br.trial_parse_formats(handle, ["fasta"], trial_parse) == "fasta"
+    assert samples == [br.SNIFF_SIZE, len(handle.getvalue())]
+
+    assert br.trial_parse_formats(io.StringIO(""), ["fasta"], trial_parse) == "empty file"
+
+    # Signature-matched formats that can't be cut into records are handed the whole file
+    samples = []
+    handle = io.StringIO("#NEXUS\n%s" % ("A" * br.SNIFF_SIZE * 2))
+    assert br.trial_parse_formats(handle, ["nexus"], trial_parse) is None
+    assert samples == [len(handle.getvalue())]
+    assert handle.tell() == 0
+
+
 def test_preparse_flags():
     sys.argv = ['buddy_resources.py', "-v", "-foo", "blahh", "-c", "-ns", "57684", "--blast", "--bar"]
     br.preparse_flags()
@@ -898,6 +1063,30 @@ RuntimeError: Something broke!
         assert "raise TypeError" in out
 
 
+def test_position_map():
+    position_map = br.PositionMap([False, True, True, False, True, False])
+    assert len(position_map) == 6
+    assert list(position_map) == [(0, False), (0, True), (1, True), (1, False), (2, True), (2, False)]
+    assert position_map[-1] == (2, False)
+    assert position_map[2:4] == [(1, True), (1, False)]
+    assert position_map.rank(3) == 2
+    assert position_map.rank(100) == 3
+    assert position_map.select(2) == 4
+    assert position_map.remap_range(0, 3) == (0, 2)
+    assert not position_map.remap_range(5, 6)
+
+    feature = SeqFeature(CompoundLocation([FeatureLocation(0, 2), FeatureLocation(3, 4), FeatureLocation(4, 6)]))
+    feature = position_map.remap_feature(feature)
+    assert str(feature.location) == "order{[0:1], [2:3]}"
+    feature = position_map.remap_feature(SeqFeature(CompoundLocation([FeatureLocation(0, 1), FeatureLocation(3, 6)])))
+    assert str(feature.location) == "[2:3]"
+    assert not position_map.remap_feature(SeqFeature(FeatureLocation(5, 6)))
+
+    position_map = br.PositionMap.from_gapped("-AT--G.C", gap_chars="-.")
+    assert position_map.positions.tolist() == [1, 2, 5, 7]
+    assert position_map.rank(5) == 2
+
+
 def test_shift_features(sb_resources, hf):
     buddy = sb_resources.get_one("d g")
     buddy.records = [buddy.records[0]]
@@ -181,9 +181,7 @@ def test_uniprotrestclient_query_uniprot(capsys, monkeypatch):
     dbbuddy = Db.DbBuddy()
     client = Db.UniProtRestClient(dbbuddy)
     monkeypatch.setattr(Db, 'urlopen', mock_urlopen_handle_uniprot_ids)
-    client.query_uniprot("inx15", {"format": "list"})
-
-    assert client.results_file.read() == '''# Search: inx15
+    assert client.query_uniprot("inx15", {"format": "list"}) == '''# Search: inx15
 A8XEF9
 O61786
 A0A0H5SBJ0
@@ -195,7 +193,7 @@ A0A0H5SBJ0
 
     # Errors
     monkeypatch.setattr(Db, 'urlopen', mock_raise_httperror)
-    client.query_uniprot("inx15", [{"format": "list"}])
+    assert client.query_uniprot("inx15", [{"format": "list"}]) == ""
     assert client.http_errors_file.read() == "Uniprot search failed for 'inx15'\nHTTP Error 101: " \
                                              "Fake HTTPError from Mock\n//\n"
 
@@ -239,7 +237,7 @@ def test_uniprotrestclient_count_hits(monkeypatch):
 def test_uniprotrestclient_search_proteins(monkeypatch, capsys):
     def patch_query_uniprot_multi(*args, **kwargs):
         print("patch_query_uniprot_multi\nargs: %s\nkwargs: %s" % (args, kwargs))
-        client1.results_file.write('''# Search: inx15
+        return ['''# Search: inx15
 A8XEF9	A8XEF9_CAEBR	381	6238	Caenorhabditis briggsae	Innexin	Function (1); Sequence similarities (1); \
 Subcellular location (2)
 O61786	O61786_CAEEL	382	6239	Caenorhabditis elegans	Innexin	Function (1); Sequence similarities (1); \
@@ -260,20 +258,18 @@ A0A0B2VB60	A0A0B2VB60_TOXCA	366	6265	Toxocara canis (Canine roundworm)	Innexin	C
 Sequence similarities (1); Subcellular location (1)
 A0A0V0W5E2	A0A0V0W5E2_9BILA	410	92179	Trichinella sp. T6	Innexin	Caution (2); Function (1); Sequence \
 similarities (1); Subcellular location (1)
-//''', "w")
-        return
+//''']
 
     def patch_query_uniprot_single(*args, **kwargs):
         print("patch_query_uniprot_single\nargs: %s\nkwargs: %s" % (args, kwargs))
-        client2.results_file.write('''# Search: inx15
+        return '''# Search: inx15
 A8XEF9	A8XEF9_CAEBR	381	6238	Caenorhabditis briggsae	Innexin	Function (1); Sequence similarities (1); \
 Subcellular location (2)
 O61786	O61786_CAEEL	382	6239	Caenorhabditis elegans	Innexin	Function (1); Sequence similarities (1); \
 Subcellular location (2)
 A0A0H5SBJ0	A0A0H5SBJ0_BRUMA	129	6279	Brugia malayi (Filarial nematode worm)	Innexin
 E3MGD6	E3MGD6_CAERE	384	31234	Caenorhabditis remanei (Caenorhabditis vulgaris)	Innexin
-//''', "w")
-        return
+//'''
 
     monkeypatch.setattr(Db.UniProtRestClient, "count_hits", lambda _: 0)
     dbbuddy = Db.DbBuddy("inx15,inx16")
@@ -283,7 +279,7 @@ E3MGD6	E3MGD6_CAERE	384	31234	Caenorhabditis remanei (Caenorhabditis vulgaris)	I
     assert "Uniprot returned no results\n\n" in err
 
     monkeypatch.setattr(Db.UniProtRestClient, "count_hits", lambda _: 9)
-    monkeypatch.setattr(br, "run_multicore_function", patch_query_uniprot_multi)
+    monkeypatch.setattr(br, "parallel_map", patch_query_uniprot_multi)
     client1.search_proteins()
     out, err = capsys.readouterr()
     assert "Retrieving summary data for 9 records from UniProt\n" in err
@@ -302,7 +298,7 @@ E3MGD6	E3MGD6_CAERE	384	31234	Caenorhabditis remanei (Caenorhabditis vulgaris)	I
 def test_uniprotrestclient_fetch_proteins(monkeypatch, capsys, hf):
     def patch_query_uniprot_search(*args, **kwargs):
         print("patch_query_uniprot_search\nargs: %s\nkwargs: %s" % (args, kwargs))
-        client.results_file.write('''# Search: inx15
+        return '''# Search: inx15
 A8XEF9	A8XEF9_CAEBR	381	6238	Caenorhabditis briggsae	Innexin	Function (1); Sequence similarities (1); \
 Subcellular location (2)
 O61786	O61786_CAEEL	382	6239	Caenorhabditis elegans	Innexin	Function (1); Sequence similarities (1); \
@@ -323,21 +319,20 @@ A0A0B2VB60	A0A0B2VB60_TOXCA	366	6265	Toxocara canis (Canine roundworm)	Innexin	C
 Sequence similarities (1); Subcellular location (1)
 A0A0V0W5E2	A0A0V0W5E2_9BILA	410	92179	Trichinella sp. T6	Innexin	Caution (2); Function (1); Sequence \
 similarities (1); Subcellular location (1)
-//''', "w")
-        return
+//'''
 
     def patch_query_uniprot_fetch(*args, **kwargs):
         print("patch_query_uniprot_fetch\nargs: %s\nkwargs: %s" % (args, kwargs))
         with open("%s/mock_resources/test_databasebuddy_clients/uniprot_fetch.txt" % hf.resource_path, "r") \
                 as ifile:
-            client.results_file.write(ifile.read(), "w")
-        return
+            return ifile.read()
+
+    def patch_parallel_map_fetch(*args, **kwargs):
+        return [patch_query_uniprot_fetch(*args, **kwargs)]
 
     def patch_query_uniprot_fetch_nothing(*args, **kwargs):
         print("patch_query_uniprot_fetch_nothing\nargs: %s\nkwargs: %s" % (args, kwargs))
-        client.results_file.write("# Search: A8XEF9,O61786,A0A0H5SBJ0,E3MGD6,O61787,A0A0V1AZ11,A8XEF8,A0A0B2VB60,"
-                                  "A0A0V0W5E2\n//\n//", "w")
-        return
+        return "# Search: A8XEF9,O61786,A0A0H5SBJ0,E3MGD6,O61787,A0A0V1AZ11,A8XEF8,A0A0B2VB60,A0A0V0W5E2\n//\n//"
 
     monkeypatch.setattr(Db.UniProtRestClient, "query_uniprot", lambda _: True)
     dbbuddy = Db.DbBuddy("inx15,inx16")
@@ -357,7 +352,7 @@ similarities (1); Subcellular location (1)
     assert "Requesting 9 full records from UniProt..." in err
 
     # Test multicore call to query_uniprot
-    monkeypatch.setattr(br, "run_multicore_function", patch_query_uniprot_fetch)
+    monkeypatch.setattr(br, "parallel_map", patch_parallel_map_fetch)
     for accn, rec in client.dbbuddy.records.items():
         rec.record = None
     client.dbbuddy.records["a" * 999] = Db.Record("a" * 999, _database="uniprot")
@@ -425,23 +420,20 @@ def test_ncbiclient_mc_query(hf, monkeypatch):
     client = Db.NCBIClient(dbbuddy)
 
     monkeypatch.setattr(Db.Entrez, "esummary", patch_entrez_esummary_taxa)
-    client._mc_query("649,734,1009,2302", ["esummary_taxa"])
-    assert hf.string2hash(client.results_file.read()) == "acfb85bbdf7c2f8ea7e925c5bfcaaf06"
-    client.results_file.clear()
+    assert hf.string2hash(client._mc_query("649,734,1009,2302", ["esummary_taxa"])) == \
+        "162c8144ee5c1c21901c43480ed62bab"
 
     monkeypatch.setattr(Db.Entrez, "efetch", patch_entrez_efetch_gis)
-    client._mc_query("XP_010103297.1,XP_010103298.1,XP_010103299.1", ["efetch_gi"])
-    assert client.results_file.read() == "703125407\n703125412\n67586143\n### END ###\n"
-    client.results_file.clear()
+    assert client._mc_query("XP_010103297.1,XP_010103298.1,XP_010103299.1", ["efetch_gi"]) == \
+        "703125407\n703125412\n67586143\n"
 
     monkeypatch.setattr(Db.Entrez, "esummary", patch_entrez_esummary_seq)
-    client._mc_query("703125407,703125412,67586143", ["esummary_seq"])
-    assert hf.string2hash(client.results_file.read()) == "e6ba80b5fe2f35002ac2227ca7791c17"
-    client.results_file.clear()
+    assert hf.string2hash(client._mc_query("703125407,703125412,67586143", ["esummary_seq"])) == \
+        "ab3274c9c7676ca532d9e6bd20add2cf"
 
     monkeypatch.setattr(Db.Entrez, "efetch", patch_entrez_efetch_seq)
-    client._mc_query("703125407,703125412,67586143", ["efetch_seq"])
-    assert hf.string2hash(client.results_file.read()) == "0154d7bd9d47ca6abac00f25428b9e7e"
+    assert hf.string2hash(client._mc_query("703125407,703125412,67586143", ["efetch_seq"])) == \
+        "0154d7bd9d47ca6abac00f25428b9e7e"
 
     monkeypatch.undo()
     monkeypatch.setattr(Db, "sleep", lambda _: True)
@@ -454,7 +446,7 @@ def test_ncbiclient_mc_query(hf, monkeypatch):
     assert "Unknown type 'Bar', choose between 'nucleotide' and 'protein" in str(err)
 
     monkeypatch.setattr(Db.Entrez, "efetch", mock_raise_httperror)
-    client._mc_query("703125407,703125412,67586143", ["efetch_seq"])
+    assert client._mc_query("703125407,703125412,67586143", ["efetch_seq"]) == ""
     assert "NCBI request failed: 703125407,703125412,67586143\nHTTP Error 101: Fake HTTPError from Mock\n//" \
            in client.http_errors_file.read()
 
@@ -523,20 +515,14 @@ def test_ncbiclient_fetch_summaries(hf, monkeypatch):
         if kwargs["func_args"] == ["esummary_seq"]:
             test_file = "%s/mock_resources/test_databasebuddy_clients/Entrez_esummary_seq.xml" % hf.resource_path
             with open(test_file, "r") as ifile:
-                client.results_file.write(ifile.read().strip())
-                client.results_file.write('\n### END ###\n')
+                return ifile.read()
         elif kwargs["func_args"] == ["esummary_taxa"]:
             test_file = "%s/mock_resources/test_databasebuddy_clients/Entrez_esummary_taxa.xml" % hf.resource_path
             with open(test_file, "r") as ifile:
-                client.results_file.write(ifile.read().strip())
-                client.results_file.write('\n### END ###\n')
+                return ifile.read()
         elif kwargs["func_args"] == ["efetch_gi"]:
-            client.results_file.write("""703125407
-703125412
-67586143
-### END ###
-""")
-        return
+            return "703125407\n703125412\n67586143\n"
+        return ""
 
     # No records to fetch
     dbbuddy = Db.DbBuddy()
@@ -560,7 +546,7 @@ def test_ncbiclient_fetch_sequences(hf, monkeypatch, capsys):
         test_file = "{0}mock_resources{1}test_databasebuddy_clients" \
                     "{1}Entrez_efetch_seq.gb".format(hf.resource_path, os.path.sep)
         with open(test_file, "r") as ifile:
-            client.results_file.write(ifile.read())
+            return ifile.read()
 
     # Empty DbBuddy
     dbbuddy = Db.DbBuddy()
@@ -201,7 +201,7 @@ def test_raxml(alb_resources, hf, monkeypatch):
     if os.name == "nt":
         assert hf.string2hash(kept_output) == "7f2fdfe55dbe805bd994f3f56c79bb1b"
     else:
-        assert hf.string2hash(kept_output) == "393353fb47861460aecaefa69a6ec55c"
+        assert hf.string2hash(kept_output) == "4f76b2e4b98c6683a645823f64075cbd"
 
     # multi-run
     os.remove("%s%sRAxML_bestTree.result" % (mock_tmp_dir.path, os.path.sep))
@@ -316,7 +316,7 @@ def test_fasttree(alb_resources, hf, monkeypatch):
     if os.name == "nt":
         assert hf.string2hash(kept_output) == "bcd034f0db63a7b41f4b3b6661200ef3"
     else:
-        assert hf.string2hash(kept_output) == "10df99cd1696b002f841aa18b78477ca"
+        assert hf.string2hash(kept_output) == "6d909f5672986173f5d6e1b7fd28804e"
 
 
 def test_generate_tree_edges(alb_resources, monkeypatch):
@@ -7,6 +7,7 @@ from Bio.SeqFeature import FeatureLocation, CompoundLocation
 from Bio.Seq import Seq
 from unittest import mock
 import os
+import re
 import urllib.request
 import suds.client
 import shutil
@@ -200,9 +201,54 @@ def test_back_translate_bad_organism(sb_resources):
 
 
 # ######################  '-bl2s', '--bl2seq' ###################### #
-# ToDo: Mock output data
-def test_bl2seq():
-    pass
+def test_bl2seq(sb_resources, monkeypatch):
+    commands = []
+
+    class MockPopen(object):
+        def __init__(self, command, **kwargs):
+            commands.append(command)
+            self.output = ""
+            self.error = ""
+            self.returncode = 0
+            if fail_on and command.startswith(fail_on):
+                self.error = "BLAST Database error: Something went wrong"
+                self.returncode = 1
+            elif command.startswith("blastp"):
+                query_file = re.search("-query ([^ ]+)", command).group(1)
+                with open(query_file, "r", encoding="utf-8") as ifile:
+                    queries = re.findall(">(s[0-9]+)", ifile.read())
+                for query in queries:
+                    for subj in ["s0", "s1", "s2"]:
+                        if subj == "s1" and query == "s2":
+                            continue  # No hit
+                        # Best HSP first, then a weaker one that should be ignored
+                        self.output += "%s\t%s\t90.0\t100\t1\t0\t1\t100\t1\t100\t0.0\t300\n" % (query, subj)
+                        self.output += "%s\t%s\t50.0\t20\t1\t0\t1\t20\t1\t20\t1e-5\t40\n" % (query, subj)
+
+        def communicate(self):
+            return self.output.encode("utf-8"), self.error.encode("utf-8")
+
+    fail_on = None
+    monkeypatch.setattr(Sb, "Popen", MockPopen)
+    monkeypatch.setattr(Sb, "_check_for_blast_bin", lambda *_: True)
+    monkeypatch.setattr(br, "usable_cpu_count", lambda *_: 2)
+
+    tester = Sb.pull_recs(sb_resources.get_one("p f"), "α1[02]")
+    output = Sb.bl2seq(tester)
+    assert commands[0].startswith("makeblastdb -dbtype prot")
+    assert len(commands) == 3  # makeblastdb, then one search per core
+    assert list(output.keys()) == ['Mle-Panxα10A', 'Mle-Panxα10B', 'Mle-Panxα12']
+    assert output['Mle-Panxα12']['Mle-Panxα10B'] == [90.0, 100, 1e-180, 300.0]
+    assert output['Mle-Panxα10B']['Mle-Panxα12'] == [90.0, 100, 1e-180, 300.0]
+    assert output['Mle-Panxα10A']['Mle-Panxα10B'] == [0.0, 0, 0.0, 0.0]
+    assert 'Mle-Panxα10A' not in output['Mle-Panxα10A']
+
+    # A failure in either step must not be reported as a lack of hits
+    for fail_on in ["makeblastdb", "blastp"]:
+        with pytest.raises(RuntimeError) as e:
+            Sb.bl2seq(Sb.pull_recs(sb_resources.get_one("p f"), "α1[02]"))
+        assert "%s failed" % fail_on in str(e)
+        assert "BLAST Database error: Something went wrong" in str(e)
 
 
 def test_bl2_no_binary(sb_resources):
@@ -226,6 +272,37 @@ def test_blastp():
     pass
 
 
+# ######################  '-cdh', '--cd_hit' ###################### #
+def test_cd_hit(sb_resources):
+    tester = Sb.SeqBuddy(">a\nMKVLAAGIVALLLAAGCSSSKEETPAPAEAPKAEAPAAAPAEEK\n>b\nMKVLAAGIVALLLAAGCSSSKEETPAPAEAPKAEAPAAAP\n"
+                         ">c\nMKVLAAGIVGLLLAAGCSSSKEETPAPAEAPKAEAP\n>d\nWWWWHHHHYYYYPPPP", in_format="fasta")
+    Sb.cd_hit(tester, 0.95)
+    assert [rec.id for rec in tester.records] == ["a", "d"]
+    assert tester.records[0].buddy_data["cluster"] == ["b", "c"]
+    assert tester.records[1].buddy_data["cluster"] is None
+
+    tester = Sb.cd_hit(sb_resources.get_one("p f"), 0.5)
+    assert [rec.id for rec in tester.records] == ['Mle-Panxα7A', 'Mle-Panxα8', 'Mle-Panxα1', 'Mle-Panxα2', 'Mle-Panxα5',
+                                                 'Mle-Panxα4', 'Mle-Panxα3', 'Mle-Panxα6', 'Mle-Panxα11', 'Mle-Panxα10A']
+    assert tester.records[7].buddy_data["cluster"] == ['Mle-Panxα12']
+    assert tester.records[9].buddy_data["cluster"] == ['Mle-Panxα9', 'Mle-Panxα10B']
+
+    tester = Sb.cd_hit(sb_resources.get_one("d f"))
+    assert len(tester.records) == 13
+
+    with pytest.raises(ValueError) as e:
+        Sb.cd_hit(tester, 1.5)
+    assert "The identity threshold must be between 0 and 1." in str(e)
+
+    with pytest.raises(ValueError) as e:
+        Sb.cd_hit(tester, word_size=0)
+    assert "The word size must be a positive integer." in str(e)
+
+    with pytest.raises(ValueError) as e:
+        Sb.cd_hit(tester, band_width=-1)
+    assert "The band width can not be negative." in str(e)
+
+
 # ######################  '-cs', '--clean_seq'  ###################### #
 def test_clean_seq_prot(sb_resources, hf):
     # Protein
@@ -478,6 +555,14 @@ def test_delete_records2(sb_resources, hf):
         Sb.delete_records(sb_resources.get_one("d f"), dict)
     assert "'patterns' must be a list or a string." in str(e.value)
 
+    tester = Sb.delete_records(sb_resources.get_one("d f"), ['Mle-Panxα1', 'Mle-Panxα2'], exact=True)
+    assert len(tester.records) == 11
+    assert "Mle-Panxα1" not in tester.id_index() and "Mle-Panxα10A" in tester.id_index()
+
+    tester = Sb.delete_records(sb_resources.get_one("d f"), '^Mle-Panxα1')
+    assert [rec.id for rec in tester.records] == ['Mle-Panxα9', 'Mle-Panxα7A', 'Mle-Panxα3', 'Mle-Panxα4',
+                                                  'Mle-Panxα8', 'Mle-Panxα6', 'Mle-Panxα5', 'Mle-Panxα2']
+
 
 # #####################  '-drp', '--delete_repeats' ###################### ##
 def test_delete_repeats(sb_odd_resources):
@@ -654,7 +739,17 @@ def test_extract_regions_edges(sb_resources):
 def test_find_cpg(sb_resources, hf):
     tester = sb_resources.get_one("d g")
     tester = Sb.find_cpg(tester)
-    assert hf.buddy2hash(tester) == "9499f524da0c35a60502031e94864928"
+    assert hf.buddy2hash(tester) == "265e1ccfc3f94cf246c2175c81700812"
+
+    tester = Sb.find_cpg(sb_resources.get_one("d g"), window_size=100, oe_threshold=.7, gc_threshold=.6)
+    assert hf.buddy2hash(tester) == "51abc8cfc68fbec9d76fe2d33dc2961a"
+
+    tester = Sb.find_cpg(Sb.SeqBuddy(">seq1\nCGCGCGCGATATCGCG\n", in_format="fasta"), window_size=4)
+    assert tester.records[0].buddy_data["cpgs"] == [(0, 8), (12, 16)]
+
+    with pytest.raises(ValueError) as err:
+        Sb.find_cpg(sb_resources.get_one("d g"), window_size=0)
+    assert "The window size must be a positive integer." in str(err)
 
 
 # #####################  '-orf', '--find_orf' ###################### ##
@@ -688,6 +783,32 @@ def test_find_orf(sb_resources, hf):
     assert "Nucleic acid sequence required, not protein." in str(err)
 
 
+def test_find_orf_modes():
+    tester = Sb.SeqBuddy(">seq1\nATGATGAAATAGCCATGCCCTGACTACAT\n", in_format="fasta")
+    Sb.find_orfs(tester)
+    assert tester.records[0].buddy_data["find_orfs"] == {"+": [(0, 12), (14, 23)], "-": [(23, 29)]}
+    assert [(int(feat.location.start), int(feat.location.end), feat.strand) for feat in tester.records[0].features] \
+        == [(0, 12, 1), (14, 23, 1), (23, 29, -1)]
+
+    tester = Sb.SeqBuddy(">seq1\nATGATGAAATAGCCATGCCCTGACTACAT\n", in_format="fasta")
+    Sb.find_orfs(tester, mode="nested", include_feature=False)
+    assert tester.records[0].buddy_data["find_orfs"]["+"] == [(0, 12), (3, 12), (14, 23)]
+    assert not tester.records[0].features
+
+    tester = Sb.SeqBuddy(">seq1\nATGATGAAATAGCCATGCCCTGACTACAT\n", in_format="fasta")
+    Sb.find_orfs(tester, mode="longest", min_length=10)
+    assert tester.records[0].buddy_data["find_orfs"]["+"] == [(0, 12)]
+
+    tester = Sb.SeqBuddy(">seq1\nCTACTTCATCAT\n", in_format="fasta")
+    Sb.find_orfs(tester)
+    assert tester.records[0].buddy_data["find_orfs"] == {"+": [], "-": [(0, 12)]}
+    assert tester.records[0].features[0].strand == -1
+
+    with pytest.raises(ValueError) as err:
+        Sb.find_orfs(tester, mode="foo")
+    assert "find_orfs mode must be 'scan', 'longest', or 'nested', not 'foo'." in str(err)
+
+
 # #####################  '-fp', '--find_pattern' ###################### ##
 def test_find_pattern(sb_resources, hf):
     tester = Sb.find_pattern(sb_resources.get_one("d g"), "ATGGT")
@@ -719,6 +840,11 @@ def test_find_repeats(sb_odd_resources):
     for key in tester.repeat_seqs:
         assert 'Seq12' in tester.repeat_seqs[key] or 'Seq10A' in tester.repeat_seqs[key]
 
+    # Records are indexed in place, not copied
+    assert tester.unique_seqs['Seq1'] is tester.records[0]
+    for rec in tester.repeat_ids['Seq12']:
+        assert [rec is next_rec for next_rec in tester.records].count(True) == 1
+
 
 # ######################  '-frs', '--find_restriction_sites' ###################### #
 def test_restriction_sites_no_args(sb_resources, hf):
@@ -759,6 +885,14 @@ def test_restriction_sites_limit_cuts(capsys, sb_resources, hf):
     assert "Warning: No-cutters not supported." in err
 
 
+def test_restriction_sites_max_processes(sb_resources, hf):
+    # Records split across worker processes come back exactly as a serial run
+    serial = Sb.find_restriction_sites(sb_resources.get_one("d g"), enzyme_group=["all"])
+    tester = Sb.find_restriction_sites(sb_resources.get_one("d g"), enzyme_group=["all"], max_processes=3)
+    assert hf.buddy2hash(tester) == hf.buddy2hash(serial)
+    assert str(tester.restriction_sites) == str(serial.restriction_sites)
+
+
 # ######################  '-hsi', '--hash_sequence_ids' ###################### #
 def test_hash_seq_ids(sb_resources):
     tester = sb_resources.get_one("d f")
@@ -1212,25 +1346,20 @@ def test_prosite_scan_mc_run_prosite(sb_resources, hf, monkeypatch):
 
     monkeypatch.setattr(Sb.PrositeScan, "_rest_request", mock_rest_request)
     monkeypatch.setattr(Sb.time, "sleep", lambda _: True)
-    out_file = br.TempFile()
     seqbuddy = sb_resources.get_one("d f")
     Sb.pull_recs(seqbuddy, "Mle-Panxα10B")
     ps_scan = Sb.PrositeScan(seqbuddy)
-    ps_scan._mc_run_prosite(seqbuddy.records[0], [out_file.path, Sb.Lock()])
-    with open(out_file.path, "r", encoding="utf-8") as ifile:
-        output = ifile.read()
+    rec = ps_scan._mc_run_prosite(seqbuddy.records[0])
+    output = "%s\n" % str(Sb.SeqBuddy([rec], out_format="gb"))
     assert hf.string2hash(output) == "7ced43edaee481ac149d6ece152c4621"
 
 
 def test_prosite_scan_run(sb_resources, hf, monkeypatch):
-    def mock_mc_run_prosite(self, _rec, args):
+    def mock_mc_run_prosite(self, _rec):
         print(self)
-        out_file_path, lock = args
         temp_seq = Sb.SeqBuddy([_rec], out_format="gb")
         Sb.annotate(temp_seq, "Foo", "1-100")
-        with lock:
-            with open(out_file_path, "a") as out_file:
-                out_file.write("%s\n" % str(temp_seq))
+        return temp_seq.records[0]
 
     monkeypatch.setattr(Sb.PrositeScan, "_mc_run_prosite", mock_mc_run_prosite)
     seqbuddy = sb_resources.get_one("d g")
@@ -1287,6 +1416,22 @@ def test_pull_recs(key, next_hash, sb_resources, hf):
     tester = Sb.pull_recs(sb_resources.get_one(key), 'α2')
     assert hf.buddy2hash(tester) == next_hash
 
+
+def test_pull_recs2(sb_resources):
+    # Literal IDs come back in file order, and partial IDs don't match
+    tester = Sb.pull_recs(sb_resources.get_one("d f"), ['Mle-Panxα2', 'Mle-Panxα1', 'α10A'], exact=True)
+    assert [rec.id for rec in tester.records] == ['Mle-Panxα1', 'Mle-Panxα2']
+
+    # Anchored prefixes go through the index, and must agree with the regex search
+    tester = Sb.pull_recs(sb_resources.get_one("d f"), ['^Mle-Panxα1', '^Mle-Panxα7'])
+    assert [rec.id for rec in tester.records] == ['Mle-Panxα7A', 'Mle-Panxα1', 'Mle-Panxα12', 'Mle-Panxα11',
+                                                  'Mle-Panxα10B', 'Mle-Panxα10A']
+    regex_tester = Sb.pull_recs(sb_resources.get_one("d f"), ['^Mle-Panxα1.*', '^Mle-Panxα7.*'])
+    assert [rec.id for rec in tester.records] == [rec.id for rec in regex_tester.records]
+
+    tester = Sb.pull_recs(sb_resources.get_one("d f"), '*')
+    assert len(tester.records) == 13
+
 # ######################  '-pr', '--pull_records_with_feature' ###################### #
 hashes = [('p g', '83d15851d489e89761c8faa31e5263f2'), ('d g', '36757409966ede91ab19deb56045d584')]
 
@@ -1308,9 +1453,23 @@ def test_purge(sb_resources, hf, monkeypatch):
                                  ('Mle-Panxα12', OrderedDict([('Mle-Panxα10A', [56.28, 398, 5e-171, 478.0]),
                                                               ('Mle-Panxα10B', [47.51, 381, 2e-128, 366.0])]))])
     monkeypatch.setattr(Sb, "bl2seq", lambda *_: bl2seq_output)
-    Sb.purge(tester, 200)
+    Sb.purge(tester, 200, engine="blast")
     assert hf.buddy2hash(tester) == '256681ed87c67f8f3a8c5771572767f1'
 
+    tester = Sb.pull_recs(sb_resources.get_one("p f"), "α1[02]")
+    Sb.purge(tester, 400, engine="native")
+    assert [rec.id for rec in tester.records] == ['Mle-Panxα12', 'Mle-Panxα10A']
+    assert tester.records[1].buddy_data["purge_set"] == ['Mle-Panxα10B']
+
+    tester = Sb.pull_recs(sb_resources.get_one("p f"), "α1[02]")
+    monkeypatch.setattr(Sb, "which", lambda *_: None)
+    Sb.purge(tester, 400)
+    assert [rec.id for rec in tester.records] == ['Mle-Panxα12', 'Mle-Panxα10A']
+
+    with pytest.raises(ValueError) as e:
+        Sb.purge(tester, 400, engine="foo")
+    assert "The purge engine must be one of" in str(e)
+
 
 # ######################  '-ri', '--rename_ids' ###################### #
 hashes = [('d f', '8b4a9e3d3bb58cf8530ee18b9df67ff1'), ('d g', '78c73f97117bd937fd5cf52f4bd6c26e'),
@@ -1432,6 +1591,35 @@ def test_shuffle_seqs(key, next_hash, sb_resources, hf):
     assert hf.buddy2hash(tester) == next_hash
 
 
+# #####################  'sim_ident' ###################### ##
+def test_sim_ident(sb_resources):
+    tester = Sb.pull_recs(sb_resources.get_one("p f"), "α1[02]")
+    output = Sb.sim_ident(tester)
+    assert list(output.keys()) == ['Mle-Panxα10A', 'Mle-Panxα10B', 'Mle-Panxα12']
+    assert output['Mle-Panxα10A'] == OrderedDict([('Mle-Panxα10B', [100.0, 65.46, 470.7]),
+                                                  ('Mle-Panxα12', [55.73, 75.93, 387.5])])
+    assert output['Mle-Panxα12']['Mle-Panxα10B'] == output['Mle-Panxα10B']['Mle-Panxα12'] == [54.82, 63.51, 268.9]
+
+    # Nothing gets through a prefilter this strict
+    output = Sb.sim_ident(tester, kmer_size=500)
+    assert list(output.values()) == [OrderedDict()] * 3
+
+    # Serial and process pool runs agree
+    tester = sb_resources.get_one("p f")
+    assert Sb.sim_ident(tester, max_processes=1) == Sb.sim_ident(tester, max_processes=2)
+
+    output = Sb.sim_ident(Sb.pull_recs(sb_resources.get_one("d f"), "α1[02]"))
+    assert output['Mle-Panxα10A']['Mle-Panxα10B'] == [100.0, 65.65, 1276.3]
+
+    with pytest.raises(ValueError) as e:
+        Sb.sim_ident(tester, kmer_size=0)
+    assert "The k-mer size must be a positive integer." in str(e)
+
+    with pytest.raises(ValueError) as e:
+        Sb.sim_ident(tester, band_width=-1)
+    assert "The band width can not be negative." in str(e)
+
+
 # #####################  make_groups' ###################### ##
 def test_make_groups(sb_odd_resources):
     tester = Sb.SeqBuddy(sb_odd_resources["cnidaria_pep"])
@@ -1640,7 +1828,7 @@ def test_transmembrane_domains_pep(sb_resources, hf, monkeypatch, capsys):
     _root, dirs, files = next(br.walklevel(keep_dir.path))
 
     assert sorted(dirs) == ['rst_MFhyxO', 'rst_lE27A5']
-    assert sorted(files) == sorted(['seqs.tmp', os.path.split(work_dir.path)[-1]])
+    assert sorted(files) == [os.path.split(work_dir.path)[-1]]
 
     with pytest.raises(FileNotFoundError) as err:
         Sb.transmembrane_domains(tester, job_ids=["rst_BLAHHH!!"])
@@ -3,8 +3,16 @@
 """ tests basic functionality of SeqBuddy class """
 import pytest
 from Bio.Alphabet import IUPAC
+from Bio.Seq import Seq
+from Bio.Restriction import RestrictionBatch, Analysis
 from collections import OrderedDict
 import os
+import shutil
+from random import Random
+import re
+from io import StringIO
+from hashlib import md5
+import numpy as np
 import buddy_resources as br
 import SeqBuddy as Sb
 
@@ -71,6 +79,21 @@ def test_to_dict(sb_resources, hf):
         tester.to_dict()
 
 
+def test_id_index(sb_resources):
+    tester = sb_resources.get_one("d f")
+    index = tester.id_index()
+    assert "Mle-Panxα1" in index
+    assert "Mle-Panxα13" not in index
+    assert index.exact(["Mle-Panxα2", "Mle-Panxα1", "foo"]) == [2, 11]
+    assert index.prefix("Mle-Panxα1") == [2, 4, 5, 9, 12]
+    assert index.prefix("Mle-Panxα10") == [9, 12]
+    assert index.prefix("foo") == []
+
+    tester.records[0].name = "foo"
+    assert tester.id_index().exact(["foo"]) == [0]
+    assert tester.id_index(names=False).exact(["foo"]) == []
+
+
 def test_to_string(sb_resources, hf, capsys):
     tester = sb_resources.get_one("d f")
     assert hf.string2hash(str(tester)) == "b831e901d8b6b1ba52bad797bad92d14"
@@ -128,6 +151,15 @@ def test_write(sb_resources, hf):
     with open("%s/sequences.fa" % temp_dir.path, encoding="utf-8") as ifile:
         assert hf.string2hash(ifile.read()) == "25073539df4a982b7f99c72dd280bb8f"
 
+    handle = StringIO()
+    tester.write(handle, out_format="fasta")
+    assert hf.string2hash(handle.getvalue()) == "25073539df4a982b7f99c72dd280bb8f"
+    assert tester.out_format == "gb"
+
+    handle = StringIO()
+    tester.write(handle, out_format="raw")
+    assert handle.getvalue() == str(Sb.SeqBuddy(tester.records, out_format="raw"))
+
 
 def test_print_hashmap(sb_resources, hf):
     tester = sb_resources.get_one("d f")
@@ -148,8 +180,205 @@ def test_reverse_hashmap(sb_resources):
     assert tester_str == str(tester)
 
 
+# ##################### SeqBuddyStream ###################### ##
+def test_stream_iter(sb_resources):
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("d g", mode="paths"))
+    assert tester.in_format == "gb"
+    assert tester.out_format == "gb"
+    chunks = [seqbuddy for seqbuddy in tester]
+    assert len(chunks) == 13
+    assert [len(seqbuddy) for seqbuddy in chunks] == [1] * 13
+    assert [seqbuddy.alpha for seqbuddy in chunks] == [IUPAC.ambiguous_dna] * 13
+
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("p f", mode="paths"), chunk_size=5, alpha_sample=2)
+    assert [len(seqbuddy) for seqbuddy in tester] == [5, 5, 3]
+    assert [seqbuddy.alpha for seqbuddy in tester] == [IUPAC.protein] * 3
+
+    with open(sb_resources.get_one("d f", mode="paths"), "r", encoding="utf-8") as ifile:
+        tester = Sb.SeqBuddyStream(ifile, alpha="rna")
+        assert [seqbuddy.alpha for seqbuddy in tester] == [IUPAC.ambiguous_rna] * 13
+
+
+def test_stream_write(sb_resources, hf):
+    temp_file = br.TempFile()
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("d g", mode="paths"), out_format="fasta")
+    assert tester.apply(Sb.uppercase).write(temp_file.path) == 13
+    assert hf.string2hash(temp_file.read()) == "25073539df4a982b7f99c72dd280bb8f"
+
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("d f", mode="paths"))
+    tester.apply(Sb.pull_recs, "α[2-4]").apply(Sb.translate_cds)
+    with open(temp_file.path, "w", encoding="utf-8") as ofile:
+        assert tester.write(ofile) == 3
+    control = Sb.translate_cds(Sb.pull_recs(sb_resources.get_one("d f"), "α[2-4]"))
+    assert temp_file.read() == str(control)
+
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("d f", mode="paths"))
+    tester.apply(Sb.pull_recs, "α[2-4]")
+    tester.write(temp_file.path, out_format="raw")
+    control = Sb.pull_recs(sb_resources.get_one("d f"), "α[2-4]")
+    control.out_format = "raw"
+    assert temp_file.read() == str(control)
+
+
+def test_stream_errors(sb_resources, sb_odd_resources):
+    with pytest.raises(ValueError) as err:
+        Sb.SeqBuddyStream(sb_resources.get_one("d n", mode="paths"))
+    assert "The 'nexus' format can not be streamed" in str(err)
+
+    with pytest.raises(ValueError) as err:
+        Sb.SeqBuddyStream(sb_resources.get_one("d f", mode="paths"), out_format="phylip")
+    assert "The 'phylip' format can not be streamed" in str(err)
+
+    with pytest.raises(br.GuessError):
+        Sb.SeqBuddyStream(sb_odd_resources["gibberish"])
+
+    with pytest.raises(TypeError):
+        Sb.SeqBuddyStream(sb_resources.get_one("d f"))
+
+
+# ##################### SeqBuddyIndex ###################### ##
+def _index_copy(tmp_dir, path):
+    # The index is written beside the sequence file, so keep it out of the resources directory
+    new_path = os.path.join(tmp_dir.path, os.path.basename(path))
+    shutil.copy(path, new_path)
+    return new_path
+
+
+def test_seqbuddy_index_records(sb_resources):
+    tmp_dir = br.TempDir()
+    for code in ["d f", "d g", "d e", "p f", "p g"]:
+        path = _index_copy(tmp_dir, sb_resources.get_one(code, mode="paths"))
+        tester = Sb.SeqBuddyIndex(path)
+        assert tester.in_format == sb_resources.get_one(code).in_format
+        assert len(tester) == 13
+        assert os.path.isfile("%s.sbi" % path)
+
+        for regex, exact in [("α[2-4]", False), (["Mle-Panxα1", "Mle-Panxα9", "foo"], True), ("^Mle-Panxα1", False),
+                             (["^Mle-Panxα1", "^Mle-Panxα5"], False), ("*", False), ("^", False), ("foo", False)]:
+            control = Sb.pull_recs(sb_resources.get_one(code), regex, exact=exact)
+            assert str(tester.pull_recs(regex, exact)) == str(control)
+
+        for amount in [10, -10, 0, 100000]:
+            assert str(tester.pull_record_ends(amount)) == str(Sb.pull_record_ends(sb_resources.get_one(code), amount))
+
+        for rec in sb_resources.get_one(code).records:
+            for start, end in [(None, None), (5, 130), (59, 61), (-20, None), (100, 10)]:
+                assert tester.fetch(rec.id, start, end) == str(rec.seq)[start:end]
+
+    with pytest.raises(KeyError) as err:
+        tester.fetch("foo")
+    assert "'foo' is not in the index" in str(err)
+
+
+def test_index_ragged_lines():
+    tmp_dir = br.TempDir()
+    rand_gen = Random(7)
+    seqs = ["".join([rand_gen.choice("ACGT") for _ in range(rand_gen.randint(0, 150))]) for _ in range(30)]
+    fasta = tmp_dir.subfile("ragged.fa")
+    fastq = tmp_dir.subfile("ragged.fq")
+    with open(fasta, "w", encoding="utf-8") as ofile, open(fastq, "w", encoding="utf-8") as fq_file:
+        ofile.write("Text before the first record is ignored\n")
+        for indx, seq in enumerate(seqs):
+            width = [60, 17, 1000][indx % 3]
+            lines = [seq[i:i + width] for i in range(0, len(seq), width)]
+            if indx % 5 == 1:  # Uneven line lengths
+                lines = [seq[i:i + rand_gen.randint(1, 70)] for i in range(0, len(seq), 50)]
+            elif indx % 5 == 2:  # Internal spaces
+                lines = [line.replace("A", "A ") for line in lines]
+            elif indx % 5 == 3:  # Trailing blank lines
+                lines += ["", ""]
+            elif indx % 5 == 4:  # Windows line endings
+                lines = ["%s\r" % line for line in lines]
+            ofile.write(">seq%s desc\n%s" % (indx, "".join(["%s\n" % line for line in lines])))
+            # Quality lines that start with '@' mustn't be mistaken for new records
+            qual = "".join([rand_gen.choice("@I#5") for _ in seq])
+            fq_file.write("@read%s desc\n%s+\n%s" % (indx, "".join(["%s\n" % seq[i:i + width] for i in
+                                                                      range(0, len(seq), width)]),
+                                                       "".join(["%s\n" % qual[i:i + width] for i in
+                                                                range(0, len(qual), width)])))
+
+    for path in [fasta, fastq]:
+        tester = Sb.SeqBuddyIndex(path)
+        control = Sb.SeqBuddy(path)
+        assert len(tester) == 30
+        assert str(tester.pull_recs("[13]$")) == str(Sb.pull_recs(Sb.SeqBuddy(path), "[13]$"))
+        for rec in control.records:
+            for start, end in [(None, None), (5, 130), (59, 61), (-20, None), (0, 1)]:
+                assert tester.fetch(rec.id, start, end) == str(rec.seq)[start:end]
+    assert str(Sb.SeqBuddyIndex(fasta).pull_record_ends(-25)) == str(Sb.pull_record_ends(Sb.SeqBuddy(fasta), -25))
+
+
+def test_index_rebuild(sb_resources):
+    tmp_dir = br.TempDir()
+    path = _index_copy(tmp_dir, sb_resources.get_one("d f", mode="paths"))
+    tester = Sb.SeqBuddyIndex(path)
+    assert len(tester) == 13
+
+    # A fresh index is reused as is, including its record of the file format
+    tester = Sb.SeqBuddyIndex(path)
+    assert tester._db is not None
+    assert tester.in_format == "fasta"
+
+    with open(path, "a", encoding="utf-8") as ofile:
+        ofile.write(">new_rec\nATGCATGC\n")
+    tester = Sb.SeqBuddyIndex(path)
+    assert tester._db is None
+    assert len(tester) == 14
+    assert tester.fetch("new_rec", 2, 6) == "GCAT"
+
+    with open("%s.sbi" % path, "w", encoding="utf-8") as ofile:
+        ofile.write("Not an index")
+    assert len(Sb.SeqBuddyIndex(path)) == 14
+
+    # Fall back on an in-memory index if it can't be saved
+    tester = Sb.SeqBuddyIndex(path, index_path=os.path.join(tmp_dir.path, "missing_dir", "foo.sbi"))
+    assert len(tester) == 14
+    assert not os.path.exists(os.path.join(tmp_dir.path, "missing_dir"))
+
+
+def test_index_errors(sb_resources, sb_odd_resources):
+    tmp_dir = br.TempDir()
+    with pytest.raises(ValueError) as err:
+        Sb.SeqBuddyIndex(_index_copy(tmp_dir, sb_resources.get_one("d n", mode="paths")))
+    assert "The 'nexus' format can not be indexed" in str(err)
+
+    with pytest.raises(br.GuessError):
+        Sb.SeqBuddyIndex(_index_copy(tmp_dir, sb_odd_resources["gibberish"]))
+
+    with pytest.raises(TypeError):
+        Sb.SeqBuddyIndex(sb_resources.get_one("d f"))
+
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("d f", mode="paths"))
+    with pytest.raises(ValueError) as err:
+        tester.apply(Sb.order_ids)
+    assert "order_ids() needs to see all records at once" in str(err)
+
+
 # ################################################# HELPER FUNCTIONS ################################################# #
-# ToDo: Missing tests for --> _add_buddy_data, FeatureReMapper
+# ToDo: Missing tests for --> _add_buddy_data
+# ######################  'FeatureReMapper' ###################### #
+def test_feature_remapper(sb_resources):
+    rec = sb_resources.get_one("d g").records[0]
+    remapper = Sb.FeatureReMapper(rec)
+    remapper.extend(False)
+    remapper.extend_many([True] * (len(rec.seq) - 1))
+    with pytest.raises(AttributeError) as err:
+        remapper.extend(True)
+    assert "The position map has already been fully populated." in str(err)
+    assert remapper.position_map[0] == (0, False)
+    assert remapper.position_map[-1] == (len(rec.seq) - 2, True)
+
+    new_rec = remapper.remap_features(rec[1:])
+    assert str(new_rec.features[0].location) == "order{[0:44](+), [44:197](+), [197:321](+), [321:493](+), " \
+                                                "[493:846](+), [846:1202](+)}"
+    assert str(new_rec.features[-1].location) == "[899:992](+)"
+
+    remapper = Sb.FeatureReMapper(rec)
+    with pytest.raises(AttributeError) as err:
+        remapper.remap_features(rec)
+    assert "The position map has not been fully populated." in str(err)
+
+
 # ######################  '_check_for_blast_bin' ###################### #
 def test_check_blast_bin(monkeypatch, capsys):
     monkeypatch.setattr(Sb, "which", lambda *_: True)
@@ -161,6 +390,45 @@ def test_check_blast_bin(monkeypatch, capsys):
     assert "blastn binary not found. Please install BLAST+ executables.\n" in err
 
 
+# ######################  '_codon_indices' / '_translate_codons' ###################### #
+def test_codon_kernel():
+    assert Sb._codon_indices("ATGc-g?").tolist() == [0 * 36 + 3 * 6 + 2, 1 * 36 + 4 * 6 + 2]
+    assert Sb._translate_codons("ATGaaa---A--A-ANNNTAGxx") == "MK--NN*"
+    matrix = np.frombuffer(b"ATG...TTTAAC---TGA", dtype=np.uint8).reshape(2, -1)
+    assert Sb._translate_codons(matrix, gap_chars="-.") == ["M-F", "N-*"]
+
+    codons, codon_map, counts = Sb._unique_codons("ATGATGccc-ATAT")
+    assert codons == ["ATG", "ccc", "-AT"]
+    assert codon_map.tolist() == [0, 0, 1, 2]
+    assert counts == [2, 1, 1]
+    assert Sb._unique_codons("AT")[0] == []
+
+
+# ######################  '_orf_spans' ###################### #
+def test_orf_spans():
+    seq = "aaATGATGAAATAGATGuuucccugauga"
+    assert Sb._orf_spans(seq) == [(2, 14), (14, 26)]
+    assert Sb._orf_spans(seq, mode="nested") == [(2, 14), (5, 14), (14, 26)]
+    assert Sb._orf_spans(seq, mode="longest") == [(2, 14), (14, 26)]
+    assert Sb._orf_spans(seq, min_length=12, mode="nested") == [(2, 14), (14, 26)]
+    assert Sb._orf_spans("ATGCCC" * 100) == []
+    assert Sb._orf_spans("AT") == []
+
+
+# ######################  '_composition' ###################### #
+def test_composition():
+    tester = Sb.SeqBuddy(">Seq1\nACgta-A\n", in_format="fasta")
+    rec = tester.records[0]
+    composition = Sb._composition(rec)
+    assert composition == {"-": 1, "A": 2, "C": 1, "a": 1, "g": 1, "t": 1}
+    assert Sb._upper_composition(composition) == {"-": 1, "A": 3, "C": 1, "G": 1, "T": 1}
+    assert Sb._composition(rec) is composition
+
+    Sb.uppercase(tester)
+    assert Sb._composition(rec) is not composition
+    assert Sb._composition(rec) == {"-": 1, "A": 3, "C": 1, "G": 1, "T": 1}
+
+
 # ######################  '_feature_rc' ###################### #
 def test_feature_rc(sb_resources, hf):
     tester = sb_resources.get_one("d g")
@@ -234,7 +502,7 @@ def test_guess_phylipss(hf):
     assert Sb._guess_format(seqbuddy) == "phylipss"
 
 
-def test_guess_format(sb_resources, sb_odd_resources):
+def test_guess_format(sb_resources, sb_odd_resources, hf):
     assert Sb._guess_format(["foo", "bar"]) == "gb"
     assert Sb._guess_format(sb_resources.get_one("d f")) == "fasta"
     assert Sb._guess_format(sb_resources.get_one("d f", mode="paths")) == "fasta"
@@ -257,6 +525,17 @@ def test_guess_format(sb_resources, sb_odd_resources):
 
     assert not Sb._guess_format(temp_file.path)
 
+    # Alignment formats bigger than the sniffed sample are parsed in full, not cut off mid-block
+    nexus_path = "%s%sduplicate_alignment.nex" % (hf.resource_path, os.path.sep)
+    assert os.path.getsize(nexus_path) > br.SNIFF_SIZE
+    assert Sb._guess_format(nexus_path) == "nexus"
+
+    temp_file = br.TempFile()
+    temp_file.write("CLUSTAL W (1.83) multiple sequence alignment\n\n\n" +
+                    "seq1    %s\nseq2    %s\n\n" % ("ACGT" * 15, "ACGA" * 15) * 1200)
+    assert os.path.getsize(temp_file.path) > br.SNIFF_SIZE
+    assert Sb._guess_format(temp_file.path) == "clustal"
+
 
 # ######################  'GuessError' ###################### #
 def test_guesserror_raw_seq():
@@ -285,8 +564,140 @@ def test_no__input():
         Sb.SeqBuddy()
 
 
+# ######################  '_index_records' ###################### #
+def test_index_records(sb_odd_resources):
+    tester = Sb.SeqBuddy(sb_odd_resources["duplicate"])
+    id_index, seq_digests = Sb._index_records(tester.records)
+    assert len(seq_digests) == len(tester.records)
+    assert sum([len(positions) for positions in id_index.values()]) == len(tester.records)
+    for rec_id, positions in id_index.items():
+        assert [tester.records[pos].id for pos in positions] == [rec_id] * len(positions)
+    assert len(id_index["Seq12"]) > 1
+    assert seq_digests[0] == md5(str(tester.records[0].seq).encode("utf-8")).hexdigest()
+
+    id_index, seq_digests = Sb._index_records(tester.records, digests=False)
+    assert seq_digests is None
+
+
+# ######################  'MotifSearch' ###################### #
+def test_motif_search():
+    search = Sb.MotifSearch(["ACGT", "acgn", "[AG]T{3}", "A.G", "ACGT", "T+G"], alpha=IUPAC.ambiguous_dna, ambig=True)
+    assert search.motifs == ["ACGT", "acgn", "[AG]T{3}", "A.G"]
+    assert search.fallback == ["T+G"]
+    assert search.regexes["acgn"] == "acg[ATCG]"
+
+    seqs = ["ACGTACGTTTT", "aacgcgtttgg", "", "NNNN"]
+    matches = search.search(seqs)
+    assert matches[0] == {"ACGT": [(0, 4), (4, 8)], "acgn": [(0, 4), (4, 8)], "[AG]T{3}": [(6, 10)],
+                          "A.G": [(0, 3), (4, 7)]}
+    assert matches[1] == {"acgn": [(1, 5)], "[AG]T{3}": [(5, 9)], "A.G": [(1, 4)], "T+G": [(6, 10)]}
+    assert matches[2] == {} and matches[3] == {}
+    # Same answers as the re module, whatever the batching
+    for pattern, regex in search.regexes.items():
+        for seq, found in zip(seqs, search.search(seqs, batch_size=1)):
+            assert found.get(pattern, []) == [(m.start(), m.end()) for m in re.finditer(regex, seq, flags=re.I)]
+
+    # Wildcards never match across the end of a sequence
+    assert Sb.MotifSearch([".{3}"]).search(["ACGTA", "GG", "TTT"]) == [{".{3}": [(0, 3)]}, {}, {".{3}": [(0, 3)]}]
+    # Matches of one motif never overlap
+    assert Sb.MotifSearch(["AA"]).search(["AAAAA"]) == [{"AA": [(0, 2), (2, 4)]}]
+    # Too many variants to tabulate
+    search = Sb.MotifSearch(["N{8}"], alpha=IUPAC.ambiguous_dna, ambig=True, max_variants=100)
+    assert search.fallback == ["N{8}"]
+    assert search.search(["ACGTACGTAC"]) == [{"N{8}": [(0, 8)]}]
+
+
+# ######################  'RestrictionIndex' ###################### #
+def test_restriction_index():
+    enzymes = RestrictionBatch(["EcoRI", "BsaI", "BglI", "AjuI", "HaeIII", "MboII"])
+    index = Sb.RestrictionIndex.get(enzymes)
+    assert Sb.RestrictionIndex.get(list(enzymes)) is index
+
+    rand_gen = Random(3)
+    seqs = ["GAATTCGGTCTCAGAGACCGCCNNNNNGGCGGCCGAAGA", "", "GGCC" * 5, "GAATTC",
+            "".join([rand_gen.choice("ACGT") for _ in range(3000)]),
+            "".join([rand_gen.choice("ACGTN") for _ in range(500)])]
+    # Cut positions (and enzyme order) are exactly what Bio.Restriction reports
+    for seq, cuts in zip(seqs, index.scan(seqs, batch_size=100)):
+        assert cuts == OrderedDict(sorted(Analysis(enzymes, Seq(seq)).with_sites().items()))
+
+    assert Sb.RestrictionIndex.clean("ga att\nc12") == "GAATTC"
+    with pytest.raises(TypeError) as e:
+        Sb.RestrictionIndex.clean("GAAUUC")
+    assert "Invalid character found in 'GAAUUC'" in str(e.value)
+
+
+# ######################  '_kmer_candidates' ###################### #
+def test_kmer_candidates():
+    seqs = ["ACGTACGT", "CGTACGTT", "GGGGGGGG", "TACGTA"]
+    assert Sb._kmer_candidates(seqs, 4, 2) == [(0, 1), (0, 3), (1, 3)]
+    assert Sb._kmer_candidates(seqs, 4, 4) == [(0, 1)]
+    assert Sb._kmer_candidates(seqs, 9, 1) == []
+
+
+# ######################  '_banded_alignment' ###################### #
+def test_banded_alignment():
+    scoring = dict(Sb.PAIRWISE_SCORING["nucl"])
+    scoring["sub_scores"] = {}
+    assert Sb._banded_alignment("TTTACGTACGTAAA", "GGACGTACGTCC", (-5, 5), scoring) == (16, 8, 8, 8, 8)
+    assert Sb._banded_alignment("ACGTAAACGT", "ACGTACGT", (-3, 3), scoring) == (10, 5, 5, 5, 5)
+    assert Sb._banded_alignment("AAAAAAAAAACCCCCCCCCC", "CCCCCCCCCC", (10, 12), scoring) == (0, 0, 0, 0, 0)
+    assert Sb._banded_alignment("AAAAAAAAAACCCCCCCCCC", "CCCCCCCCCC", (-12, -8), scoring) == (20, 10, 10, 10, 10)
+    # A gap is cheaper than the mismatches it avoids
+    assert Sb._banded_alignment("ACGTACGTTTGCATGCA", "ACGTACGTGCATGCA", (-3, 3), scoring) == (21, 15, 17, 17, 15)
+
+
+# ######################  '_WordIndex' / '_cd_hit_candidates' ###################### #
+def test_word_index():
+    index = Sb._WordIndex(merge_size=2)
+    assert [hits.tolist() for hits in index.hits(np.array([1, 2]))] == [[], [], []]
+    index.add(0, np.array([5, 1, 2, 1]))
+    assert sorted(zip(*[hits.tolist() for hits in index.hits(np.array([1, 7]))])) == [(0, 0, 1), (0, 0, 3)]
+    index.add(3, np.array([2, 2]))  # Merged into the main tier
+    index.add(4, np.array([9, 1]))
+    assert sorted(zip(*[hits.tolist() for hits in index.hits(np.array([2, 1]))])) == \
+        [(0, 0, 2), (0, 3, 0), (0, 3, 1), (1, 0, 1), (1, 0, 3), (1, 4, 1)]
+
+
+def test_cd_hit_candidates():
+    settings = {"threshold": 0.9, "word_size": 2, "band_width": 2}
+    index = Sb._WordIndex()
+    index.add(0, np.arange(20))
+    index.add(1, np.arange(100, 120))
+    assert Sb._cd_hit_candidates(np.arange(20), 21, index, {0: 20, 1: 20}, settings) == [0]
+    assert Sb._cd_hit_candidates(np.array([], dtype=np.int64), 1, index, {0: 20, 1: 20}, settings) == []
+
+    # Low thresholds use the diagonal filter; shared words scattered off the main diagonal don't count
+    settings["threshold"] = 0.5
+    assert Sb._cd_hit_candidates(np.arange(10), 11, index, {0: 20, 1: 20}, settings) == [0]
+    assert Sb._cd_hit_candidates(np.array([0, 50, 4, 51, 52, 10, 53, 15, 54, 55]), 11, index, {0: 20, 1: 20},
+                                 settings) == []
+
+
 # ######################  'make_copy' ###################### #
 def test_make_copy(sb_resources, hf):
     tester = Sb.SeqBuddy(sb_resources.get_one("d f", mode="paths"))
     tester_copy = Sb.make_copy(tester)
     assert hf.buddy2hash(tester) == hf.buddy2hash(tester_copy)
+
+
+# ######################  'shallow_copy' ###################### #
+def test_shallow_copy(sb_resources, hf):
+    tester = Sb.SeqBuddy(sb_resources.get_one("d g", mode="paths"))
+    tester_hash = hf.buddy2hash(tester)
+    tester_copy = Sb.shallow_copy(tester)
+    assert hf.buddy2hash(tester_copy) == tester_hash
+    assert tester_copy.records[0] is not tester.records[0]
+    assert tester_copy.records[0].seq is not tester.records[0].seq
+    assert tester_copy.records[0].features[0] is not tester.records[0].features[0]
+
+    tester_copy.records[0].id = "Foo"
+    tester_copy.records[0].features = []
+    tester_copy.records[1].seq = Seq("ATGC", alphabet=IUPAC.ambiguous_dna)
+    tester_copy.records[2].seq.alphabet = IUPAC.protein
+    tester_copy.hash_map["foo"] = "bar"
+    assert hf.buddy2hash(tester) == tester_hash
+    assert tester.records[2].seq.alphabet == IUPAC.ambiguous_dna
+    assert not tester.hash_map
+
+    assert not Sb.shallow_copy(tester, records=False).records
@@ -25,6 +25,7 @@ Description: Collection of PyTest unit tests for the AlignBuddy.py program
 
 import pytest
 import os
+import shutil
 import argparse
 from copy import deepcopy
 from unittest import mock
@@ -248,6 +249,32 @@ def test_blast_ui(capsys, sb_resources, sb_odd_resources, hf):
            "Ensure the -parse_seqids flag was used with makeblastdb." in str(err)
 
 
+# ######################  '-cdh', '--cd_hit' ###################### #
+def test_cd_hit_ui(capsys, sb_resources, hf):
+    test_in_args = deepcopy(in_args)
+    test_in_args.cd_hit = [[]]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('p f'), True)
+    out, err = capsys.readouterr()
+    assert hf.string2hash(out) == hf.buddy2hash(sb_resources.get_one('p f'))
+    assert err.startswith("### Cluster membership ###\nMle-Panxα12\n\nMle-Panxα9\n\n")
+
+    test_in_args.cd_hit = [["0.5", "3"]]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('p f'), True)
+    out, err = capsys.readouterr()
+    assert "Mle-Panxα10A\nMle-Panxα9, Mle-Panxα10B\n" in err
+    assert out.count(">") == 10
+
+    test_in_args.cd_hit = [["foo"]]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('p f'), True)
+    out, err = capsys.readouterr()
+    assert "cd_hit arguments must be an identity threshold" in err
+
+    test_in_args.cd_hit = [["2"]]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('p f'), True)
+    out, err = capsys.readouterr()
+    assert "The identity threshold must be between 0 and 1." in err
+
+
 # ######################  '-cs', '--clean_seq' ###################### #
 def test_clean_seq_ui(capsys, sb_resources, sb_odd_resources, hf):
     test_in_args = deepcopy(in_args)
@@ -414,6 +441,12 @@ def test_delete_records_ui(capsys, sb_resources, hf):
     assert hf.string2hash(out) == "eca4f181dae3d7998464ff71e277128f"
     assert hf.string2hash(err) == "7e0929af515502484feb4b1b2c35eaba"
 
+    test_in_args.delete_records = ["Mle-Panxα1", "exact", "Mle-Panxα2"]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    assert ">Mle-Panxα1 " not in out and ">Mle-Panxα10A " in out
+    assert "Mle-Panxα1\nMle-Panxα2\n" in err
+
 
 # ######################  '-drp', '--delete_repeats' ###################### #
 def test_delete_repeats_ui(capsys, sb_resources, sb_odd_resources, hf):
@@ -486,11 +519,11 @@ def test_extract_regions_ui(sb_resources, hf, capsys):
 # ######################  '-fcpg', '--find_cpg' ###################### #
 def test_find_cpg_ui(capsys, sb_resources, hf):
     test_in_args = deepcopy(in_args)
-    test_in_args.find_CpG = True
+    test_in_args.find_CpG = [[]]
     Sb.command_line_ui(test_in_args, sb_resources.get_one('d g'), True)
     out, err = capsys.readouterr()
-    assert hf.string2hash(out) == "9499f524da0c35a60502031e94864928"
-    assert hf.string2hash(err) == "1fc07e5884a2a4c1344865f385b1dc79"
+    assert hf.string2hash(out) == "265e1ccfc3f94cf246c2175c81700812"
+    assert hf.string2hash(err) == "599ca23b95aff4bee0afba6f8b4f946c"
 
     Sb.command_line_ui(test_in_args, Sb.SeqBuddy(">seq1\nATGCCTAGCTAGCT", in_format="fasta"), True)
     out, err = capsys.readouterr()
@@ -500,11 +533,26 @@ def test_find_cpg_ui(capsys, sb_resources, hf):
         Sb.command_line_ui(test_in_args, sb_resources.get_one('p g'), pass_through=True)
     assert "DNA sequence required, not protein or RNA" in str(err)
 
+    test_in_args.find_CpG = [["100", "0.7", "0.6"]]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d g'), True)
+    out, err = capsys.readouterr()
+    assert hf.string2hash(out) == "51abc8cfc68fbec9d76fe2d33dc2961a"
+
+    test_in_args.find_CpG = [["foo"]]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d g'), True)
+    out, err = capsys.readouterr()
+    assert "find_CpG arguments must be a window size" in err
+
+    test_in_args.find_CpG = [["0"]]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d g'), True)
+    out, err = capsys.readouterr()
+    assert "The window size must be a positive integer." in err
+
 
 # ######################  '-orf', '--find_orfs' ###################### #
 def test_find_orfs_ui(capsys, sb_resources, hf, monkeypatch):
     test_in_args = deepcopy(in_args)
-    test_in_args.find_orfs = True
+    test_in_args.find_orfs = [[]]
     Sb.command_line_ui(test_in_args, sb_resources.get_one("d g"), True)
     out, err = capsys.readouterr()
     assert hf.string2hash("%s\n%s" % (err, out)) == "1f29f572c06d4f9c69930053a6113a8d"
@@ -515,6 +563,26 @@ def test_find_orfs_ui(capsys, sb_resources, hf, monkeypatch):
     out, err = capsys.readouterr()
     assert hf.string2hash("%s\n%s" % (err, out)) == "786422d2a37b56222f97363d11e750ac"
 
+    test_in_args.find_orfs = [["9", "nest"]]
+    tester = Sb.SeqBuddy(">seq1\nATGATGAAATAGCCATGCCCTGACTACAT\n", in_format="fasta")
+    Sb.command_line_ui(test_in_args, tester, True)
+    out, err = capsys.readouterr()
+    assert "(+) ORFs: 0:12, 3:12, 14:23\n(-) ORFs: None\n" in err
+
+    test_in_args.find_orfs = [["l"]]
+    Sb.command_line_ui(test_in_args, tester, True)
+    out, err = capsys.readouterr()
+    assert "(+) ORFs: 0:12, 14:23\n" in err
+
+    for bad_mode in ["foo", "longst", ""]:
+        test_in_args.find_orfs = [["9", bad_mode]]
+        Sb.command_line_ui(test_in_args, tester, True)
+        out, err = capsys.readouterr()
+        assert "ValueError: find_orfs arguments must be a minimum length (int) and/or a mode" in err
+        assert "not '%s'" % bad_mode in err
+        assert out == ""
+
+    test_in_args.find_orfs = [["9", "nest"]]
     monkeypatch.setattr(Sb, "find_orfs", mock_raisetypeerror)
     Sb.command_line_ui(test_in_args, sb_resources.get_one("d g"), True)
     out, err = capsys.readouterr()
@@ -1103,6 +1171,11 @@ def test_pull_records_ui(capsys, sb_resources, hf):
     out, err = capsys.readouterr()
     assert hf.string2hash(out) == "cd8d7284f039233e090c16e8aa6b5035"
 
+    test_in_args.pull_records = ["exact", "Mle-Panxα1", "Mle-Panxα2"]
+    Sb.command_line_ui(test_in_args, sb_resources.get_one('d f'), True)
+    out, err = capsys.readouterr()
+    assert out.count(">") == 2 and ">Mle-Panxα1 " in out and ">Mle-Panxα2 " in out
+
 
 # ######################  '-prf', '--pull_records_with_feature' ###################### #
 def test_pull_records_with_feature_ui(capsys, sb_resources, hf):
@@ -1334,6 +1407,130 @@ def test_translate_ui(capsys, sb_resources, sb_odd_resources, hf):
     assert "Nucleic acid sequence required, not protein." in str(err)
 
 
+# ######################  '-stm', '--stream' ###################### #
+def test_stream_argparse_init(capsys, monkeypatch, sb_resources):
+    monkeypatch.setattr(sys, "argv", ['SeqBuddy.py', sb_resources.get_one("d g", "paths"), "-uc", "-stm"])
+    temp_in_args, seqbuddy = Sb.argparse_init()
+    assert type(seqbuddy) == Sb.SeqBuddyStream
+    assert seqbuddy.in_format == "gb"
+
+    monkeypatch.setattr(sys, "argv", ['SeqBuddy.py', sb_resources.get_one("d n", "paths"), "-uc", "-stm"])
+    with pytest.raises(SystemExit):
+        Sb.argparse_init()
+    out, err = capsys.readouterr()
+    assert "ValueError: The 'nexus' format can not be streamed" in err
+
+    monkeypatch.setattr(sys, "argv", ['SeqBuddy.py', sb_resources.get_one("d f", "paths"),
+                                      sb_resources.get_one("p f", "paths"), "-uc", "-stm"])
+    with pytest.raises(SystemExit):
+        Sb.argparse_init()
+    out, err = capsys.readouterr()
+    assert "Only one input file can be streamed at a time" in err
+
+
+def test_stream_ui(capsys, sb_resources, hf):
+    test_in_args = deepcopy(in_args)
+    test_in_args.uppercase = True
+    test_in_args.stream = True
+    test_in_args.out_format = "fasta"
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("d g", mode="paths"), out_format="fasta")
+    Sb.command_line_ui(test_in_args, tester, True)
+    out, err = capsys.readouterr()
+    assert hf.string2hash(out) == "25073539df4a982b7f99c72dd280bb8f"
+
+    test_in_args = deepcopy(in_args)
+    test_in_args.pull_records = ["α[2-4]"]
+    test_in_args.stream = True
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("d f", mode="paths"))
+    Sb.command_line_ui(test_in_args, tester, True)
+    out, err = capsys.readouterr()
+    assert out == str(Sb.pull_recs(sb_resources.get_one("d f"), "α[2-4]"))
+
+    test_in_args.test = True
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("d f", mode="paths"))
+    Sb.command_line_ui(test_in_args, tester, True)
+    out, err = capsys.readouterr()
+    assert not out
+    assert "*** Test passed ***" in err
+
+    test_in_args = deepcopy(in_args)
+    test_in_args.translate = True
+    test_in_args.stream = True
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("p f", mode="paths"))
+    Sb.command_line_ui(test_in_args, tester, True)
+    out, err = capsys.readouterr()
+    assert "TypeError: Protein sequence cannot be translated." in err
+
+    test_in_args = deepcopy(in_args)
+    test_in_args.order_ids = [False]
+    test_in_args.stream = True
+    tester = Sb.SeqBuddyStream(sb_resources.get_one("d f", mode="paths"))
+    Sb.command_line_ui(test_in_args, tester, True)
+    out, err = capsys.readouterr()
+    assert "ValueError: The requested tool can not be run with --stream" in err
+
+
+# ######################  '-idx', '--index' ###################### #
+def test_index_argparse_init(capsys, monkeypatch, sb_resources):
+    tmp_dir = br.TempDir()
+    path = os.path.join(tmp_dir.path, "seqs.gb")
+    shutil.copy(sb_resources.get_one("d g", "paths"), path)
+    monkeypatch.setattr(sys, "argv", ['SeqBuddy.py', path, "-pr", "α1", "-idx"])
+    temp_in_args, seqbuddy = Sb.argparse_init()
+    assert type(seqbuddy) == Sb.SeqBuddyIndex
+    assert seqbuddy.in_format == "gb"
+
+    monkeypatch.setattr(sys, "argv", ['SeqBuddy.py', sb_resources.get_one("d n", "paths"), "-pr", "α1", "-idx"])
+    with pytest.raises(SystemExit):
+        Sb.argparse_init()
+    out, err = capsys.readouterr()
+    assert "ValueError: The 'nexus' format can not be indexed" in err
+
+    monkeypatch.setattr(sys, "argv", ['SeqBuddy.py', path, path, "-pr", "α1", "-idx"])
+    with pytest.raises(SystemExit):
+        Sb.argparse_init()
+    out, err = capsys.readouterr()
+    assert "Only one input file can be indexed at a time" in err
+
+
+def test_index_ui(capsys, sb_resources):
+    tmp_dir = br.TempDir()
+    path = os.path.join(tmp_dir.path, "seqs.fa")
+    shutil.copy(sb_resources.get_one("d f", "paths"), path)
+
+    test_in_args = deepcopy(in_args)
+    test_in_args.index = True
+    test_in_args.pull_records = ["α[2-4]"]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddyIndex(path), True)
+    out, err = capsys.readouterr()
+    assert out == str(Sb.pull_recs(sb_resources.get_one("d f"), "α[2-4]"))
+
+    test_in_args.pull_records = ["Mle-Panxα4", "Mle-Panxα8", "exact"]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddyIndex(path), True)
+    out, err = capsys.readouterr()
+    assert out == str(Sb.pull_recs(sb_resources.get_one("d f"), ["Mle-Panxα4", "Mle-Panxα8"], exact=True))
+
+    # Descriptions aren't indexed, so 'full' searches parse the whole file
+    test_in_args.pull_records = ["ML2", "full"]
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddyIndex(path), True)
+    out, err = capsys.readouterr()
+    assert out == str(Sb.pull_recs(sb_resources.get_one("d f"), "ML2", description=True))
+
+    test_in_args = deepcopy(in_args)
+    test_in_args.index = True
+    test_in_args.pull_record_ends = -10
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddyIndex(path), True)
+    out, err = capsys.readouterr()
+    assert out == str(Sb.pull_record_ends(sb_resources.get_one("d f"), -10))
+
+    test_in_args = deepcopy(in_args)
+    test_in_args.index = True
+    test_in_args.uppercase = True
+    Sb.command_line_ui(test_in_args, Sb.SeqBuddyIndex(path), True)
+    out, err = capsys.readouterr()
+    assert "ValueError: The requested tool can not be run with --index" in err
+
+
 # ######################  '-tr6', '--translate6frames' ###################### #
 def test_translate6frames_ui(capsys, sb_resources, sb_odd_resources, hf):
     test_in_args = deepcopy(in_args)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Time the all-by-all BLAST behind bl2seq and purge on random sequence sets of increasing size. Requires BLAST+.
+"""
+import argparse
+import timeit
+from random import Random
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.Alphabet import IUPAC
+import buddysuite.SeqBuddy as Sb
+
+
+def random_seqbuddy(num_seqs, seq_len, seed):
+    rand_gen = Random(seed)
+    records = []
+    for indx in range(num_seqs):
+        # About one in ten sequences is a lightly mutated copy of the one before, so purge has something to remove
+        if records and rand_gen.random() < 0.1:
+            seq = list(str(records[-1].seq))
+            for _ in range(int(seq_len / 20)):
+                seq[rand_gen.randint(0, seq_len - 1)] = rand_gen.choice("ACDEFGHIKLMNPQRSTVWY")
+            seq = "".join(seq)
+        else:
+            seq = "".join([rand_gen.choice("ACDEFGHIKLMNPQRSTVWY") for _ in range(seq_len)])
+        records.append(SeqRecord(Seq(seq, alphabet=IUPAC.protein), id="Seq%s" % indx))
+    return Sb.SeqBuddy(records, out_format="fasta", alpha=IUPAC.protein)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="bl2seqBenchmark", description="Check bl2seq/purge wall time",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument("-s", "--sizes", nargs="+", default=[1000, 10000], type=int,
+                        help="Number of sequences in each test set")
+    parser.add_argument("-l", "--length", action="store", default=300, type=int, help="Length of each sequence")
+    parser.add_argument("-t", "--threshold", action="store", default=200, type=float, help="purge() bit score")
+    parser.add_argument("-r", "--seed", action="store", default=12345, type=int, help="Random seed")
+    in_args = parser.parse_args()
+
+    print("seqs\tbl2seq (s)\tpurge (s)\tkept")
+    for size in in_args.sizes:
+        seqbuddy = random_seqbuddy(size, in_args.length, in_args.seed)
+        bl2seq_time = timeit.timeit(lambda: Sb.bl2seq(seqbuddy), number=1)
+        purge_time = timeit.timeit(lambda: Sb.purge(seqbuddy, in_args.threshold), number=1)
+        print("%s\t%.2f\t%.2f\t%s" % (size, bl2seq_time, purge_time, len(seqbuddy.records)))
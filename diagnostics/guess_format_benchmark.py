@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Time format detection on progressively larger files. Detection only looks at the start of a file, so the time taken
+should stay flat as the files grow.
+"""
+import sys
+import os
+import argparse
+import timeit
+import buddysuite.SeqBuddy as Sb
+import buddysuite.AlignBuddy as Alb
+import buddysuite.buddy_resources as br
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="guessFormatBenchmark", description="Check format detection time",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument("reference", help="Specify input sequences (any format SeqBuddy can read)")
+    parser.add_argument("-s", "--sizes", nargs="+", default=[1, 10, 100, 1000], type=int,
+                        help="Number of copies of the reference to write into each test file")
+    parser.add_argument("-f", "--formats", nargs="+", default=["fasta", "gb", "embl"],
+                        help="Formats to write the test files in")
+    parser.add_argument("-i", "--iterations", action='store', default=10, type=int,
+                        help="Specify number of timeit replicates")
+    in_args = parser.parse_args()
+
+    if not os.path.isfile(in_args.reference):
+        sys.stderr.write("Error: Reference file does not exist\n")
+        sys.exit()
+
+    seqbuddy = Sb.SeqBuddy(in_args.reference)
+    tmp_dir = br.TempDir()
+    print("format\tcopies\tMB\tSeqBuddy (s)\tAlignBuddy (s)")
+    for _format in in_args.formats:
+        seqbuddy.out_format = _format
+        contents = str(seqbuddy)
+        for size in in_args.sizes:
+            path = os.path.join(tmp_dir.path, "%s_%s" % (_format, size))
+            with open(path, "w", encoding="utf-8") as ofile:
+                for _ in range(size):
+                    ofile.write(contents)
+
+            sb_time = timeit.timeit(lambda: Sb._guess_format(path), number=in_args.iterations)
+            alb_time = timeit.timeit(lambda: Alb.guess_format(path), number=in_args.iterations)
+            print("%s\t%s\t%.1f\t%.5f\t%.5f" % (_format, size, os.path.getsize(path) / 1048576,
+                                                 sb_time / in_args.iterations, alb_time / in_args.iterations))
+            os.remove(path)